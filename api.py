@@ -1,54 +1,378 @@
 import uuid
-import json
+import time
 import asyncio
 import base64
-from logger import Colors, get_group_logger
+import itertools
+from collections import deque
+import codec
+from codec import Slot, Template
+from logger import Colors, get_group_logger, get_global_error_logger, get_stats_logger
+from image_delivery import get_image_delivery
+from upload_cache import get_upload_cache
+
+
+class ApiError(Exception):
+    """OneBot 动作执行失败（status 为 failed）"""
+
+    def __init__(self, action, response):
+        self.action = action
+        self.response = response
+        self.retcode = response.get("retcode")
+        super().__init__(f"{action} 失败 - retcode: {self.retcode}, 信息: {response.get('wording') or response.get('message', '')}")
+
+
+class SendDropped(Exception):
+    """发送队列已满，消息被丢弃"""
+
+
+# 发送优先级：指令回复 > 普通消息 > 戳一戳、点赞、入群欢迎
+PRIORITY_REPLY = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = ("reply", "normal", "low")
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个，最多积攒 burst 个"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """距离有可用令牌还需等待的秒数，0 表示现在就有"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class OutboundScheduler:
+    """
+    出站消息调度
+
+    所有发送先进入按优先级划分的队列，由单个任务按 全局令牌桶 + 每群令牌桶 的速率发出：
+    - 高优先级队列先发；同一优先级内按入队顺序，某个群的令牌用完时先发其它群的消息，同一群内保持顺序
+    - 队列总长度超过 max_queue 时按 overflow 策略处理：
+      drop_oldest 丢弃优先级最低的最早一条（不会丢弃比新消息优先级更高的），reject 丢弃新消息
+    - 记录每个优先级的排队延迟，定期写入日志
+    """
+
+    def __init__(self, send_func, global_rate=5, global_burst=10, group_rate=1, group_burst=3,
+                 max_queue=200, overflow="drop_oldest", group_idle_ttl=600, stats_interval=300):
+        self.send_func = send_func
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.group_idle_ttl = group_idle_ttl
+        self.stats_interval = stats_interval
+        self._lanes = [deque() for _ in PRIORITY_NAMES]  # 每项 (group_id, payload, 入队时间, future)
+        self._group_buckets = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_report = time.monotonic()
+        self._stats = {name: {'sent': 0, 'dropped': 0, 'wait_total': 0.0, 'wait_max': 0.0} for name in PRIORITY_NAMES}
+
+    def __len__(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, payload, priority=PRIORITY_NORMAL, group_id=None):
+        """放入发送队列并等待真正发出，返回 True；被丢弃时返回 False"""
+        future = asyncio.get_running_loop().create_future()
+        item = (None if group_id is None else str(group_id), payload, time.monotonic(), future)
+        if len(self) >= self.max_queue and not self._make_room(priority):
+            self._drop(priority, item)
+            return await future
+        self._lanes[priority].append(item)
+        self._wakeup.set()
+        return await future
+
+    def _make_room(self, priority):
+        if self.overflow != "drop_oldest":
+            return False
+        for lane_priority in range(len(self._lanes) - 1, priority - 1, -1):
+            lane = self._lanes[lane_priority]
+            if lane:
+                self._drop(lane_priority, lane.popleft())
+                return True
+        return False
+
+    def _drop(self, priority, item):
+        group_id, _, _, future = item
+        self._stats[PRIORITY_NAMES[priority]]['dropped'] += 1
+        get_stats_logger().warning(f"发送队列已满，丢弃消息 - 优先级: {PRIORITY_NAMES[priority]}, 群号: {group_id}")
+        if not future.done():
+            future.set_result(False)
+
+    def _group_bucket(self, group_id):
+        bucket = self._group_buckets.get(group_id)
+        if bucket is None:
+            bucket = self._group_buckets[group_id] = TokenBucket(self.group_rate, self.group_burst)
+        return bucket
+
+    def _next_item(self, now):
+        """
+        取出下一条可以发送的消息；没有时返回 (None, 需要等待的秒数)
+        """
+        wait = self.global_bucket.wait_time(now)
+        if wait > 0:
+            return None, wait
+        wait = None
+        for priority, lane in enumerate(self._lanes):
+            blocked = set()
+            for index, item in enumerate(lane):
+                group_id = item[0]
+                if group_id is None:
+                    del lane[index]
+                    return (priority, item), 0.0
+                if group_id in blocked:
+                    continue
+                group_wait = self._group_bucket(group_id).wait_time(now)
+                if group_wait == 0:
+                    del lane[index]
+                    self._group_buckets[group_id].take()
+                    return (priority, item), 0.0
+                blocked.add(group_id)
+                wait = group_wait if wait is None else min(wait, group_wait)
+        return None, wait
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._maybe_report(now)
+            selected, wait = self._next_item(now)
+            if selected is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            priority, (group_id, payload, queued_at, future) = selected
+            if future.done():
+                # 调用者已经放弃（例如被取消），不再发送
+                continue
+            self.global_bucket.take()
+            stats = self._stats[PRIORITY_NAMES[priority]]
+            waited = now - queued_at
+            stats['sent'] += 1
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+            try:
+                await self.send_func(payload)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(True)
+
+    def _maybe_report(self, now):
+        if not self.stats_interval or now - self._last_report < self.stats_interval:
+            return
+        self._last_report = now
+        # 顺便清理长时间没有消息的群的令牌桶
+        for group_id in [g for g, bucket in self._group_buckets.items() if now - bucket.updated > self.group_idle_ttl]:
+            del self._group_buckets[group_id]
+        if any(stats['sent'] or stats['dropped'] for stats in self._stats.values()):
+            get_stats_logger().info(f"发送队列统计 - {self.format_stats()}")
+
+    def stats(self):
+        """每个优先级的发送数、丢弃数、平均/最大排队延迟（毫秒）以及当前队列长度"""
+        result = {}
+        for priority, name in enumerate(PRIORITY_NAMES):
+            stats = self._stats[name]
+            result[name] = {
+                'sent': stats['sent'],
+                'dropped': stats['dropped'],
+                'wait_avg_ms': round(stats['wait_total'] / stats['sent'] * 1000, 1) if stats['sent'] else 0.0,
+                'wait_max_ms': round(stats['wait_max'] * 1000, 1),
+                'queued': len(self._lanes[priority])
+            }
+        return result
+
+    def format_stats(self):
+        return ", ".join(
+            f"{name}: 发送 {s['sent']} 丢弃 {s['dropped']} 平均等待 {s['wait_avg_ms']}ms 最大等待 {s['wait_max_ms']}ms 排队 {s['queued']}"
+            for name, s in self.stats().items()
+        )
+
+    async def close(self):
+        """停止调度，队列中未发出的消息视为丢弃"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for lane in self._lanes:
+            while lane:
+                future = lane.popleft()[3]
+                if not future.done():
+                    future.set_result(False)
+
+
+# 常用动作的出站模板，发送时只序列化变化的值
+REPLY_TEMPLATES = {
+    1: Template({"action": "send_group_msg", "params": {"group_id": Slot("send_id"), "message": [
+        {"type": "reply", "data": {"id": Slot("message_id")}}, {"type": "text", "data": {"text": Slot("text")}}]},
+        "echo": Slot("echo")}),
+    2: Template({"action": "send_private_msg", "params": {"user_id": Slot("send_id"), "message": [
+        {"type": "reply", "data": {"id": Slot("message_id")}}, {"type": "text", "data": {"text": Slot("text")}}]},
+        "echo": Slot("echo")})
+}
+AT_TEMPLATE = Template({"action": "send_group_msg", "params": {"group_id": Slot("group_id"), "message": [
+    {"type": "at", "data": {"qq": Slot("user_id")}}, {"type": "text", "data": {"text": Slot("text")}}]},
+    "echo": Slot("echo")})
+GROUP_POKE_TEMPLATE = Template({"action": "group_poke", "params": {"group_id": Slot("group_id"), "user_id": Slot("user_id")},
+                                "echo": Slot("echo")})
+FRIEND_POKE_TEMPLATE = Template({"action": "friend_poke", "params": {"user_id": Slot("user_id")}, "echo": Slot("echo")})
+LIKE_TEMPLATE = Template({"action": "send_like", "params": {"user_id": Slot("user_id"), "times": Slot("times")},
+                          "echo": Slot("echo")})
 
 
 class WebSocketClient:
-    def __init__(self, websocket):
+    def __init__(self, websocket, timeout=30, outbound=None):
+        """outbound 为 config.json 中的 outbound 配置，控制发送速率和队列"""
         self.websocket = websocket
+        self.timeout = timeout
+        # 等待响应的请求 {echo: (action, asyncio.Future)}
+        self._pending = {}
+        self._background_tasks = set()
+        # echo 只需在本连接内唯一：随机前缀 + 递增序号，比每次生成 uuid 便宜
+        self._echo_prefix = uuid.uuid4().hex[:8]
+        self._echo_counter = itertools.count(1)
+        outbound = outbound or {}
+        self.scheduler = None
+        if outbound.get("enabled", True):
+            self.scheduler = OutboundScheduler(
+                self.websocket.send,
+                global_rate=outbound.get("global_rate", 5),
+                global_burst=outbound.get("global_burst", 10),
+                group_rate=outbound.get("group_rate", 1),
+                group_burst=outbound.get("group_burst", 3),
+                max_queue=outbound.get("max_queue", 200),
+                overflow=outbound.get("overflow", "drop_oldest"),
+                stats_interval=outbound.get("stats_interval", 300)
+            )
+            self.scheduler.start()
+
+    async def _send(self, data, priority=PRIORITY_NORMAL, group_id=None):
+        """经过发送调度发出，data 为字典或已编码的 JSON 字符串，返回是否发出（队列满被丢弃时返回 False）"""
+        payload = data if isinstance(data, str) else codec.dumps(data)
+        if self.scheduler is None:
+            await self.websocket.send(payload)
+            return True
+        return await self.scheduler.submit(payload, priority, group_id)
+
+    async def close(self):
+        """连接断开时调用：停止发送调度，让等待响应的请求失败"""
+        if self.scheduler is not None:
+            await self.scheduler.close()
+            get_stats_logger().info(f"发送队列统计 - {self.scheduler.format_stats()}")
+        self.fail_pending()
         
     @property
     def echo(self):
-        return str(uuid.uuid4())
+        return f"{self._echo_prefix}-{next(self._echo_counter)}"
+
+    async def call(self, action, params=None, timeout=None, priority=PRIORITY_NORMAL, group_id=None):
+        """
+        发送动作并等待 OneBot 响应，返回完整的响应字典
+
+        执行失败时抛出 ApiError，超时抛出 asyncio.TimeoutError，连接断开时抛出 ConnectionError，
+        发送队列已满被丢弃时抛出 SendDropped；超时时间从真正发出时开始计算。
+        响应由接收循环分发，不能在接收循环中直接 await（会一直等到超时），需要在单独的任务中调用。
+        """
+        echo = self.echo
+        future = asyncio.get_running_loop().create_future()
+        self._pending[echo] = (action, future)
+        try:
+            if not await self._send({"action": action, "params": params or {}, "echo": echo}, priority, group_id):
+                raise SendDropped(action)
+            response = await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            self._pending.pop(echo, None)
+        if response.get("status") == "failed":
+            raise ApiError(action, response)
+        return response
+
+    def handle_response(self, data):
+        """
+        处理动作响应，返回 True 表示 data 是响应（不是事件），接收循环不再继续处理
+
+        没有调用者等待的响应（即发即忘的动作）执行失败时记录到错误日志。
+        """
+        if "post_type" in data or "echo" not in data:
+            return False
+        pending = self._pending.pop(data["echo"], None)
+        if pending is not None:
+            future = pending[1]
+            if not future.done():
+                future.set_result(data)
+        elif data.get("status") == "failed":
+            message = f"动作执行失败 - retcode: {data.get('retcode')}, 信息: {data.get('wording') or data.get('message', '')}"
+            print(f"{Colors.ERROR}{message}{Colors.RESET}")
+            get_global_error_logger().error(message)
+        return True
+
+    def fail_pending(self, exc=None):
+        """连接断开时让所有等待中的请求立即失败"""
+        pending, self._pending = self._pending, {}
+        for action, future in pending.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionError(f"WebSocket 连接已断开，{action} 未收到响应"))
     
 
     #点赞
     async def send_like(self,user_id ,times):
-        data = {"action": "send_like", "params": {"user_id": user_id, "times": times}, "echo": self.echo}
-        await self.websocket.send(json.dumps(data))
+        data = LIKE_TEMPLATE.render(user_id=user_id, times=times, echo=self.echo)
+        return await self._send(data, PRIORITY_LOW)
 
     #处理好友请求
     async def set_friend_add_request(self,flag,approve,remark):
         data = {"action": "set_friend_add_request", "params": {"flag": flag, "approve": approve, "remark": remark}, "echo": self.echo}
-        await self.websocket.send(json.dumps(data))
+        return await self._send(data)
 
     #处理入群请求
     async def set_group_add_request(self,flag,approve,reason):
         data = {"action": "set_group_add_request", "params": {"flag": flag, "approve": approve, "reason": reason}, "echo": self.echo}
-        await self.websocket.send(json.dumps(data))
+        return await self._send(data)
 
     #戳一戳
     async def poke(self, type, group_id ,user_id):
         if type == 1:
-            data = {"action": "group_poke", "params": {"group_id": group_id, "user_id": user_id}, "echo": self.echo}
+            data = GROUP_POKE_TEMPLATE.render(group_id=group_id, user_id=user_id, echo=self.echo)
         else:
-            data = {"action": "friend_poke", "params": {"user_id": user_id}, "echo": self.echo}
-        await self.websocket.send(json.dumps(data))
+            data = FRIEND_POKE_TEMPLATE.render(user_id=user_id, echo=self.echo)
+        return await self._send(data, PRIORITY_LOW, group_id if type == 1 else None)
 
     #发送消息
-    async def send_message(self, type, send_id, message_id, message):
-        if type == 1:
-            data = {"action": "send_group_msg", "params": {"group_id": send_id, "message": [{"type": "reply", "data": {"id": message_id}}, {"type": "text", "data": {"text": f"{message}"}}]}, "echo": self.echo}
-        else:
-            data = {"action": "send_private_msg", "params": {"user_id": send_id, "message": [{"type": "reply", "data": {"id": message_id}}, {"type": "text", "data": {"text": f"{message}"}}]}, "echo": self.echo}
-        await self.websocket.send(json.dumps(data))
+    async def send_message(self, type, send_id, message_id, message, priority=PRIORITY_REPLY):
+        data = REPLY_TEMPLATES[1 if type == 1 else 2].render(send_id=send_id, message_id=message_id, text=f"{message}",
+                                                            echo=self.echo)
+        return await self._send(data, priority, send_id if type == 1 else None)
 
     #发送at消息
-    async def send_at_message(self,user_id, group_id, message):
-        data = {"action": "send_group_msg", "params": {"group_id": group_id, "message": [{"type": "at", "data": {"qq": user_id}}, {"type": "text", "data": {"text": f"{message}"}}]}, "echo": self.echo}
-        await self.websocket.send(json.dumps(data))
+    async def send_at_message(self,user_id, group_id, message, priority=PRIORITY_REPLY):
+        data = AT_TEMPLATE.render(group_id=group_id, user_id=user_id, text=f"{message}", echo=self.echo)
+        return await self._send(data, priority, group_id)
 
     #发送合并转发消息
     async def send_group_forward_msg(self, group_id, messages, default_uin=2582770985, default_name="乌萨奇大王"):
@@ -91,30 +415,91 @@ class WebSocketClient:
             })
         
         data = {"action": "send_group_forward_msg", "params": {"group_id": group_id, "messages": nodes}, "echo": self.echo}
-        await self.websocket.send(json.dumps(data))
+        return await self._send(data, PRIORITY_REPLY, group_id)
         
     #发送图片消息
     async def send_image_message(self, type, send_id, message_id,message, image_path):
-        # 读取图片文件并转换为base64
-        try:
-            loop = asyncio.get_event_loop()
-            
-            def read_and_encode():
-                with open(image_path, 'rb') as image_file:
-                    image_data = image_file.read()
-                    return base64.b64encode(image_data).decode('utf-8')
-            
-            image_base64 = await loop.run_in_executor(None, read_and_encode)
-        except Exception as e:
-            print(f"{Colors.ERROR}读取图片文件失败: {e}{Colors.RESET}")
+        """
+        发送图片消息
+
+        - 同样内容的图片发送过时，直接引用上次上传后的图片地址（upload_cache），地址失效时重新上传
+        - 按 image_delivery 配置发送文件路径或下载地址，llbot 明确返回失败时改用 base64 重发
+        """
+        if not isinstance(image_path, str):
+            # 截图失败时 wiki.SearchResult 返回错误码而不是路径
+            print(f"{Colors.ERROR}没有可发送的图片: {image_path}{Colors.RESET}")
             if type == 1:  # 群消息
-                logger = get_group_logger(send_id)
-                logger.error(f"读取图片文件失败 - 图片路径: {image_path}, 错误: {e}")
-            return
-        
-        if type == 1:
-            data = {"action": "send_group_msg", "params": {"group_id": send_id, "message": [{"type": "reply", "data": {"id": message_id}}, {"type": "text", "data": {"text": message}}, {"type": "image", "data": {"file": f"base64://{image_base64}"}}]}, "echo": self.echo}
-        else:
-            data = {"action": "send_private_msg", "params": {"user_id": send_id, "message": [{"type": "reply", "data": {"id": message_id}}, {"type": "text", "data": {"text": message}}, {"type": "image", "data": {"file": f"base64://{image_base64}"}}]}, "echo": self.echo}
-        await self.websocket.send(json.dumps(data))
+                get_group_logger(send_id).error(f"没有可发送的图片 - 图片路径: {image_path}")
+            return False
+        cache = get_upload_cache()
+        digest = await cache.digest(image_path) if cache is not None else None
+        if digest is not None:
+            remote = cache.get(digest)
+            if remote is not None:
+                result = await self._call_image(type, send_id, message_id, message, remote, "上传缓存", image_path)
+                if result is not None:
+                    cache.reused += 1
+                    return result[0]
+                cache.invalidate(digest)
 
+        delivery = get_image_delivery()
+        reference = delivery.reference(image_path) if delivery is not None else None
+        result = None
+        if reference is not None:
+            result = await self._call_image(type, send_id, message_id, message, reference, delivery.mode, image_path)
+
+        if result is None:
+            # 读取图片文件并转换为base64
+            try:
+                loop = asyncio.get_event_loop()
+                
+                def read_and_encode():
+                    with open(image_path, 'rb') as image_file:
+                        image_data = image_file.read()
+                        return base64.b64encode(image_data).decode('utf-8')
+                
+                image_base64 = await loop.run_in_executor(None, read_and_encode)
+            except Exception as e:
+                print(f"{Colors.ERROR}读取图片文件失败: {e}{Colors.RESET}")
+                if type == 1:  # 群消息
+                    logger = get_group_logger(send_id)
+                    logger.error(f"读取图片文件失败 - 图片路径: {image_path}, 错误: {e}")
+                return
+            result = await self._call_image(type, send_id, message_id, message, f"base64://{image_base64}", "base64", image_path)
+            if result is None:
+                return False
+
+        sent, response = result
+        if digest is not None and response is not None:
+            cache.uploaded += 1
+            # 在后台查询上传后的图片地址，不耽误本次发送
+            task = asyncio.create_task(cache.remember(self, digest, response))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        return sent
+
+    async def _call_image(self, type, send_id, message_id, message, file, mode, image_path):
+        """
+        发送一条图片消息并等待响应，返回 (是否发出, 响应)；llbot 返回失败时返回 None，由调用方换一种方式重发
+        """
+        action, params = self._image_message(type, send_id, message_id, message, file)
+        try:
+            response = await self.call(action, params, group_id=send_id if type == 1 else None, priority=PRIORITY_REPLY)
+            return True, response
+        except ApiError as e:
+            print(f"{Colors.ERROR}图片发送失败（{mode}）: {e}{Colors.RESET}")
+            get_global_error_logger().error(f"图片发送失败 - 方式: {mode}, 图片路径: {image_path}, 错误: {e}")
+            return None
+        except SendDropped:
+            return False, None
+        except asyncio.TimeoutError:
+            # 超时不代表没有发出，不再重发，避免重复消息
+            get_stats_logger().warning(f"图片发送未收到响应 - 方式: {mode}, 图片路径: {image_path}")
+            return True, None
+
+    @staticmethod
+    def _image_message(type, send_id, message_id, message, file):
+        content = [{"type": "reply", "data": {"id": message_id}}, {"type": "text", "data": {"text": message}}, {"type": "image", "data": {"file": file}}]
+        if type == 1:
+            return "send_group_msg", {"group_id": send_id, "message": content}
+        return "send_private_msg", {"user_id": send_id, "message": content}
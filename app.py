@@ -3,9 +3,25 @@ import json
 import websockets
 import os
 import sys
-from logger import Colors, get_global_error_logger, get_group_logger
+from logger import Colors, get_global_error_logger, get_group_logger, get_stats_logger, init_logging, close_logging
 from api import WebSocketClient
+from dispatcher import create_dispatcher
+from router import MessageContext
+from events import Event
+import codec
 import handlers
+import browser
+import screenshot_cache
+import http_client
+import wiki
+import infobox_store
+import parse_pool
+import infobox_render
+import image_optimize
+import image_delivery
+import upload_cache
+import timers
+import history
 
 VERSION = "1.0.0"
 
@@ -22,83 +38,76 @@ def load_config():
 
 config = load_config()
 
-async def receive_messages(ws, api, config):
+def route_group_message(event, bot_user_id):
+    """
+    群消息的快速路径：在接收循环中同步记录消息、匹配指令并执行指令的 guard，
+    返回需要执行的指令；普通闲聊（没有指令匹配、随机戳一戳没有掷中）返回 None，不进入事件分发
+    """
+    # 消息只解析一次，指令匹配和各个处理函数共用
+    data = event.data
+    ctx = MessageContext(data, bot_user_id)
+    group_id = event.group_id
+    user_id = event.user_id
+    message = ctx.full_text
+    group_name = data.get("group_name", "")
+    sender_nickname = data.get("sender", {}).get("nickname", "")
+    print(f"{Colors.INFO}(群号: {group_id} | 群名: {group_name}) (发送者ID: {user_id} | 发送者: {sender_nickname}) 内容: {message}{Colors.RESET}")
+    # 记录消息日志
+    logger = get_group_logger(group_id)
+    logger.info(f"群名: {group_name} | 发送者ID: {user_id} | 发送者: {sender_nickname} | 内容: {message}")
+    route = handlers.router.select(ctx)
+    # 记录消息历史：指令名称去掉 _command 后缀，参数为指令前缀之后的内容、正则匹配的内容或整条消息；
+    # 随机戳一戳等不是指令的处理只记录消息
+    command = query = ""
+    if route is not None and route.is_command(ctx):
+        command = route.name[:-len("_command")] if route.name.endswith("_command") else route.name
+        query = ctx.args if ctx.command else (ctx.match.group(0) if ctx.match else ctx.text).strip()
+    history.record_message(group_id, user_id, message, command, query, group_name, sender_nickname,
+                           ctx.message_id, data.get("time"))
+    return ctx, route
+
+async def receive_messages(ws, api, config, dispatcher):
+    """只负责解码和分发，事件在 dispatcher 的工作协程中处理"""
     bot_user_id = config.get("bot_user_id", "")
     while True:
-        data = json.loads(await ws.recv())
-        post_type = data.get("post_type")
-        notice_type = data.get("notice_type")
-        sub_type = data.get("sub_type")
-        request_type = data.get("request_type")
-
-        if data.get("message_type") == "group":
-            message_id = data.get("message_id")
-            message_list = data.get("message", [])
-            message = None
-            for msg in message_list:
-                if msg.get("type") == "text":
-                    message = msg.get("data", {}).get("text", "")
-                    break
-            user_id = data.get("user_id")
-            group_id = data["group_id"]
-            group_name = data.get("group_name", "")
-            sender_nickname = data.get("sender", {}).get("nickname", "")
-            at_qq = next((msg.get("data", {}).get("qq") for msg in message_list if msg.get("type") == "at"), None)
-            print(f"{Colors.INFO}(群号: {group_id} | 群名: {group_name}) (发送者ID: {user_id} | 发送者: {sender_nickname}) 内容: {message}{Colors.RESET}")
-            # 记录消息日志
-            logger = get_group_logger(group_id)
-            logger.info(f"群名: {group_name} | 发送者ID: {user_id} | 发送者: {sender_nickname} | 内容: {message}")
+        data = codec.loads(await ws.recv())
+        # 动作响应交给 api.call 的等待者，不作为事件处理
+        if api.handle_response(data):
+            continue
+        event = Event(data)
+        if event.message_type == "group":
+            ctx, route = route_group_message(event, bot_user_id)
+            if route is not None:
+                await dispatcher.submit(event.key, route.handler, ctx)
+            continue
+        await dispatcher.submit(event.key, handle_event, api, config, event)
 
+async def handle_event(api, config, event):
+    """群消息以外的事件（戳一戳、入群、好友和入群请求）"""
+    bot_user_id = config.get("bot_user_id", "")
+    post_type = event.post_type
+    sub_type = event.sub_type
+    request_type = event.request_type
+    user_id = event.user_id
 
-            if at_qq is not None and str(at_qq) == str(bot_user_id):
-                at_message = data.get("message", [])
-                asyncio.create_task(handlers.ai_chat_handler(at_message, group_id, message_id, user_id))
-            elif message:
-                msg = message.strip().lower().lstrip('.')
-                if msg.startswith("wiki") or msg.startswith("查询") or msg.startswith("搜索"):
-                    tag_key = (group_id, user_id)
-                    if tag_key in handlers.wiki_waiting_tags:
-                        await api.send_message(1, group_id, message_id, "乌~啦～上一个查询未完成！")
-                    else:
-                        asyncio.create_task(handlers.handle_wiki(message, group_id, message_id, user_id))
-                elif message.strip().isdigit():
-                    asyncio.create_task(handlers.choose_wiki(message, group_id, message_id, user_id))
-                elif message == "赞我":
-                    await api.send_message(1, group_id, message_id, "乌~啦～！收已经给你点赞啦！")
-                    await api.send_like(user_id, 20)
-                else:
-                    # 检查消息中是否包含 https://smapi.io/log 链接
-                    asyncio.create_task(handlers.handle_smapi(message_list, group_id, message_id, user_id))
-                    asyncio.create_task(handlers.poke_handler(1, group_id, bot_user_id, user_id, None))
-            else:
-                asyncio.create_task(handlers.poke_handler(1, group_id, bot_user_id, user_id, None))
-        elif sub_type == "poke":
-            user_id = data.get("user_id")
-            target_id = str(data.get("target_id"))
-            group_id = str(data.get("group_id"))
-            asyncio.create_task(handlers.poke_handler(0, group_id, bot_user_id, user_id, target_id))
-        # 处理入群事件
-        elif post_type == "notice" and notice_type == "group_increase":
-            group_id = data.get("group_id")
-            user_id = data.get("user_id")
-            if str(user_id) == str(bot_user_id):
-                return
-            else:
-                asyncio.create_task(handlers.group_increase_handler(group_id, user_id))
-        # 处理好友请求
-        elif post_type == "request" and request_type == "friend":
-            flag = data.get("flag")
-            user_id = data.get("user_id")
-            await api.set_friend_add_request(flag, True, None)
-            await asyncio.sleep(2)
-            await api.send_message(2, user_id, None, "乌~啦～！你好！")
-        # 处理被邀请入群请求
-        elif post_type == "request" and request_type == "group" and sub_type == "invite":
-            flag = data.get("flag")
-            user_id = data.get("user_id")
-            await api.set_group_add_request(flag, True, None)
-            await asyncio.sleep(2)
-            await api.send_message(2, user_id, None, "乌~啦～！ 已经同意啦！")
+    if sub_type == "poke":
+        await handlers.poke_handler(0, str(event.group_id), bot_user_id, user_id, str(event.target_id))
+    # 处理入群事件
+    elif post_type == "notice" and event.notice_type == "group_increase":
+        if str(user_id) == str(bot_user_id):
+            return
+        else:
+            await handlers.group_increase_handler(event.group_id, user_id)
+    # 处理好友请求
+    elif post_type == "request" and request_type == "friend":
+        await api.set_friend_add_request(event.flag, True, None)
+        await asyncio.sleep(2)
+        await api.send_message(2, user_id, None, "乌~啦～！你好！")
+    # 处理被邀请入群请求
+    elif post_type == "request" and request_type == "group" and sub_type == "invite":
+        await api.set_group_add_request(event.flag, True, None)
+        await asyncio.sleep(2)
+        await api.send_message(2, user_id, None, "乌~啦～！ 已经同意啦！")
 
 async def main():
     print(f"{Colors.INFO}v{VERSION}{Colors.RESET}")
@@ -106,24 +115,58 @@ async def main():
         uri = f"ws://{config['ip']}?access_token={config['access_token']}"
     else:
         uri = f"ws://{config['ip']}"
-    while True:
-        try:
-            async with websockets.connect(uri) as websocket:
-                print(f"{Colors.INFO}WebSocket连接成功{Colors.RESET}")
-                api = WebSocketClient(websocket)
-                # 初始化 handlers
-                handlers.init_handlers(api, config)
-                receive_task = asyncio.create_task(receive_messages(websocket, api, config))
-                await receive_task
-        except websockets.exceptions.ConnectionClosed:
-            print(f"{Colors.INFO}WebSocket连接已关闭，5秒后重连...{Colors.RESET}")
-            await asyncio.sleep(5)
-        except Exception as e:
-            print(f"{Colors.ERROR}WebSocket连接错误: {e}{Colors.RESET}")
-            logger = get_global_error_logger()
-            logger.error(f"WebSocket连接错误 - 错误: {e}")
-            print(f"{Colors.INFO}5秒后尝试重连...{Colors.RESET}")
-            await asyncio.sleep(5)
-
-asyncio.run(main())
+    # 创建共享 HTTP 会话，加载截图缓存，预热浏览器池，供 Wiki 查询复用
+    init_logging(config)
+    codec.init_codec(config)
+    http_client.init_http(config)
+    wiki.init_wiki(config)
+    infobox_store.init_infobox_store(config)
+    history.init_history(config)
+    parse_pool.init_parse_pool(config)
+    screenshot_cache.init_screenshot_cache(config)
+    infobox_render.init_renderer(config)
+    image_optimize.init_image_optimizer(config)
+    await image_delivery.init_image_delivery(config)
+    upload_cache.init_upload_cache(config)
+    await browser.init_browser(config)
+    try:
+        while True:
+            try:
+                async with websockets.connect(uri) as websocket:
+                    print(f"{Colors.INFO}WebSocket连接成功{Colors.RESET}")
+                    api = WebSocketClient(websocket, timeout=config.get("api", {}).get("timeout", 30), outbound=config.get("outbound"))
+                    # 初始化 handlers
+                    handlers.init_handlers(api, config)
+                    dispatcher = create_dispatcher(config)
+                    dispatcher.start()
+                    receive_task = asyncio.create_task(receive_messages(websocket, api, config, dispatcher))
+                    try:
+                        await receive_task
+                    finally:
+                        await dispatcher.close()
+                        get_stats_logger().info(f"事件分发统计 - {dispatcher.format_stats()}")
+                        get_stats_logger().info(f"指令路由统计 - {handlers.router.format_stats()}")
+                        await api.close()
+            except websockets.exceptions.ConnectionClosed:
+                print(f"{Colors.INFO}WebSocket连接已关闭，5秒后重连...{Colors.RESET}")
+                await asyncio.sleep(5)
+            except Exception as e:
+                print(f"{Colors.ERROR}WebSocket连接错误: {e}{Colors.RESET}")
+                logger = get_global_error_logger()
+                logger.error(f"WebSocket连接错误 - 错误: {e}")
+                print(f"{Colors.INFO}5秒后尝试重连...{Colors.RESET}")
+                await asyncio.sleep(5)
+    finally:
+        await timers.close_timers()
+        await browser.close_browser()
+        await image_delivery.close_image_delivery()
+        await screenshot_cache.close_screenshot_cache()
+        infobox_store.close_infobox_store()
+        history.close_history()
+        parse_pool.close_parse_pool()
+        await http_client.close_http()
+        close_logging()
 
+# 解析进程池在 Windows/macOS 上以 spawn 方式启动子进程，子进程会重新导入本文件，不能在导入时启动机器人
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""
+入站解码 + 分发、出站编码的基准测试
+
+用法（在项目根目录运行）：
+    python benchmarks/bench_codec.py [--events 20000]
+
+- 解码 + 分发：原来的 json.loads + data.get 判断链，与 codec.loads + Event + MessageContext + handlers.py 路由表的 select 对比
+  （导入 handlers 需要项目根目录下的 config.json）
+- 编码：原来每次重建字典、uuid echo 再 json.dumps，与 codec.Template 预编码模板对比
+标准库 json 和 orjson（已安装时）分别测试，结果为每个事件的平均耗时（微秒）。
+各组轮流运行 --repeat 轮、每组取最快一轮，统计进程 CPU 时间并暂停垃圾回收，机器负载波动对各组的影响相同。
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec
+from api import REPLY_TEMPLATES
+from bench_router import BOT_USER_ID, CHATTER, COMMANDS, build_router, legacy_route, make_event
+from events import Event
+from router import MessageContext
+
+
+def legacy_decode(frame):
+    data = json.loads(frame)
+    if "post_type" in data or "echo" not in data:
+        group_id = data.get("group_id")
+        key = str(group_id) if group_id is not None else f"user:{data.get('user_id')}"
+        if data.get("message_type") == "group":
+            return key, legacy_route(data)
+        return key, None
+    return None
+
+
+def codec_decode(frame, router):
+    data = codec.loads(frame)
+    if "post_type" in data or "echo" not in data:
+        event = Event(data)
+        if event.message_type == "group":
+            return event.key, router.select(MessageContext(data, BOT_USER_ID))
+        return event.key, None
+    return None
+
+
+def legacy_encode(group_id, message_id, text):
+    data = {"action": "send_group_msg", "params": {"group_id": group_id, "message": [
+        {"type": "reply", "data": {"id": message_id}}, {"type": "text", "data": {"text": f"{text}"}}]},
+        "echo": str(uuid.uuid4())}
+    return json.dumps(data)
+
+
+def dict_encode(group_id, message_id, text, echo):
+    data = {"action": "send_group_msg", "params": {"group_id": group_id, "message": [
+        {"type": "reply", "data": {"id": message_id}}, {"type": "text", "data": {"text": f"{text}"}}]},
+        "echo": echo}
+    return codec.dumps(data)
+
+
+def template_encode(group_id, message_id, text, echo):
+    return REPLY_TEMPLATES[1].render(send_id=group_id, message_id=message_id, text=f"{text}", echo=echo)
+
+
+def timed(cases, repeat):
+    """cases 为 [(func, items, JSON 后端)]，轮流运行 repeat 轮，返回每组最快一轮的平均耗时（微秒）"""
+    best = [float("inf")] * len(cases)
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for index, (func, items, backend) in enumerate(cases):
+                codec.set_backend(backend)
+                started = time.process_time()
+                for item in items:
+                    func(*item)
+                best[index] = min(best[index], time.process_time() - started)
+    finally:
+        gc.enable()
+    return [elapsed / len(items) * 1e6 for elapsed, (_, items, _) in zip(best, cases)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入站解码和出站编码基准测试")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    frames = []
+    for index in range(args.events):
+        text = rng.choice(COMMANDS) if rng.random() < 0.05 else rng.choice(CHATTER)
+        event = make_event(text)
+        event.update({"message_id": 100000 + index, "time": 1700000000 + index, "self_id": int(BOT_USER_ID),
+                      "raw_message": text, "group_name": "星露谷物语交流群",
+                      "sender": {"user_id": 2, "nickname": "鹈鹕镇居民", "card": "", "role": "member"}})
+        frames.append(json.dumps(event, ensure_ascii=False))
+    replies = [(123456789, 100000 + index, rng.choice(CHATTER)) for index in range(args.events)]
+    echoes = [f"bench-{index}" for index in range(args.events)]
+
+    router = build_router()
+    router.stats_interval = 0
+    backends = ["json"] + (["orjson"] if codec.orjson is not None else [])
+
+    print(f"事件数: {args.events}（微秒/事件）")
+    decoded = timed([(legacy_decode, [(f,) for f in frames], "json")] +
+                    [(codec_decode, [(f, router) for f in frames], name) for name in backends], args.repeat)
+    print(f"解码 + 分发  原来 json + data.get: {decoded[0]:6.2f}")
+    for name, elapsed in zip(backends, decoded[1:]):
+        print(f"解码 + 分发  {name:<6} + Event + Router: {elapsed:6.2f}")
+
+    items = [reply + (echo,) for reply, echo in zip(replies, echoes)]
+    cases = [(legacy_encode, replies, "json")]
+    for name in backends:
+        cases += [(dict_encode, items, name), (template_encode, items, name)]
+    encoded = timed(cases, args.repeat)
+    print(f"编码  原来 字典 + uuid + json.dumps: {encoded[0]:6.2f}")
+    for index, name in enumerate(backends):
+        print(f"编码  {name:<6} 字典:                 {encoded[1 + index * 2]:6.2f}")
+        print(f"编码  {name:<6} 模板:                 {encoded[2 + index * 2]:6.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+消息历史查询基准测试：扫描文本消息日志与 history.HistoryStore 索引查询对比
+
+用法（在项目根目录运行）：
+    python benchmarks/bench_history.py [--messages 500000] [--groups 50] [--days 30]
+
+在临时目录生成 days 天内 groups 个群的消息（约 10% 为 Wiki 查询，查询内容集中在少数热门条目），
+分别写成原来的 logs/group_<群号>/messages_<日期>.log 文本日志和 HistoryStore，
+然后统计“最近 7 天各群各 Wiki 条目的查询次数”（按次数排序）：
+- 扫描日志：读取最近 7 天的日志文件，逐行解析出 wiki 指令并计数
+- 索引查询：HistoryStore.top_queries
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import HistoryStore
+
+TITLES = ["鲑鱼莓", "传说之鱼", "阿比盖尔", "五彩碎片", "古代水果", "铱金矿石", "温室", "社区中心", "鸡舍", "蓝莓",
+          "草莓", "南瓜", "星之果实", "谢恩", "海莉", "潘妮", "塞巴斯蒂安", "矮人", "骷髅洞穴", "姜岛"]
+CHATTER = ["今天钓到了传说之鱼！", "有人一起联机吗", "哈哈哈哈", "这个版本更新了什么", "收到", "晚安"]
+
+LOG_LINE = re.compile(r"^(\S+ \S+) - INFO - 群名: .*? \| 发送者ID: \d+ \| 发送者: .*? \| 内容: (.*)$")
+WIKI_PREFIX = re.compile(r"^\s*\.?(?:wiki|查询|搜索)", re.IGNORECASE)
+
+
+def make_messages(count, groups, days, seed=0):
+    """(时间, 群号, 用户, 内容, 指令, 参数)，按时间排序"""
+    rng = random.Random(seed)
+    end = time.time()
+    start = end - days * 86400
+    messages = []
+    for index in range(count):
+        created = int(start + (end - start) * index / count)
+        group_id = 100000 + rng.randrange(groups)
+        user_id = 1000000 + rng.randrange(groups * 200)
+        if rng.random() < 0.1:
+            title = TITLES[min(int(rng.paretovariate(1.2)) - 1, len(TITLES) - 1)]
+            messages.append((created, group_id, user_id, f"wiki {title}", "wiki", title))
+        else:
+            messages.append((created, group_id, user_id, rng.choice(CHATTER), "", ""))
+    return messages
+
+
+def write_text_logs(directory, messages):
+    files = {}
+    try:
+        for created, group_id, user_id, text, _, _ in messages:
+            moment = datetime.fromtimestamp(created)
+            path = os.path.join(directory, f"group_{group_id}", f"messages_{moment.strftime('%Y-%m-%d')}.log")
+            f = files.get(path)
+            if f is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                f = files[path] = open(path, "a", encoding="utf-8")
+            f.write(f"{moment.strftime('%Y-%m-%d %H:%M:%S')} - INFO - 群名: 星露谷物语交流群 | 发送者ID: {user_id} | "
+                    f"发送者: 鹈鹕镇居民 | 内容: {text}\n")
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def scan_text_logs(directory, since):
+    """原来的做法：逐个读取日志文件，解析每一行"""
+    since_day = datetime.fromtimestamp(since).strftime("%Y-%m-%d")
+    since_text = datetime.fromtimestamp(since).strftime("%Y-%m-%d %H:%M:%S")
+    result = {}
+    for group_dir in os.listdir(directory):
+        counter = Counter()
+        for name in os.listdir(os.path.join(directory, group_dir)):
+            if name[len("messages_"):-len(".log")] < since_day:
+                continue
+            with open(os.path.join(directory, group_dir, name), encoding="utf-8") as f:
+                for line in f:
+                    matched = LOG_LINE.match(line)
+                    if not matched or matched.group(1) < since_text:
+                        continue
+                    prefix = WIKI_PREFIX.match(matched.group(2))
+                    if prefix:
+                        counter[matched.group(2)[prefix.end():].strip()] += 1
+        if counter:
+            result[int(group_dir[len("group_"):])] = counter.most_common()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息历史查询基准测试")
+    parser.add_argument("--messages", type=int, default=500000)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.groups, args.days)
+    since = time.time() - 7 * 86400
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = os.path.join(tmp, "logs")
+        write_text_logs(log_dir, messages)
+
+        store = HistoryStore(os.path.join(tmp, "history"))
+        started = time.perf_counter()
+        for offset in range(0, len(messages), store.batch_size):
+            store.write([{
+                'time': created, 'group_id': group_id, 'group_name': "星露谷物语交流群", 'user_id': user_id,
+                'nickname': "鹈鹕镇居民", 'message_id': None, 'command': command, 'query': query, 'text': text
+            } for created, group_id, user_id, text, command, query in messages[offset:offset + store.batch_size]])
+        written = time.perf_counter() - started
+        print(f"消息数: {len(messages):,}, 群数: {args.groups}, 时间跨度: {args.days} 天")
+        print(f"写入 HistoryStore: {len(messages) / written:,.0f} 条/秒（每批 {store.batch_size} 条）")
+
+        started = time.perf_counter()
+        scanned = scan_text_logs(log_dir, since)
+        scan_time = time.perf_counter() - started
+        best = None
+        for _ in range(5):
+            started = time.perf_counter()
+            indexed = store.top_queries("wiki", since, limit=len(TITLES))
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        store.close()
+
+        same = {group: dict(items) for group, items in scanned.items()} == \
+               {group: dict(items) for group, items in indexed.items()}
+        print(f"最近 7 天各群各 Wiki 条目的查询次数（结果一致: {same}）")
+        print(f"扫描日志   {scan_time * 1000:9.1f} 毫秒")
+        print(f"索引查询   {best * 1000:9.1f} 毫秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
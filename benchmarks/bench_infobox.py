@@ -0,0 +1,117 @@
+"""
+信息框解析基准测试：对比旧的 BeautifulSoup 实现与 wiki_parser.extract_infobox
+
+用法（在项目根目录运行）：
+    python benchmarks/bench_infobox.py [--rounds 200] [HTML 文件 ...]
+
+默认使用 benchmarks/fixtures/ 下的页面。fixtures 中的示例页面按 Wiki 条目的结构编写，
+可以把真实条目保存进来获得更准确的数据，例如：
+    curl -o benchmarks/fixtures/abigail.html https://zh.stardewvalleywiki.com/阿比盖尔
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from wiki_parser import extract_infobox
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def legacy_extract_infobox(html_content):
+    """优化前的实现：每一行都序列化为 HTML 再重新解析，正则每次重新编译"""
+    soup = BeautifulSoup(html_content, "lxml")
+    description_meta = soup.find("meta", attrs={"name": "description"})
+    description_text = ""
+    if description_meta:
+        description_content = description_meta.get("content", "")
+        description_content = re.sub(r'data-sort-value=(?:\"|&quot;).*?(?:\"|&quot;)', '', description_content)
+        description_soup = BeautifulSoup(description_content, "lxml")
+        hidden_tags = description_soup.find_all(attrs={"style": re.compile(r"display\s*:\s*none", re.IGNORECASE)})
+        for tag in hidden_tags:
+            tag.decompose()
+        description_text = re.sub(r'\s+', ' ', description_soup.get_text(separator=" ", strip=False)).strip()
+    infobox = soup.find(id="infoboxborder")
+    if not infobox:
+        return {'title': "", 'description': description_text, 'rows': [], 'has_infobox': False}
+
+    infobox_data = {}
+    infobox_title = ""
+    header = infobox.find(id="infoboxheader")
+    if header:
+        infobox_title = header.get_text(strip=True)
+    for row in infobox.find_all("tr"):
+        section = row.find(id="infoboxsection")
+        detail = row.find(id="infoboxdetail")
+        if section and detail:
+            section_text = section.get_text(strip=True)
+            detail_copy = BeautifulSoup(str(detail), "lxml")
+            for tag in detail_copy.find_all(attrs={"style": re.compile(r"display\s*:\s*none", re.IGNORECASE)}):
+                tag.decompose()
+            for img in detail_copy.find_all("img"):
+                img.replace_with(" ")
+            detail_text = re.sub(r'\s+', ' ', detail_copy.get_text(separator=" ", strip=False)).strip()
+            if section_text and detail_text:
+                infobox_data[section_text] = detail_text
+    return {
+        'title': infobox_title,
+        'description': description_text,
+        'rows': [[k, v] for k, v in infobox_data.items()],
+        'has_infobox': True
+    }
+
+
+def measure(func, html, rounds):
+    """返回 (每次耗时 ms, 每次分配的内存块数, 峰值内存 KB)"""
+    func(html)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(html)
+    elapsed = (time.perf_counter() - started) * 1000 / rounds
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    func(html)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return elapsed, blocks, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="信息框解析基准测试")
+    parser.add_argument("files", nargs="*", help="HTML 文件，默认使用 fixtures 目录")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    files = args.files or sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html")))
+    if not files:
+        print("没有找到 HTML 文件")
+        return 1
+
+    print(f"{'文件':<24}{'大小KB':>8}{'旧 ms':>10}{'新 ms':>10}{'加速':>8}{'旧分配块':>10}{'新分配块':>10}{'旧峰值KB':>10}{'新峰值KB':>10}")
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+        legacy_result = legacy_extract_infobox(html)
+        new_result = extract_infobox(html)
+        # 主图地址是新增字段，旧实现没有
+        new_result.pop('image', None)
+        if legacy_result != new_result:
+            print(f"{os.path.basename(path)}: 解析结果不一致！\n旧: {legacy_result}\n新: {new_result}")
+            return 1
+        old_ms, old_blocks, old_peak = measure(legacy_extract_infobox, html, args.rounds)
+        new_ms, new_blocks, new_peak = measure(extract_infobox, html, args.rounds)
+        print(f"{os.path.basename(path):<24}{len(html) / 1024:>8.1f}{old_ms:>10.3f}{new_ms:>10.3f}{old_ms / new_ms:>7.1f}x"
+              f"{old_blocks:>10}{new_blocks:>10}{old_peak:>10.1f}{new_peak:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+日志写入基准测试：原来直接挂 FileHandler 的同步写入与 logger.LogPipeline 异步批量写入对比
+
+用法（在项目根目录运行）：
+    python benchmarks/bench_logging.py [--messages 100000] [--stall-ms 0]
+
+日志写到临时目录，模拟群消息日志（每条消息一条 INFO）。
+- 调用耗时：logger.info 返回前事件循环被占用的时间（微秒/条）
+- 总耗时：包括异步管道写完全部记录的时间
+--stall-ms 模拟磁盘卡顿：每次写文件额外等待的毫秒数（同步写入每条都会等待，异步写入每批等待一次）
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logger as bot_logger
+from logger import DailyFileHandler, LevelFilter, LogPipeline, QueueLogHandler
+
+
+class StallingStream:
+    """写入时等待 stall 秒的文件包装，模拟磁盘卡顿"""
+
+    def __init__(self, stream, stall):
+        self._stream = stream
+        self._stall = stall
+
+    def write(self, text):
+        if self._stall:
+            time.sleep(self._stall)
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class StallingDailyFileHandler(DailyFileHandler):
+    """每次写文件前等待 stall 秒的 DailyFileHandler"""
+
+    def __init__(self, directory, prefix, stall):
+        super().__init__(directory, prefix)
+        self._stall = stall
+
+    def write(self, path, text):
+        if self._stall:
+            time.sleep(self._stall)
+        super().write(path, text)
+
+
+def setup_handler(handler):
+    handler.setLevel(logging.INFO)
+    handler.addFilter(LevelFilter(logging.INFO))
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    return handler
+
+
+def make_file_handler(path, stall):
+    handler = setup_handler(logging.FileHandler(path, encoding="utf-8"))
+    handler.stream = StallingStream(handler.stream, stall)
+    return handler
+
+
+def run(name, logger, messages, finish=None):
+    started = time.perf_counter()
+    for index in range(messages):
+        logger.info(f"群名: 星露谷物语交流群 | 发送者ID: {100000 + index} | 发送者: 鹈鹕镇居民 | 内容: 今天钓到了传说之鱼！")
+    called = time.perf_counter() - started
+    if finish is not None:
+        finish()
+    total = time.perf_counter() - started
+    print(f"{name:<10} 调用: {called / messages * 1e6:7.2f} 微秒/条  总耗时: {total:6.2f} 秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志写入基准测试")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--stall-ms", type=float, default=0, help="每次写文件额外等待的毫秒数")
+    args = parser.parse_args()
+    stall = args.stall_ms / 1000
+    messages = args.messages if not stall else min(args.messages, 2000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 原来的写法：logger 上直接挂 FileHandler，每条记录写一次并 flush
+        sync_logger = logging.getLogger("bench_sync")
+        sync_logger.propagate = False
+        sync_logger.setLevel(logging.INFO)
+        sync_logger.addHandler(make_file_handler(os.path.join(tmp, "sync.log"), stall))
+
+        pipeline = LogPipeline()
+        async_logger = logging.getLogger("bench_async")
+        async_logger.propagate = False
+        async_logger.setLevel(logging.INFO)
+        async_logger.addHandler(QueueLogHandler(pipeline, [setup_handler(StallingDailyFileHandler(tmp, "async", stall))]))
+
+        print(f"消息数: {messages}, 模拟磁盘卡顿: {args.stall_ms} 毫秒/次写入")
+        run("同步写入", sync_logger, messages)
+        # 异步管道的队列需要放得下全部记录，才能比较写完全部记录的总耗时
+        pipeline.max_queue = messages
+        run("异步批量", async_logger, messages, pipeline.close)
+        print(f"异步批量   {pipeline.stats()}")
+        bot_logger.close_logging()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
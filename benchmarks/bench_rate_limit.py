@@ -0,0 +1,104 @@
+"""
+频率限制基准测试：原来的 {(群号, 用户): 字典} 固定窗口与 rate_limit.RateLimiter 对比
+
+用法（在项目根目录运行）：
+    python benchmarks/bench_rate_limit.py [--keys 2000000] [--duration 3600]
+
+模拟 duration 秒内 keys 个不同用户各查询一次（外加少量重复查询的活跃用户），时间由参数传入，不依赖真实时钟。
+输出每次检查的平均耗时和结束时保留的记录数、占用内存（tracemalloc 统计，单独一轮运行）。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import create_limiter
+
+WINDOW = 45
+LIMIT = 2
+
+
+class LegacyLimiter:
+    """原来 handle_wiki 中的写法：记录永不删除"""
+
+    def __init__(self):
+        self.records = {}
+
+    def acquire(self, group_id, user_id, now):
+        tag_key = (group_id, user_id)
+        rate_info = self.records.get(tag_key)
+        if rate_info is not None and now < rate_info['reset_time']:
+            if rate_info['count'] >= LIMIT:
+                return rate_info['reset_time'] - now
+            rate_info['count'] += 1
+        else:
+            self.records[tag_key] = {'count': 1, 'reset_time': now + WINDOW}
+        return 0
+
+    def __len__(self):
+        return len(self.records)
+
+
+def make_requests(keys, duration, seed=0):
+    """(群号, 用户, 时间)，90% 为只出现一次的新用户，10% 为反复查询的活跃用户"""
+    rng = random.Random(seed)
+    total = int(keys / 0.9)
+    requests = []
+    for index in range(total):
+        now = index * duration / total
+        if rng.random() < 0.1:
+            requests.append((rng.randrange(20), rng.randrange(200), now))
+        else:
+            requests.append((1000 + index % 500, 1_000_000 + index, now))
+    return requests
+
+
+def run(limiter, requests):
+    acquire = limiter.acquire
+    started = time.perf_counter()
+    for group_id, user_id, now in requests:
+        acquire(group_id, user_id, now=now)
+    return time.perf_counter() - started
+
+
+def measure_memory(factory, requests):
+    tracemalloc.start()
+    limiter = factory()
+    run(limiter, requests)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description="频率限制基准测试")
+    parser.add_argument("--keys", type=int, default=2_000_000, help="不同用户数")
+    parser.add_argument("--duration", type=float, default=3600, help="模拟的时间跨度（秒）")
+    parser.add_argument("--no-memory", action="store_true", help="跳过内存统计（tracemalloc 较慢）")
+    args = parser.parse_args()
+
+    requests = make_requests(args.keys, args.duration)
+    factories = {
+        "原来的字典": LegacyLimiter,
+        "fixed_window": lambda: create_limiter("fixed_window", LIMIT, WINDOW, max_keys=args.keys),
+        "sliding_window": lambda: create_limiter("sliding_window", LIMIT, WINDOW, max_keys=args.keys),
+        "token_bucket": lambda: create_limiter("token_bucket", LIMIT, WINDOW, max_keys=args.keys),
+    }
+    print(f"请求数: {len(requests):,}, 不同用户: 约 {args.keys:,}, 时间跨度: {args.duration:.0f} 秒, "
+          f"限制: {WINDOW} 秒 {LIMIT} 次")
+    for name, factory in factories.items():
+        limiter = factory()
+        elapsed = run(limiter, requests)
+        line = f"{name:<16} {elapsed / len(requests) * 1e9:8.0f} ns/次  保留记录: {len(limiter):>10,}"
+        if not args.no_memory:
+            line += f"  内存: {measure_memory(factory, requests) / 1024 / 1024:8.1f} MB"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+指令路由基准测试：对比原来 receive_messages 中的 startswith 判断链与 router.Router
+
+用法（在项目根目录运行）：
+    python benchmarks/bench_router.py [--messages 200000]
+
+直接使用 handlers.py 中注册的路由表（导入 handlers 需要项目根目录下的 config.json），只匹配、不执行处理函数。
+消息以普通闲聊为主，混入少量指令，先检查两种实现选出的指令相同，再比较每秒处理的消息数（交替运行 5 轮取最快）。
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handlers
+from router import MessageContext
+
+BOT_USER_ID = "10000"
+
+CHATTER = [
+    "今天钓到了传说之鱼！", "有人知道怎么去姜岛吗", "哈哈哈哈哈", "早上好", "我的鸡又被狐狸叼走了",
+    "这个 mod 怎么装啊", "where is the wizard tower", "笑死", "阿比盖尔好可爱", "今天幸运值好低",
+    "有没有一起联机的", "？", "6666", "晚安", "wiki怎么打开", "请问五彩碎片在哪里刷",
+]
+COMMANDS = [
+    ".wiki 阿比盖尔", "wiki 防风草", "查询 铱矿石", "搜索星之果实", "2", "赞我",
+    "日志 https://smapi.io/log/abc123 帮看看",
+]
+
+
+def build_router():
+    """
+    handlers.py 的路由表
+
+    guard 中的随机戳一戳按默认配置掷骰；基准测试中没有等待选择的 Wiki 查询，数字消息和普通消息一样只掷骰。
+    """
+    handlers.config = {}
+    handlers.wiki_waiting_tags.clear()
+    return handlers.router
+
+
+def route_name(route):
+    """路由的指令名去掉 _command 后缀，与旧判断链的结果对应"""
+    return route.name[:-len("_command")] if route.name.endswith("_command") else route.name
+
+
+def legacy_route(data):
+    """原来 receive_messages + ai_chat_handler 的判断逻辑，返回选中的指令名"""
+    message_list = data.get("message", [])
+    message = None
+    for msg in message_list:
+        if msg.get("type") == "text":
+            message = msg.get("data", {}).get("text", "")
+            break
+    at_qq = next((msg.get("data", {}).get("qq") for msg in message_list if msg.get("type") == "at"), None)
+    if at_qq is not None and str(at_qq) == BOT_USER_ID:
+        text_content = "".join(msg.get("data", {}).get("text", "") for msg in message_list if msg.get("type") == "text")
+        text_content = text_content.lstrip()
+        if text_content == "":
+            return "greeting"
+        if "赞我" in text_content:
+            return "like"
+        msg = text_content.strip().lower().lstrip('.')
+        if msg.startswith("wiki") or msg.startswith("查询") or msg.startswith("搜索"):
+            return "wiki"
+        return "ai_chat"
+    if message:
+        msg = message.strip().lower().lstrip('.')
+        if msg.startswith("wiki") or msg.startswith("查询") or msg.startswith("搜索"):
+            return "wiki"
+        if message.strip().isdigit():
+            return "choose_wiki"
+        if message == "赞我":
+            return "like"
+        text_parts = [m.get("data", {}).get("text", "") for m in message_list if m.get("type") == "text"]
+        if re.search(r'https://smapi\.io/log/[^\s()]*', " ".join(text_parts)):
+            return "smapi"
+    return "poke"
+
+
+def make_event(text, at_bot=False):
+    message = []
+    if at_bot:
+        message.append({"type": "at", "data": {"qq": BOT_USER_ID}})
+    message.append({"type": "text", "data": {"text": text}})
+    return {"post_type": "message", "message_type": "group", "group_id": 1, "user_id": 2, "message_id": 3,
+            "message": message}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指令路由基准测试")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--command-ratio", type=float, default=0.05, help="指令消息占比")
+    args = parser.parse_args()
+
+    router = build_router()
+    router.stats_interval = 0
+    samples = [make_event(text) for text in CHATTER + COMMANDS]
+    samples += [make_event(text, at_bot=True) for text in ["", " 赞我", "wiki 鸡", "你好呀", "1"]]
+    for data in samples:
+        expected = legacy_route(data)
+        actual = route_name(router.match(MessageContext(data, BOT_USER_ID)))
+        if expected != actual:
+            print(f"路由结果不一致: {data['message']} 旧: {expected} 新: {actual}")
+            return 1
+
+    rng = random.Random(0)
+    events = [make_event(rng.choice(COMMANDS) if rng.random() < args.command_ratio else rng.choice(CHATTER))
+              for _ in range(args.messages)]
+
+    def run_legacy():
+        for data in events:
+            legacy_route(data)
+
+    def run_router():
+        for data in events:
+            router.match(MessageContext(data, BOT_USER_ID))
+
+    # 两种实现交替运行，各取 5 轮中最快的一轮，减少机器负载波动的影响
+    legacy_elapsed = router_elapsed = float("inf")
+    for _ in range(5):
+        for run, is_router in ((run_legacy, False), (run_router, True)):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            if is_router:
+                router_elapsed = min(router_elapsed, elapsed)
+            else:
+                legacy_elapsed = min(legacy_elapsed, elapsed)
+
+    print(f"消息数: {args.messages}, 指令占比: {args.command_ratio:.0%}")
+    print(f"旧判断链: {args.messages / legacy_elapsed:>12,.0f} 条/秒")
+    print(f"Router:   {args.messages / router_elapsed:>12,.0f} 条/秒  ({legacy_elapsed / router_elapsed:.2f}x)")
+
+    # 快速路径：select 执行 guard 后，不需要处理的消息不进入事件分发
+    for data in events:
+        router.select(MessageContext(data, BOT_USER_ID))
+    print(f"快速路径: {router.format_stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
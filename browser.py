@@ -0,0 +1,218 @@
+import asyncio
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from logger import Colors, get_wiki_logger
+
+# 截图使用的移动端设备参数
+MOBILE_DEVICE = {
+    "viewport": {"width": 430, "height": 932},
+    "user_agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1",
+    "device_scale_factor": 3,
+    "is_mobile": True,
+    "has_touch": True
+}
+
+
+class _PageSlot:
+    """池中的一个页面槽位，绑定到某个浏览器"""
+    __slots__ = ("browser_index", "generation", "context", "page", "uses")
+
+    def __init__(self, browser_index):
+        self.browser_index = browser_index
+        self.generation = -1
+        self.context = None
+        self.page = None
+        self.uses = 0
+
+
+class BrowserPool:
+    """
+    常驻的 Chromium 浏览器池
+
+    启动若干个浏览器，每个浏览器下维护固定数量的可复用页面（每个页面独占一个 context），
+    同时使用的页面数即为并发上限。浏览器崩溃后在下次使用或健康检查时自动重启。
+    """
+
+    def __init__(self, browsers=1, pages_per_browser=2, max_page_uses=100, health_check_interval=30, context_options=None):
+        self.browsers = max(1, int(browsers))
+        self.pages_per_browser = max(1, int(pages_per_browser))
+        self.max_page_uses = max(1, int(max_page_uses))
+        self.health_check_interval = health_check_interval
+        self.context_options = context_options or MOBILE_DEVICE
+        self._playwright = None
+        self._browsers = [None] * self.browsers
+        self._generations = [0] * self.browsers
+        self._browser_locks = None
+        self._idle = None
+        self._start_lock = asyncio.Lock()
+        self._health_task = None
+        self._slots = []
+
+    @property
+    def size(self):
+        """页面总数（并发上限）"""
+        return self.browsers * self.pages_per_browser
+
+    async def start(self):
+        """启动 playwright 和所有浏览器，重复调用无副作用"""
+        if self._playwright is not None:
+            return
+        async with self._start_lock:
+            if self._playwright is not None:
+                return
+            playwright = await async_playwright().start()
+            self._playwright = playwright
+            self._browser_locks = [asyncio.Lock() for _ in range(self.browsers)]
+            try:
+                for index in range(self.browsers):
+                    await self._launch(index)
+            except Exception:
+                await self.close()
+                raise
+            self._idle = asyncio.Queue()
+            self._slots = []
+            for index in range(self.browsers):
+                for _ in range(self.pages_per_browser):
+                    slot = _PageSlot(index)
+                    self._slots.append(slot)
+                    self._idle.put_nowait(slot)
+            if self.health_check_interval:
+                self._health_task = asyncio.create_task(self._health_loop())
+            get_wiki_logger().info(f"浏览器池已启动 - 浏览器数: {self.browsers}, 页面数: {self.size}")
+
+    async def close(self):
+        """关闭所有页面、浏览器和 playwright"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._health_task = None
+        for slot in self._slots:
+            await self._discard(slot)
+        self._slots = []
+        self._idle = None
+        for index, browser in enumerate(self._browsers):
+            if browser is not None:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+                self._browsers[index] = None
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+    async def _launch(self, index):
+        browser = await self._playwright.chromium.launch(headless=True)
+        self._browsers[index] = browser
+        self._generations[index] += 1
+        return browser
+
+    async def _ensure_browser(self, index):
+        """健康检查：浏览器断开时重启，已有页面随之失效"""
+        async with self._browser_locks[index]:
+            browser = self._browsers[index]
+            if browser is None or not browser.is_connected():
+                logger = get_wiki_logger()
+                logger.warning(f"浏览器 #{index} 已断开，正在重启")
+                print(f"{Colors.ERROR}浏览器 #{index} 已断开，正在重启{Colors.RESET}")
+                if browser is not None:
+                    try:
+                        await browser.close()
+                    except Exception:
+                        pass
+                browser = await self._launch(index)
+            return browser
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for index in range(self.browsers):
+                try:
+                    await self._ensure_browser(index)
+                except Exception as e:
+                    get_wiki_logger().error(f"浏览器 #{index} 重启失败 - 错误: {e}")
+
+    async def _discard(self, slot):
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        slot.context = None
+        slot.page = None
+        slot.uses = 0
+
+    async def _prepare(self, slot):
+        browser = await self._ensure_browser(slot.browser_index)
+        generation = self._generations[slot.browser_index]
+        if (slot.page is None or slot.generation != generation
+                or slot.page.is_closed() or slot.uses >= self.max_page_uses):
+            await self._discard(slot)
+            slot.context = await browser.new_context(**self.context_options)
+            slot.page = await slot.context.new_page()
+            slot.generation = generation
+        slot.uses += 1
+        return slot.page
+
+    @asynccontextmanager
+    async def page(self):
+        """
+        从池中借出一个页面，用完自动归还
+
+        池中没有空闲页面时等待，出现异常（包括超时取消）时该页面被丢弃并在下次使用前重建。
+        """
+        await self.start()
+        idle = self._idle
+        slot = await idle.get()
+        try:
+            page = await self._prepare(slot)
+            yield page
+        except BaseException:
+            await self._discard(slot)
+            raise
+        finally:
+            idle.put_nowait(slot)
+
+
+# 全局浏览器池，通过 init_browser 初始化
+browser_pool = None
+
+
+def get_browser_pool():
+    """获取全局浏览器池，未初始化时使用默认配置"""
+    global browser_pool
+    if browser_pool is None:
+        browser_pool = BrowserPool()
+    return browser_pool
+
+
+async def init_browser(config):
+    """根据配置创建并预热浏览器池"""
+    global browser_pool
+    browser_config = config.get("browser", {})
+    browser_pool = BrowserPool(
+        browsers=browser_config.get("browsers", 1),
+        pages_per_browser=browser_config.get("pages_per_browser", 2),
+        max_page_uses=browser_config.get("max_page_uses", 100),
+        health_check_interval=browser_config.get("health_check_interval", 30)
+    )
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        # 启动失败不影响机器人其它功能，首次截图时会再次尝试
+        print(f"{Colors.ERROR}浏览器池启动失败: {e}{Colors.RESET}")
+        get_wiki_logger().error(f"浏览器池启动失败 - 错误: {e}")
+
+
+async def close_browser():
+    """关闭全局浏览器池"""
+    global browser_pool
+    if browser_pool is not None:
+        await browser_pool.close()
+        browser_pool = None
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    带过期时间和容量上限的内存缓存
+
+    每个条目可以单独指定 ttl；超出 max_entries 时淘汰最近最少使用的条目。
+    """
+
+    def __init__(self, max_entries=1000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # {key: (expire_time, value)}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expire_time, value = item
+        if expire_time < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        item = self._data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# 执行者被取消时作为结果交给等待者，表示由等待者重新发起；
+# 这样等待者收到的 CancelledError 只可能是它自己被取消，不需要依赖 3.11 才有的 Task.cancelling()
+_RETRY = object()
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求
+
+    同一个 key 同时只有一个协程真正执行，其余调用者等待并拿到同样的结果（或同样的异常）。
+    """
+
+    def __init__(self):
+        self._inflight = {}  # {key: asyncio.Future}
+
+    async def do(self, key, func, *args, **kwargs):
+        future = self._inflight.get(key)
+        while future is not None:
+            # shield 防止某个等待者被取消时连带取消其它等待者；自身被取消时照常抛出
+            result = await asyncio.shield(future)
+            if result is not _RETRY:
+                return result
+            # 执行者被取消（例如预取任务被撤销）时，由等待者重新发起
+            future = self._inflight.get(key)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.set_result(_RETRY)
+            else:
+                future.set_exception(e)
+                # 没有其它等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def __contains__(self, key):
+        return key in self._inflight
@@ -0,0 +1,119 @@
+import json
+from json.encoder import encode_basestring
+from logger import Colors
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ("json", "orjson")
+
+
+_scan_once = json.JSONDecoder().scan_once
+
+
+def _json_loads(text):
+    # 直接调用扫描器（C 实现），省去 json.loads 每次的类型检查和前后两次空白匹配；
+    # 前后有空白、bytes 等少见情况交给 json.loads 处理，错误信息与 json.loads 一致
+    try:
+        obj, end = _scan_once(text, 0)
+    except (StopIteration, TypeError):
+        return json.loads(text)
+    if end != len(text):
+        return json.loads(text)
+    return obj
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _orjson_dumps(obj):
+    # WebSocket 文本帧需要 str，orjson 输出的是 UTF-8 bytes
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# 当前使用的编解码函数，通过 init_codec 切换；调用方使用 codec.loads / codec.dumps，不要直接 import 函数
+loads = _json_loads
+dumps = _json_dumps
+backend = "json"
+
+
+def set_backend(name):
+    """切换 JSON 后端，未安装 orjson 时使用标准库 json，返回实际使用的后端"""
+    global loads, dumps, backend
+    if name in ("auto", "orjson") and orjson is not None:
+        loads, dumps, backend = orjson.loads, _orjson_dumps, "orjson"
+    else:
+        if name == "orjson":
+            print(f"{Colors.ERROR}未安装 orjson，JSON 编解码使用标准库 json{Colors.RESET}")
+        loads, dumps, backend = _json_loads, _json_dumps, "json"
+    return backend
+
+
+def init_codec(config):
+    """根据配置选择 JSON 后端（auto 时安装了 orjson 就使用 orjson）"""
+    set_backend(config.get("json", {}).get("backend", "auto"))
+    print(f"{Colors.INFO}JSON 编解码: {backend}{Colors.RESET}")
+
+
+class Slot:
+    """模板中的占位值"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Template:
+    """
+    预先序列化的出站消息模板
+
+    模板骨架中用 Slot 标记会变化的值，创建时整体序列化一次并在占位处切开，
+    render 时只序列化占位值再拼接，不再每次重建整棵字典并整体 dumps。
+    """
+
+    __slots__ = ("_parts", "_names")
+
+    def __init__(self, skeleton):
+        names = []
+
+        def mark(node):
+            if isinstance(node, Slot):
+                names.append(node.name)
+                return f"\x00{len(names) - 1}\x00"
+            if isinstance(node, dict):
+                return {key: mark(value) for key, value in node.items()}
+            if isinstance(node, list):
+                return [mark(value) for value in node]
+            return node
+
+        # 占位字符串序列化后为 "\u0000序号\u0000"，正常内容中不会出现
+        text = json.dumps(mark(skeleton), ensure_ascii=False, separators=(",", ":"))
+        parts = []
+        for index in range(len(names)):
+            marker = f'"\\u0000{index}\\u0000"'
+            head, text = text.split(marker, 1)
+            parts.append(head)
+        parts.append(text)
+        self._parts = tuple(parts)
+        self._names = tuple(names)
+
+    def render(self, **values):
+        """按占位名称填入值，返回 JSON 字符串"""
+        parts = self._parts
+        chunks = [parts[0]]
+        for index, name in enumerate(self._names, 1):
+            value = values[name]
+            value_type = type(value)
+            # 最常见的整数和字符串直接编码，省去一次完整的 dumps 调用
+            if value_type is str:
+                chunks.append(encode_basestring(value))
+            elif value_type is int:
+                chunks.append(str(value))
+            else:
+                chunks.append(dumps(value))
+            chunks.append(parts[index])
+        return "".join(chunks)
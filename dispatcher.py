@@ -0,0 +1,176 @@
+import asyncio
+import time
+import traceback
+from collections import deque
+from logger import Colors, get_global_error_logger, get_stats_logger
+
+
+class EventDispatcher:
+    """
+    事件分发
+
+    接收循环只负责解码和入队，事件由固定数量的工作协程处理：
+    - 同一个 key（群号，私聊/请求事件为用户）的事件按到达顺序开始处理，同时最多处理 key_concurrency 个，
+      一个较慢的处理（例如 SMAPI 日志分析）不会让整个群的后续消息都等待；设为 1 时严格逐个处理
+    - 不同 key 轮流处理，某个群刷屏或处理变慢不会占满所有工作协程
+    - 排队总数达到 max_queue 或单个 key 排队达到 max_key_queue 时丢弃新事件；入队从不等待，
+      接收循环不会停止读取，动作响应不会排在积压的事件后面（处理中的事件正在等待这些响应）
+    - 关闭（断线重连）时丢弃排队的事件，正在处理的事件最多等待 drain_timeout 秒后再取消
+    """
+
+    def __init__(self, workers=8, max_queue=1000, max_key_queue=50, key_concurrency=2, slow_threshold=30,
+                 stats_interval=300, drain_timeout=10):
+        self.workers = workers
+        self.key_concurrency = key_concurrency
+        self.max_queue = max_queue
+        self.max_key_queue = max_key_queue
+        self.slow_threshold = slow_threshold
+        self.stats_interval = stats_interval
+        self.drain_timeout = drain_timeout
+        self._queues = {}  # {key: deque[(func, args, 入队时间)]}
+        self._running = {}  # {key: 正在处理的数量}
+        self._ready = asyncio.Queue()  # 有待处理事件且未达到并发上限的 key
+        self._in_ready = set()
+        self._queued = 0
+        self._idle = asyncio.Event()  # 没有正在处理的事件
+        self._idle.set()
+        self._tasks = []
+        self._last_report = time.monotonic()
+        self._stats = {'processed': 0, 'dropped': 0, 'errors': 0, 'slow': 0, 'wait_total': 0.0,
+                       'wait_max': 0.0, 'max_depth': 0}
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, key, func, *args):
+        """事件入队，返回 False 表示排队过多被丢弃"""
+        queue = self._queues.get(key)
+        if queue is not None and len(queue) >= self.max_key_queue:
+            self._stats['dropped'] += 1
+            get_stats_logger().warning(f"事件排队过多，丢弃事件 - key: {key}, 排队: {len(queue)}")
+            return False
+        if self._queued >= self.max_queue:
+            self._stats['dropped'] += 1
+            get_stats_logger().warning(f"事件总排队过多，丢弃事件 - key: {key}, 总排队: {self._queued}")
+            return False
+        if queue is None:
+            queue = self._queues[key] = deque()
+        queue.append((func, args, time.monotonic()))
+        self._mark_ready(key)
+        self._queued += 1
+        self._stats['max_depth'] = max(self._stats['max_depth'], self._queued)
+        return True
+
+    def _mark_ready(self, key):
+        queue = self._queues.get(key)
+        if queue and key not in self._in_ready and self._running.get(key, 0) < self.key_concurrency:
+            self._in_ready.add(key)
+            self._ready.put_nowait(key)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            self._in_ready.discard(key)
+            queue = self._queues[key]
+            func, args, queued_at = queue.popleft()
+            self._queued -= 1
+            self._running[key] = self._running.get(key, 0) + 1
+            self._idle.clear()
+            # 还有排队的事件且未达到并发上限时，其它工作协程可以接着处理同一个 key
+            self._mark_ready(key)
+            started = time.monotonic()
+            waited = started - queued_at
+            self._stats['wait_total'] += waited
+            self._stats['wait_max'] = max(self._stats['wait_max'], waited)
+            try:
+                await func(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"{Colors.ERROR}事件处理失败: {e}{Colors.RESET}")
+                get_global_error_logger().error(f"事件处理失败 - key: {key}, 错误: {e}\n{traceback.format_exc()}")
+            finally:
+                self._running[key] -= 1
+                if not self._running[key]:
+                    del self._running[key]
+                    if not self._running:
+                        self._idle.set()
+                elapsed = time.monotonic() - started
+                self._stats['processed'] += 1
+                if elapsed > self.slow_threshold:
+                    self._stats['slow'] += 1
+                    get_stats_logger().warning(f"事件处理较慢 - key: {key}, 耗时: {elapsed:.1f} 秒")
+                if queue:
+                    self._mark_ready(key)
+                elif key not in self._running and self._queues.get(key) is queue:
+                    del self._queues[key]
+                self._maybe_report()
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        if not self.stats_interval or now - self._last_report < self.stats_interval:
+            return
+        self._last_report = now
+        get_stats_logger().info(f"事件分发统计 - {self.format_stats()}")
+
+    def stats(self):
+        processed = self._stats['processed']
+        return {
+            'processed': processed,
+            'dropped': self._stats['dropped'],
+            'errors': self._stats['errors'],
+            'slow': self._stats['slow'],
+            'queued': self._queued,
+            'max_depth': self._stats['max_depth'],
+            'wait_avg_ms': round(self._stats['wait_total'] / processed * 1000, 1) if processed else 0.0,
+            'wait_max_ms': round(self._stats['wait_max'] * 1000, 1)
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"处理: {s['processed']}, 丢弃: {s['dropped']}, 出错: {s['errors']}, 较慢: {s['slow']}, "
+                f"排队: {s['queued']}, 最大排队: {s['max_depth']}, 平均等待: {s['wait_avg_ms']}ms, 最大等待: {s['wait_max_ms']}ms")
+
+    async def close(self):
+        """
+        停止工作协程
+
+        排队的事件直接丢弃；正在处理的事件先等待完成（最多 drain_timeout 秒），超时后再取消。
+        """
+        for queue in self._queues.values():
+            queue.clear()
+        self._queues.clear()
+        self._in_ready.clear()
+        while not self._ready.empty():
+            self._ready.get_nowait()
+        self._queued = 0
+        if self._tasks and self.drain_timeout:
+            try:
+                await asyncio.wait_for(self._idle.wait(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                get_stats_logger().warning(f"关闭时事件处理未完成，取消处理 - 处理中: {sum(self._running.values())}, "
+                                           f"等待: {self.drain_timeout} 秒")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues.clear()
+        self._running.clear()
+        self._in_ready.clear()
+        self._queued = 0
+
+
+def create_dispatcher(config):
+    """根据配置创建事件分发器（每个 WebSocket 连接一个）"""
+    dispatcher_config = config.get("dispatcher", {})
+    return EventDispatcher(
+        workers=dispatcher_config.get("workers", 8),
+        max_queue=dispatcher_config.get("max_queue", 1000),
+        max_key_queue=dispatcher_config.get("max_group_queue", 50),
+        key_concurrency=dispatcher_config.get("group_concurrency", 2),
+        slow_threshold=dispatcher_config.get("slow_threshold", 30),
+        stats_interval=dispatcher_config.get("stats_interval", 300),
+        drain_timeout=dispatcher_config.get("drain_timeout", 10)
+    )
@@ -0,0 +1,39 @@
+class Event:
+    """
+    入站事件，接收时一次取出接收循环需要的字段，接收循环和事件处理不再重复 data.get
+
+    群消息的消息段由 router.MessageContext 一次遍历解析；data 保留原始字典，供少见字段使用。
+    key: 事件分发的排序键，群事件按群号，私聊和请求事件按用户
+    notice_type 等只有通知、请求事件才用到的字段在读取时再从 data 中取，群消息不必为它们付出开销。
+    """
+
+    __slots__ = ("data", "post_type", "message_type", "group_id", "user_id", "key")
+
+    def __init__(self, data):
+        get = data.get
+        self.data = data
+        self.post_type = get("post_type")
+        self.message_type = get("message_type")
+        self.group_id = group_id = get("group_id")
+        self.user_id = user_id = get("user_id")
+        self.key = str(group_id) if group_id is not None else f"user:{user_id}"
+
+    @property
+    def notice_type(self):
+        return self.data.get("notice_type")
+
+    @property
+    def sub_type(self):
+        return self.data.get("sub_type")
+
+    @property
+    def request_type(self):
+        return self.data.get("request_type")
+
+    @property
+    def target_id(self):
+        return self.data.get("target_id")
+
+    @property
+    def flag(self):
+        return self.data.get("flag")
@@ -1,28 +1,147 @@
 import asyncio
+import itertools
 import json
-import time
 import random
-import re
 import os
-from datetime import datetime, date
 import wiki
-from logger import Colors, get_group_logger
+from logger import Colors, get_group_logger, get_wiki_logger
 import openai_client
 from smapi import check_log_parse_error
+from api import PRIORITY_LOW
+from router import Router
+from browser import get_browser_pool
+from screenshot_cache import get_screenshot_cache
+from rate_limit import create_limiter
+import timers
 
 # 全局变量，通过 init_handlers 初始化
 api = None
 config = None
-wiki_waiting_tags = {}  # {(group_id, user_id): result}
-wiki_rate_limit = {}  # {(group_id, user_id): {'count': int, 'reset_time': float}}
-smapi_rate_limit = {}  # {(group_id, user_id): {'last_use_time': float}}  # 用户+群组的10分钟限制
-smapi_daily_limit = {'count': 0, 'date': None}  # 全局每日限制：{'count': int, 'date': date}
+wiki_waiting_tags = {}  # {(group_id, user_id): WikiSession}，查询中或等待选择
+# 频率限制（rate_limit.RateLimiter），通过 init_handlers 按配置创建
+wiki_rate_limit = None  # 每个群每个用户的 Wiki 查询次数
+smapi_rate_limit = None  # 每个群每个用户的 SMAPI 日志分析冷却时间
+smapi_daily_limit = None  # 全局每日 SMAPI 日志分析次数
+wiki_prefetch_tasks = {}  # {(group_id, user_id): {full_url: task}}  # 等待选择期间预取候选条目
+prefetch_semaphore = None
+prefetch_screenshots = True  # 浏览器池只有一个页面时不预取截图
+router = Router()  # 群消息指令路由，指令在文件末尾注册
+
+WIKI_CHOICE_TIMEOUT = 60
+_wiki_generations = itertools.count(1)
+
+
+class WikiSession:
+    """
+    一次 Wiki 查询：从搜索完成到发送结果或等待选择超时
+
+    generation 区分同一用户先后发起的查询，超时回调只结束创建它的那次查询，不会误删之后的新查询。
+    """
+
+    __slots__ = ("key", "generation", "result", "timer")
+
+    def __init__(self, key, result):
+        self.key = key
+        self.generation = next(_wiki_generations)
+        self.result = result
+        self.timer = None
+
+
+def open_wiki_session(tag_key, result):
+    session = WikiSession(tag_key, result)
+    wiki_waiting_tags[tag_key] = session
+    return session
+
+def close_wiki_session(session):
+    """结束查询并取消超时定时器；同一用户已经开始新的查询时不影响新的查询"""
+    if session.timer is not None:
+        session.timer.cancel()
+        session.timer = None
+    if wiki_waiting_tags.get(session.key) is session:
+        del wiki_waiting_tags[session.key]
+
+def expire_wiki_session(tag_key, generation, group_id, message_id):
+    """选择超时（时间轮回调）"""
+    session = wiki_waiting_tags.get(tag_key)
+    if session is None or session.generation != generation:
+        return None
+    session.timer = None
+    close_wiki_session(session)
+    cancel_wiki_prefetch(tag_key)
+    return api.send_message(1, group_id, message_id, "回复超时！")
 
 def init_handlers(api_client, config_dict):
     """初始化处理器，设置 api 客户端和配置"""
-    global api, config
+    global api, config, prefetch_semaphore, prefetch_screenshots, wiki_rate_limit, smapi_rate_limit, smapi_daily_limit
     api = api_client
     config = config_dict
+    # 重连时会再次初始化，已有的计数保留
+    if wiki_rate_limit is None:
+        wiki_config = config.get('wiki_rate_limit', {})
+        smapi_config = config.get('smapi_rate_limit', {})
+        wiki_rate_limit = create_limiter(
+            wiki_config.get('policy', 'fixed_window'),
+            limit=wiki_config.get('max_queries', 2),
+            window=wiki_config.get('time_window', 45),
+            max_keys=wiki_config.get('max_keys', 100000)
+        )
+        smapi_rate_limit = create_limiter(
+            'token_bucket',
+            limit=1,
+            window=smapi_config.get('time_window', 600),  # 默认10分钟 = 600秒
+            max_keys=smapi_config.get('max_keys', 100000)
+        )
+        smapi_daily_limit = create_limiter('fixed_window', limit=smapi_config.get('max_daily_uses', 20),
+                                           scope='global', daily=True)
+    # 预取最多占用浏览器池中 页面数 - 1 个页面，至少留一个页面给用户真正选中的条目
+    pool_size = get_browser_pool().size
+    prefetch_semaphore = asyncio.Semaphore(
+        max(1, min(config.get("wiki_prefetch", {}).get("concurrency", 2), pool_size - 1)))
+    prefetch_screenshots = pool_size > 1
+    router.stats_interval = config.get("dispatcher", {}).get("stats_interval", 300)
+
+# 预取候选条目的信息框和截图
+async def prefetch_wiki_entry(full_url):
+    try:
+        async with prefetch_semaphore:
+            await wiki.get_infobox_text(full_url)
+            if prefetch_screenshots:
+                await wiki.SearchResult(full_url)
+    except Exception as e:
+        print(f"{Colors.ERROR}预取Wiki条目失败: {e}{Colors.RESET}")
+        logger = get_wiki_logger()
+        logger.error(f"预取Wiki条目失败 - URL: {full_url}, 错误: {e}")
+
+def start_wiki_prefetch(tag_key, results):
+    """用户选择期间，提前获取前几个候选条目的信息框和截图"""
+    prefetch_config = config.get("wiki_prefetch", {})
+    if not prefetch_config.get("enabled", True):
+        return
+    cancel_wiki_prefetch(tag_key)
+    tasks = {}
+    for result in results[:prefetch_config.get("top_n", 3)]:
+        full_url = result['full_url']
+        tasks[full_url] = asyncio.create_task(prefetch_wiki_entry(full_url))
+    wiki_prefetch_tasks[tag_key] = tasks
+
+def cancel_wiki_prefetch(tag_key, keep_url=None):
+    """取消预取任务，keep_url 对应的任务（用户选中的条目）继续执行"""
+    tasks = wiki_prefetch_tasks.pop(tag_key, None)
+    if not tasks:
+        return
+    for full_url, task in tasks.items():
+        if full_url != keep_url and not task.done():
+            task.cancel()
+
+def roll_poke():
+    """群消息随机戳一戳的掷骰，在接收循环中同步执行，没掷中的普通消息不会进入事件分发"""
+    return config.get("poke", {}).get("enabled", True) and random.random() < 0.02
+
+async def poke_user(group_id, user_id):
+    await api.poke(1, group_id, user_id)
+    print(f"{Colors.INFO}戳一戳 - 群号: {group_id} | 目标用户ID: {user_id}{Colors.RESET}")
+    logger = get_group_logger(group_id)
+    logger.info(f"戳一戳 - 群号: {group_id} | 目标用户ID: {user_id}")
 
 # 戳一戳处理
 async def poke_handler(type, group_id, bot_user_id, user_id, target_id):
@@ -32,16 +151,13 @@ async def poke_handler(type, group_id, bot_user_id, user_id, target_id):
         return
     
     if type == 1:
-        if random.random() < 0.02:
-            await api.poke(1, group_id, user_id)
-            print(f"{Colors.INFO}戳一戳 - 群号: {group_id} | 目标用户ID: {user_id}{Colors.RESET}")
-            logger = get_group_logger(group_id)
-            logger.info(f"戳一戳 - 群号: {group_id} | 目标用户ID: {user_id}")
+        if roll_poke():
+            await poke_user(group_id, user_id)
     else:
         if target_id == bot_user_id:
             poke_messages = poke_config.get("messages", [""])
             random_message = random.choice(poke_messages)
-            await api.send_message(1, group_id, None, random_message)
+            await api.send_message(1, group_id, None, random_message, priority=PRIORITY_LOW)
             await api.poke(1, group_id, user_id)
 
 # 入群事件处理
@@ -52,93 +168,42 @@ async def group_increase_handler(group_id, user_id):
         return
     
     welcome_message = group_increase_config.get("welcome_message", " 你好！欢迎加入！")
-    await api.send_at_message(user_id, group_id, welcome_message)
+    await api.send_at_message(user_id, group_id, welcome_message, priority=PRIORITY_LOW)
     print(f"{Colors.INFO}成员入群 - 群号: {group_id} | 新成员ID: {user_id}{Colors.RESET}")
     logger = get_group_logger(group_id)
     logger.info(f"成员入群 - 群号: {group_id} | 新成员ID: {user_id}")
 
 # Wiki 指令处理
-async def handle_wiki(message, group_id, message_id, user_id):
+async def handle_wiki(search_content, group_id, message_id, user_id):
+    """search_content 为 wiki/查询/搜索 指令之后的内容，由指令路由解析"""
     try:
-        # 检查是否匹配 wiki 指令（支持 .wiki、wiki、查询，带或不带空格）
-        message_stripped = message.strip() if message else ""
-        message_lower = message_stripped.lower()
-        
-        # 去除开头的点（如果存在）
-        if message_lower.startswith("."):
-            message_lower = message_lower[1:]
-            message_stripped = message_stripped[1:]
-        
-        # 检查是否以 wiki、查询 或 搜索 开头
-        keyword = None
-        keyword_len = 0
-        if message_lower.startswith("wiki"):
-            keyword = "wiki"
-            keyword_len = 4
-        elif message_lower.startswith("查询"):
-            keyword = "查询"
-            keyword_len = 2
-        elif message_lower.startswith("搜索"):
-            keyword = "搜索"
-            keyword_len = 2
+        # 检查频率限制
+        tag_key = (group_id, user_id)
+        remaining_time = wiki_rate_limit.acquire(group_id, user_id)
+        if remaining_time:
+            try:
+                await api.send_message(1, group_id, message_id, f"查询频繁，请 {int(remaining_time)} 秒后再试~")
+            except Exception as e:
+                print(f"{Colors.ERROR}发送消息失败: {e}{Colors.RESET}")
+            return
         
-        if keyword:
-            # 检查频率限制
-            tag_key = (group_id, user_id)
-            current_time = time.time()
-            
-            # 从配置文件读取限制参数
-            rate_limit_config = config.get('wiki_rate_limit', {})
-            max_queries = rate_limit_config.get('max_queries')
-            time_window = rate_limit_config.get('time_window')
-            
-            # 如果记录存在且未过期，检查计数
-            if tag_key in wiki_rate_limit:
-                rate_info = wiki_rate_limit[tag_key]
-                if current_time < rate_info['reset_time']:
-                    # 仍在限制时间窗口内
-                    if rate_info['count'] >= max_queries:
-                        # 超过限制
-                        remaining_time = int(rate_info['reset_time'] - current_time)
-                        try:
-                            await api.send_message(1, group_id, message_id, f"查询频繁，请 {remaining_time} 秒后再试~")
-                        except Exception as e:
-                            print(f"{Colors.ERROR}发送消息失败: {e}{Colors.RESET}")
-                        return
-                    else:
-                        # 增加计数
-                        rate_info['count'] += 1
-                else:
-                    # 时间窗口已过期，重置
-                    wiki_rate_limit[tag_key] = {'count': 1, 'reset_time': current_time + time_window}
-            else:
-                # 首次查询，创建记录
-                wiki_rate_limit[tag_key] = {'count': 1, 'reset_time': current_time + time_window}
-            
-            # 提取搜索内容：从关键词之后开始提取
-            if len(message_stripped) > keyword_len:
-                # 检查关键词之后是否有空格
-                if len(message_stripped) > keyword_len and message_stripped[keyword_len] == ' ':
-                    search_content = message_stripped[keyword_len + 1:].strip()
-                else:
-                    search_content = message_stripped[keyword_len:].strip()
-            else:
-                search_content = ""
-            if search_content:
+        if search_content:
+            try:
+                result = await wiki.Search(search_content)
+            except Exception as e:
+                print(f"{Colors.ERROR}Wiki搜索失败: {e}{Colors.RESET}")
+                logger = get_group_logger(group_id)
+                logger.error(f"Wiki搜索失败 - 搜索内容: {search_content}, 错误: {e}")
                 try:
-                    result = await wiki.Search(search_content)
-                except Exception as e:
-                    print(f"{Colors.ERROR}Wiki搜索失败: {e}{Colors.RESET}")
-                    logger = get_group_logger(group_id)
-                    logger.error(f"Wiki搜索失败 - 搜索内容: {search_content}, 错误: {e}")
-                    try:
-                        await api.send_message(1, group_id, message_id, "查询失败，请重试")
-                    except:
-                        pass
-                    return
-
-                wiki_waiting_tags[tag_key] = result
+                    await api.send_message(1, group_id, message_id, "查询失败，请重试")
+                except:
+                    pass
+                return
 
+            session = open_wiki_session(tag_key, result)
+            # 除了等待选择的查询，其余情况（包括发送失败、被取消）结束时都关闭查询，不会一直占着“上一个查询未完成”
+            waiting = False
+            try:
                 if result['type'] == 0:
                     try:
                         await api.send_message(1, group_id, message_id, result['text'])
@@ -146,19 +211,16 @@ async def handle_wiki(message, group_id, message_id, user_id):
                         print(f"{Colors.ERROR}发送消息失败: {e}{Colors.RESET}")
                         logger = get_group_logger(group_id)
                         logger.error(f"发送消息失败 - 错误: {e}")
-                    
+                
                     try:
                         image = await wiki.SearchResult(result['results'][0]['full_url'])
-                        await api.send_image_message(1, group_id, message_id, search_content, image)
-                        del wiki_waiting_tags[tag_key]
-                        return
+                        # 发送期间截图文件不会被缓存淘汰删除
+                        with get_screenshot_cache().hold(image):
+                            await api.send_image_message(1, group_id, message_id, search_content, image)
                     except Exception as e:
                         print(f"{Colors.ERROR}截图失败: {e}{Colors.RESET}")
                         logger = get_group_logger(group_id)
                         logger.error(f"截图失败 - 错误: {e}")
-                        if tag_key in wiki_waiting_tags:
-                            del wiki_waiting_tags[tag_key]
-                        return
                 elif result['type'] == -1:
                     # 没有搜索结果，直接发送消息，不等待选择
                     try:
@@ -167,40 +229,27 @@ async def handle_wiki(message, group_id, message_id, user_id):
                         print(f"{Colors.ERROR}发送消息失败: {e}{Colors.RESET}")
                         logger = get_group_logger(group_id)
                         logger.error(f"发送消息失败 - 错误: {e}")
-                    if tag_key in wiki_waiting_tags:
-                        del wiki_waiting_tags[tag_key]
-                    return
                 else:
-                    # type == 1，有多个结果，显示选择提示
+                    # type == 1，有多个结果，显示选择提示，同时开始预取候选条目
+                    # 超时由共用的时间轮处理，不再为每次查询创建一个等待 60 秒的任务
+                    session.timer = timers.call_later(WIKI_CHOICE_TIMEOUT, expire_wiki_session, tag_key,
+                                                      session.generation, group_id, message_id)
+                    start_wiki_prefetch(tag_key, result['results'])
+                    waiting = True
                     try:
-                        await api.send_message(1, group_id, message_id, result['text'] + '\n请在60秒发送：1-' + str(result['wiki_len']))
+                        await api.send_message(1, group_id, message_id, result['text'] + f'\n请在{WIKI_CHOICE_TIMEOUT}秒发送：1-' + str(result['wiki_len']))
                     except Exception as e:
                         print(f"{Colors.ERROR}发送消息失败: {e}{Colors.RESET}")
                         logger = get_group_logger(group_id)
                         logger.error(f"发送消息失败 - 错误: {e}")
-                
-
-                # 创建60秒倒计时任务
-                async def countdown_message():
-                    try:
-                        await asyncio.sleep(60)
-                        if tag_key in wiki_waiting_tags:
-                            try:
-                                await api.send_message(1, group_id, message_id, "回复超时！")
-                            except:
-                                pass
-                            del wiki_waiting_tags[tag_key]
-                    except Exception as e:
-                        print(f"{Colors.ERROR}倒计时任务错误: {e}{Colors.RESET}")
-                        logger = get_group_logger(group_id)
-                        logger.error(f"倒计时任务错误 - 错误: {e}")
-                
-                asyncio.create_task(countdown_message())
-            else:
-                try:
-                    await api.send_message(1, group_id, message_id, "乌~啦～输入要查询的内容，如.Wiki 乌·呀·咿·哈")
-                except Exception as e:
-                    print(f"发送消息失败: {e}")
+            finally:
+                if not waiting:
+                    close_wiki_session(session)
+        else:
+            try:
+                await api.send_message(1, group_id, message_id, "乌~啦～输入要查询的内容，如.Wiki 乌·呀·咿·哈")
+            except Exception as e:
+                print(f"发送消息失败: {e}")
     except Exception as e:
         print(f"{Colors.ERROR}handle_wiki 发生未预期的错误: {e}{Colors.RESET}")
         if 'group_id' in locals():
@@ -211,7 +260,8 @@ async def handle_wiki(message, group_id, message_id, user_id):
         traceback.print_exc()
 
 # Wiki选择指令处理
-async def choose_wiki(message, group_id, message_id, user_id):
+async def choose_wiki(message, group_id, message_id, user_id, poked=False):
+    """poked 表示接收循环中随机戳一戳已经掷中（路由时没有等待选择的查询）"""
     try:
         # 检查消息是否为纯数字
         if not message or not message.strip().isdigit():
@@ -221,24 +271,26 @@ async def choose_wiki(message, group_id, message_id, user_id):
         
         # 如果没有待查询的，静默返回，不回复
         if tag_key not in wiki_waiting_tags:
-            # 处理戳一戳
-            asyncio.create_task(poke_handler(1, group_id, None, user_id, None))
+            # 当作普通消息处理戳一戳：接收循环中已经掷中时直接戳；
+            # 路由时还有查询、现在已经结束（超时或已选择）时还没有掷过骰，照常掷骰
+            if poked:
+                await poke_user(group_id, user_id)
+            else:
+                await poke_handler(1, group_id, config.get("bot_user_id", ""), user_id, None)
             return
         
+        session = wiki_waiting_tags[tag_key]
         try:
             choice_num = int(message.strip())
-            result = wiki_waiting_tags.get(tag_key)
+            result = session.result
             
-            # 如果结果被删除了，静默返回
-            if result is None:
-                # 处理戳一戳
-                asyncio.create_task(poke_handler(1, group_id, None, user_id, None))
+            # 还在搜索或发送结果，不是等待选择的查询
+            if session.timer is None:
                 return
             
             if not result.get('results') or len(result['results']) == 0:
-                # 删除无效结果，防止倒计时任务发送超时
-                if tag_key in wiki_waiting_tags:
-                    del wiki_waiting_tags[tag_key]
+                # 删除无效结果，同时取消超时定时器
+                close_wiki_session(session)
                 return
             
             if choice_num < 1 or choice_num > len(result['results']):
@@ -253,24 +305,32 @@ async def choose_wiki(message, group_id, message_id, user_id):
             selected_result = result['results'][choice_num - 1]
             selected_url = selected_result['full_url']
             selected_title = selected_result['title']
+            # 选中的条目可能已经预取完成，其余候选的预取任务取消
+            cancel_wiki_prefetch(tag_key, keep_url=selected_url)
+            # 已经选择，发送结果期间不会再超时；timer 为 None 时这期间再发的数字会被忽略
+            session.timer.cancel()
+            session.timer = None
             
             try:
                 infobox_text = await wiki.get_infobox_text(selected_url)
                 await api.send_message(1, group_id, message_id, f"{infobox_text}\n查看更多：{selected_url}")
                 image = await wiki.SearchResult(selected_url)
-                await api.send_image_message(1, group_id, message_id, selected_title, image)
-                result = wiki_waiting_tags.pop(tag_key, None)
+                with get_screenshot_cache().hold(image):
+                    await api.send_image_message(1, group_id, message_id, selected_title, image)
             except Exception as e:
                 print(f"{Colors.ERROR}截图失败: {e}{Colors.RESET}")
                 logger = get_group_logger(group_id)
                 logger.error(f"截图失败 - 选择序号: {choice_num}, 错误: {e}")
+            finally:
+                # 发送成功、失败或被取消都结束查询
+                close_wiki_session(session)
                 
         except (ValueError, IndexError, KeyError) as e:
             print(f"{Colors.ERROR}选择结果时出错: {e}{Colors.RESET}")
             logger = get_group_logger(group_id)
             logger.error(f"选择结果时出错 - 选择序号: {message}, 错误: {e}")
-            if tag_key in wiki_waiting_tags:
-                del wiki_waiting_tags[tag_key]
+            cancel_wiki_prefetch(tag_key)
+            close_wiki_session(session)
     except Exception as e:
         print(f"{Colors.ERROR}choose_wiki 发生未预期的错误: {e}{Colors.RESET}")
         if 'group_id' in locals():
@@ -281,100 +341,55 @@ async def choose_wiki(message, group_id, message_id, user_id):
         traceback.print_exc()
 
 # 链接SMapi
-async def handle_smapi(message_list, group_id, message_id, user_id):
-    # 提取所有文本消息片段
-    text_parts = [msg.get("data", {}).get("text", "") for msg in message_list if msg.get("type") == "text"]
-    full_message = " ".join(text_parts)
-        
-    # 匹配 https://smapi.io/log/ 链接（不包含括号）
-    url_pattern = r'https://smapi\.io/log/[^\s()]*'
-    match = re.search(url_pattern, full_message)
-        
-    if match:
-        tag_key = (group_id, user_id)
-        current_time = time.time()
-        
-        # 从配置文件读取限制参数
-        rate_limit_config = config.get('smapi_rate_limit', {})
-        time_window = rate_limit_config.get('time_window', 600)  # 默认10分钟 = 600秒
-        max_daily_uses = rate_limit_config.get('max_daily_uses', 20)
-        max_chars = rate_limit_config.get('max_log_chars', 50000)
-        
-        # 检查用户+群组的10分钟限制（原来的限制）
-        if tag_key in smapi_rate_limit:
-            rate_info = smapi_rate_limit[tag_key]
-            if current_time < rate_info['last_use_time'] + time_window:
-                # 仍在限制时间窗口内
-                remaining_time = int(rate_info['last_use_time'] + time_window - current_time)
-                await api.send_message(1, group_id, message_id, f"查询频繁，请 {remaining_time} 秒后再试！")
-                return
-        
-        # 全局每日限制检查
-        today = date.today()
-        
-        # 如果是新的一天，重置计数
-        if smapi_daily_limit['date'] != today:
-            smapi_daily_limit['count'] = 0
-            smapi_daily_limit['date'] = today
-        
-        # 检查是否超过每日限制
-        if smapi_daily_limit['count'] >= max_daily_uses:
-            await api.send_message(1, group_id, message_id, f"今天已经使用了 {max_daily_uses} 次，请明天再试哦！")
-            return
-        
-        extracted_url = match.group(0)
-        result = await check_log_parse_error(extracted_url)
-        if result:
-            smapi_rate_limit[tag_key] = {'last_use_time': current_time} 
-            smapi_daily_limit['count'] += 1  # 增加全局每日计数
-            await api.send_message(1, group_id, message_id, "正在分析日志，请耐心等待！")
-            # 读取文件内容
-            with open(result, 'r', encoding='utf-8') as f:
-                log_content = f.read()
-
-            # 限制日志长度
-            if len(log_content) > max_chars:
-                log_content = f"[日志过长，仅显示最后 {max_chars} 字符]\n" + log_content[-max_chars:]
-            
-            # 将日志内容传给AI分析
-            ai_response_smapi = await openai_client.get_ai_response_smapi(log_content)
-            ai_response_smapi = ai_response_smapi.replace('**', '')
-            await api.send_at_message(user_id, group_id, " 日志分析完成!")
-            forward_messages = [
-                {"text": "由于deepseekR1模型的token太贵了，所以不得不添加限制...", "uin": 3014518835, "name": "Moite"},
-                {"text": "如果还是无法解决可以加群：星露谷物语手机版模组交流群（611726395）来询问哦！", "uin": 1497551537, "name": "yukino"},
-                {"text": ai_response_smapi, "uin": 2582770985, "name": "乌萨奇大王"}
-            ]
-            await api.send_group_forward_msg(group_id, forward_messages)
-        else:
-            await api.send_message(1, group_id, message_id, "解析失败，请确保链接正确哦！")
-        
-
-# AI回复处理
-async def ai_chat_handler(at_message, group_id, message_id, user_id):
-
-    text_content = "".join(msg.get("data", {}).get("text", "") for msg in at_message if msg.get("type") == "text")
-    text_content = text_content.lstrip()
+async def handle_smapi(log_url, group_id, message_id, user_id):
+    """log_url 为消息中的 https://smapi.io/log/ 链接，由指令路由提取"""
+    # 从配置文件读取限制参数
+    rate_limit_config = config.get('smapi_rate_limit', {})
+    max_daily_uses = rate_limit_config.get('max_daily_uses', 20)
+    max_chars = rate_limit_config.get('max_log_chars', 50000)
 
-    if text_content == "":
-        await api.send_message(1, group_id, message_id, "你好，有什么想和我说的嘛？")
+    # 检查用户+群组的10分钟限制（原来的限制）
+    remaining_time = smapi_rate_limit.peek(group_id, user_id)
+    if remaining_time:
+        await api.send_message(1, group_id, message_id, f"查询频繁，请 {int(remaining_time)} 秒后再试！")
         return
 
-    if "赞我" in text_content:
-        await api.send_message(1, group_id, message_id, "已经给你点赞啦！")
-        await api.send_like(user_id, 20)
+    # 检查是否超过全局每日限制（自然日零点重置）
+    if smapi_daily_limit.peek():
+        await api.send_message(1, group_id, message_id, f"今天已经使用了 {max_daily_uses} 次，请明天再试哦！")
         return
 
-    # 检查是否为 wiki/查询/搜索 指令
-    msg = text_content.strip().lower().lstrip('.')
-    if msg.startswith("wiki") or msg.startswith("查询") or msg.startswith("搜索"):
-        tag_key = (group_id, user_id)
-        if tag_key in wiki_waiting_tags:
-            await api.send_message(1, group_id, message_id, "上一个查询未完成！")
-        else:
-            asyncio.create_task(handle_wiki(text_content, group_id, message_id, user_id))
-        return
+    result = await check_log_parse_error(log_url)
+    if result:
+        # 日志解析成功才计入次数
+        smapi_rate_limit.hit(group_id, user_id)
+        smapi_daily_limit.hit()
+        await api.send_message(1, group_id, message_id, "正在分析日志，请耐心等待！")
+        # 读取文件内容
+        with open(result, 'r', encoding='utf-8') as f:
+            log_content = f.read()
+
+        # 限制日志长度
+        if len(log_content) > max_chars:
+            log_content = f"[日志过长，仅显示最后 {max_chars} 字符]\n" + log_content[-max_chars:]
+
+        # 将日志内容传给AI分析
+        ai_response_smapi = await openai_client.get_ai_response_smapi(log_content)
+        ai_response_smapi = ai_response_smapi.replace('**', '')
+        await api.send_at_message(user_id, group_id, " 日志分析完成!")
+        forward_messages = [
+            {"text": "由于deepseekR1模型的token太贵了，所以不得不添加限制...", "uin": 3014518835, "name": "Moite"},
+            {"text": "如果还是无法解决可以加群：星露谷物语手机版模组交流群（611726395）来询问哦！", "uin": 1497551537, "name": "yukino"},
+            {"text": ai_response_smapi, "uin": 2582770985, "name": "乌萨奇大王"}
+        ]
+        await api.send_group_forward_msg(group_id, forward_messages)
+    else:
+        await api.send_message(1, group_id, message_id, "解析失败，请确保链接正确哦！")
+
 
+# AI回复处理
+async def ai_chat_handler(text_content, group_id, message_id, user_id):
+    """text_content 为 @机器人 消息的文本，问候、点赞和 Wiki 指令由指令路由先行处理"""
     try:
         ai_response = await openai_client.get_ai_response(text_content)
         await api.send_message(1, group_id, message_id, ai_response)
@@ -385,3 +400,50 @@ async def ai_chat_handler(at_message, group_id, message_id, user_id):
         # 失败时发送默认回复
         await api.send_message(1, group_id, message_id, "乌~啦啦啦～呀～哈")
 
+
+# ---------- 指令路由 ----------
+# 注册顺序即优先级：@机器人 时的问候、点赞优先于 Wiki 指令，Wiki 指令优先于 AI 聊天
+
+@router.command(predicate=lambda ctx: not ctx.text, at_bot=True)
+async def greeting_command(ctx):
+    await api.send_message(1, ctx.group_id, ctx.message_id, "你好，有什么想和我说的嘛？")
+
+@router.command(predicate=lambda ctx: "赞我" in ctx.text if ctx.at_bot else ctx.text == "赞我")
+async def like_command(ctx):
+    reply = "已经给你点赞啦！" if ctx.at_bot else "乌~啦～！收已经给你点赞啦！"
+    await api.send_message(1, ctx.group_id, ctx.message_id, reply)
+    await api.send_like(ctx.user_id, 20)
+
+@router.command(prefix=("wiki", "查询", "搜索"))
+async def wiki_command(ctx):
+    if (ctx.group_id, ctx.user_id) in wiki_waiting_tags:
+        reply = "上一个查询未完成！" if ctx.at_bot else "乌~啦～上一个查询未完成！"
+        await api.send_message(1, ctx.group_id, ctx.message_id, reply)
+        return
+    await handle_wiki(ctx.args, ctx.group_id, ctx.message_id, ctx.user_id)
+
+@router.command(at_bot=True)
+async def ai_chat_command(ctx):
+    await ai_chat_handler(ctx.text, ctx.group_id, ctx.message_id, ctx.user_id)
+
+def choose_wiki_guard(ctx):
+    """有等待选择的查询时处理数字消息；没有时和普通消息一样掷骰，结果记在 ctx.poked"""
+    if (ctx.group_id, ctx.user_id) in wiki_waiting_tags:
+        return True
+    ctx.poked = roll_poke()
+    return ctx.poked
+
+# 没有等待选择的 Wiki 查询时，数字消息和普通消息一样只需要掷骰决定是否戳一戳，也不作为指令记录到消息历史
+@router.command(regex=r"^\s*\d+\s*$", guard=choose_wiki_guard,
+                history=lambda ctx: (ctx.group_id, ctx.user_id) in wiki_waiting_tags)
+async def choose_wiki_command(ctx):
+    await choose_wiki(ctx.text, ctx.group_id, ctx.message_id, ctx.user_id, ctx.poked)
+
+@router.command(regex=r"https://smapi\.io/log/[^\s()]*", contains="smapi.io/log/")
+async def smapi_command(ctx):
+    await handle_smapi(ctx.match.group(0), ctx.group_id, ctx.message_id, ctx.user_id)
+    await poke_handler(1, ctx.group_id, config.get("bot_user_id", ""), ctx.user_id, None)
+
+@router.fallback(guard=lambda ctx: roll_poke())
+async def poke_command(ctx):
+    await poke_user(ctx.group_id, ctx.user_id)
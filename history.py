@@ -0,0 +1,370 @@
+"""
+群消息历史存储
+
+每条群消息追加写入按日期分段的 JSONL 文件（data/history/messages_YYYY-MM-DD.jsonl，保存完整内容），
+同时在 SQLite 索引中记录时间、群号、用户、指令和指令参数，以及消息在 JSONL 中的位置。
+统计查询只读索引，不需要扫描消息日志；JSONL 是原始记录，索引损坏或丢失时可以从 JSONL 重建。
+
+    python history.py top --command wiki --days 7      # 最近 7 天各群查询最多的 Wiki 条目
+    python history.py top --command ai_chat --group <群号>  # 重复最多的 AI 提问
+    python history.py hours --days 7 [--group <群号>]   # 各小时的消息数
+    python history.py users --days 7 [--group <群号>]   # 发言最多的用户
+    python history.py show --group <群号> [--limit 20]  # 最近的消息（从 JSONL 读取完整内容）
+    python history.py rebuild                          # 从 JSONL 重建索引
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+import codec
+from logger import Colors, get_global_error_logger
+from timers import call_later
+
+DEFAULT_DIR = os.path.join("data", "history")
+SEGMENT_PREFIX = "messages_"
+SEGMENT_SUFFIX = ".jsonl"
+
+# 索引只保存定位和统计需要的字段，完整内容在 JSONL 中
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    time INTEGER NOT NULL,
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    query TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_command ON messages (command, time, group_id, query);
+CREATE INDEX IF NOT EXISTS messages_group ON messages (group_id, time);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (time);
+"""
+
+# 指令参数最多保存的字符数，避免长消息撑大索引
+MAX_QUERY_CHARS = 100
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _day_number(day):
+    """日期转换为 YYYYMMDD 整数，索引中用它定位 JSONL 分段"""
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+class HistoryStore:
+    """
+    群消息历史存储
+
+    record 只把消息放进内存缓冲区，攒满 batch_size 条或 flush_interval 秒后交给后台线程写入：
+    先追加 JSONL，再批量插入索引并提交一次事务，事件循环不会等待磁盘。
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, batch_size=200, flush_interval=2.0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()  # 后台写入和查询共用一个连接
+        self._pending = []
+        self._timer = None
+        self._executor = None
+        self._segment = None  # 当前打开的 JSONL 分段 (日期, 文件)
+        self.written = 0
+
+    def segment_path(self, day):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{day.isoformat()}{SEGMENT_SUFFIX}")
+
+    # ---------- 写入 ----------
+
+    def record(self, group_id, user_id, text, command="", query="", group_name="", nickname="",
+               message_id=None, created=None):
+        """记录一条群消息（在事件循环中调用），command 为空表示普通消息"""
+        self._pending.append({
+            'time': int(created if created is not None else time.time()),
+            'group_id': _to_int(group_id),
+            'group_name': group_name,
+            'user_id': _to_int(user_id),
+            'nickname': nickname,
+            'message_id': message_id,
+            'command': command,
+            'query': query[:MAX_QUERY_CHARS],
+            'text': text
+        })
+        if len(self._pending) >= self.batch_size:
+            self._submit()
+        elif self._timer is None:
+            self._timer = call_later(self.flush_interval, self._submit)
+
+    def _submit(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self._executor.submit(self._write_logged, batch)
+
+    def _write_logged(self, batch):
+        try:
+            self.write(batch)
+        except Exception as e:
+            print(f"{Colors.ERROR}写入消息历史失败: {e}{Colors.RESET}")
+            get_global_error_logger().error(f"写入消息历史失败 - 丢失 {len(batch)} 条消息, 错误: {e}")
+
+    def _segment_file(self, day):
+        if self._segment is None or self._segment[0] != day:
+            self._close_segment()
+            self._segment = (day, open(self.segment_path(day), "ab"))
+        return self._segment[1]
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment[1].close()
+            self._segment = None
+
+    def write(self, records):
+        """在调用线程中同步写入一批记录：追加到当天的 JSONL 分段并写入索引"""
+        rows = []
+        for item in records:
+            day = datetime.fromtimestamp(item['time']).date()
+            segment = self._segment_file(day)
+            offset = segment.tell()
+            segment.write(codec.dumps(item).encode("utf-8") + b"\n")
+            rows.append((item['time'], item['group_id'], item['user_id'], item['command'], item['query'],
+                         _day_number(day), offset))
+        if self._segment is not None:
+            self._segment[1].flush()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO messages (time, group_id, user_id, command, query, day, offset) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+        self.written += len(rows)
+
+    def rebuild(self):
+        """清空索引，按 JSONL 分段重新建立，返回索引的消息数"""
+        self._close_segment()
+        with self._lock:
+            self._conn.execute("DELETE FROM messages")
+            total = 0
+            for name in sorted(os.listdir(self.directory)):
+                if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                    continue
+                try:
+                    day = date.fromisoformat(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                except ValueError:
+                    continue
+                rows = []
+                offset = 0
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    for line in f:
+                        try:
+                            item = codec.loads(line)
+                            rows.append((item['time'], item['group_id'], item['user_id'], item['command'],
+                                         item['query'], _day_number(day), offset))
+                        except (ValueError, KeyError, TypeError):
+                            pass  # 写入中断留下的不完整行
+                        offset += len(line)
+                self._conn.executemany(
+                    "INSERT INTO messages (time, group_id, user_id, command, query, day, offset) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                total += len(rows)
+            self._conn.commit()
+        return total
+
+    def close(self):
+        """写完缓冲区中的消息并关闭文件"""
+        self._submit()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._close_segment()
+        with self._lock:
+            self._conn.close()
+
+    # ---------- 查询 ----------
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def top_queries(self, command, since, group_id=None, limit=10):
+        """since 之后某个指令最常见的参数，返回 {群号: [(参数, 次数)]}，各群按次数从高到低取前 limit 个"""
+        sql = "SELECT group_id, query, COUNT(*) AS n FROM messages WHERE command = ? AND time >= ?"
+        params = [command, int(since)]
+        if group_id is not None:
+            sql += " AND group_id = ?"
+            params.append(_to_int(group_id))
+        sql += " GROUP BY group_id, query ORDER BY group_id, n DESC, query"
+        result = {}
+        for group, query, count in self._query(sql, params):
+            items = result.setdefault(group, [])
+            if len(items) < limit:
+                items.append((query, count))
+        return result
+
+    def hourly(self, since, group_id=None, command=None):
+        """since 之后各小时（本地时间 0~23 点）的消息数"""
+        sql = "SELECT CAST(strftime('%H', time, 'unixepoch', 'localtime') AS INTEGER), COUNT(*) FROM messages WHERE time >= ?"
+        params = [int(since)]
+        if group_id is not None:
+            sql += " AND group_id = ?"
+            params.append(_to_int(group_id))
+        if command is not None:
+            sql += " AND command = ?"
+            params.append(command)
+        counts = [0] * 24
+        for hour, count in self._query(sql + " GROUP BY 1", params):
+            counts[hour] = count
+        return counts
+
+    def top_users(self, since, group_id=None, command=None, limit=10):
+        """since 之后消息最多的用户，返回 [(用户, 次数)]"""
+        sql = "SELECT user_id, COUNT(*) AS n FROM messages WHERE time >= ?"
+        params = [int(since)]
+        if group_id is not None:
+            sql += " AND group_id = ?"
+            params.append(_to_int(group_id))
+        if command is not None:
+            sql += " AND command = ?"
+            params.append(command)
+        sql += " GROUP BY user_id ORDER BY n DESC LIMIT ?"
+        params.append(limit)
+        return self._query(sql, params)
+
+    def recent(self, group_id=None, limit=20):
+        """最近的消息（按时间从早到晚），完整内容从 JSONL 分段读取"""
+        sql = "SELECT day, offset FROM messages"
+        params = []
+        if group_id is not None:
+            sql += " WHERE group_id = ?"
+            params.append(_to_int(group_id))
+        sql += " ORDER BY time DESC, id DESC LIMIT ?"
+        params.append(limit)
+        messages = []
+        files = {}
+        try:
+            for day, offset in reversed(self._query(sql, params)):
+                f = files.get(day)
+                if f is None:
+                    path = self.segment_path(date(day // 10000, day // 100 % 100, day % 100))
+                    f = files[day] = open(path, "rb")
+                f.seek(offset)
+                messages.append(codec.loads(f.readline()))
+        finally:
+            for f in files.values():
+                f.close()
+        return messages
+
+    def count(self):
+        return self._query("SELECT COUNT(*) FROM messages", ())[0][0]
+
+
+# 全局消息历史存储，通过 init_history 初始化；关闭时为 None，record_message 什么也不做
+history_store = None
+
+
+def get_history_store():
+    return history_store
+
+
+def init_history(config):
+    """根据配置打开消息历史存储"""
+    global history_store
+    history_config = config.get("history", {})
+    if not history_config.get("enabled", True):
+        return
+    history_store = HistoryStore(
+        directory=history_config.get("dir", DEFAULT_DIR),
+        batch_size=history_config.get("batch_size", 200),
+        flush_interval=history_config.get("flush_interval", 2.0)
+    )
+
+
+def close_history():
+    global history_store
+    if history_store is not None:
+        history_store.close()
+        history_store = None
+
+
+def record_message(group_id, user_id, text, command="", query="", group_name="", nickname="",
+                   message_id=None, created=None):
+    """记录一条群消息，未启用消息历史时什么也不做"""
+    if history_store is not None:
+        history_store.record(group_id, user_id, text, command, query, group_name, nickname, message_id, created)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="群消息历史查询")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="消息历史目录")
+    sub = parser.add_subparsers(dest="action", required=True)
+    top_parser = sub.add_parser("top", help="某个指令最常见的参数（例如查询最多的 Wiki 条目）")
+    top_parser.add_argument("--command", default="wiki", help="指令名称，例如 wiki、ai_chat、smapi，默认 wiki")
+    users_parser = sub.add_parser("users", help="发言最多的用户")
+    users_parser.add_argument("--command", help="只统计某个指令")
+    hours_parser = sub.add_parser("hours", help="各小时的消息数")
+    hours_parser.add_argument("--command", help="只统计某个指令")
+    for sub_parser in (top_parser, users_parser, hours_parser):
+        sub_parser.add_argument("--days", type=float, default=7, help="统计最近多少天，默认 7")
+        sub_parser.add_argument("--group", type=int, help="只统计某个群")
+    for sub_parser in (top_parser, users_parser):
+        sub_parser.add_argument("--limit", type=int, default=10)
+    show_parser = sub.add_parser("show", help="最近的消息")
+    show_parser.add_argument("--group", type=int, help="只显示某个群")
+    show_parser.add_argument("--limit", type=int, default=20)
+    sub.add_parser("rebuild", help="从 JSONL 分段重建索引")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.dir)
+    try:
+        started = time.perf_counter()
+        since = time.time() - getattr(args, "days", 0) * 86400
+        if args.action == "top":
+            result = store.top_queries(args.command, since, args.group, args.limit)
+            if not result:
+                print("没有记录")
+            for group_id, items in result.items():
+                print(f"群 {group_id}:")
+                for query, count in items:
+                    print(f"  {count:>6}  {query}")
+        elif args.action == "users":
+            for user_id, count in store.top_users(since, args.group, args.command, args.limit):
+                print(f"{count:>8}  {user_id}")
+        elif args.action == "hours":
+            counts = store.hourly(since, args.group, args.command)
+            peak = max(counts) or 1
+            for hour, count in enumerate(counts):
+                print(f"{hour:02d}:00  {count:>8}  {'#' * round(count / peak * 40)}")
+        elif args.action == "show":
+            for item in store.recent(args.group, args.limit):
+                created = datetime.fromtimestamp(item['time']).strftime("%Y-%m-%d %H:%M:%S")
+                command = f" [{item['command']}]" if item['command'] else ""
+                print(f"{created} 群 {item['group_id']} | {item['nickname']}({item['user_id']}){command}: {item['text']}")
+        elif args.action == "rebuild":
+            print(f"已重建索引，消息数: {store.rebuild()}")
+        print(f"耗时: {(time.perf_counter() - started) * 1000:.1f} 毫秒")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
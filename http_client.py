@@ -0,0 +1,50 @@
+import asyncio
+import aiohttp
+
+# 全局 HTTP 会话，通过 init_http 初始化
+session = None
+http_config = {}
+
+
+def _create_session():
+    connector = aiohttp.TCPConnector(
+        limit=http_config.get("limit", 100),
+        limit_per_host=http_config.get("limit_per_host", 10),
+        ttl_dns_cache=http_config.get("dns_cache_ttl", 300),
+        keepalive_timeout=http_config.get("keepalive_timeout", 60)
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=http_config.get("timeout", 30),
+        connect=http_config.get("connect_timeout", 10)
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_session():
+    """
+    获取全局共享的 aiohttp 会话
+
+    所有对外 HTTP 请求共用同一个连接池，复用 keep-alive 连接、DNS 缓存和 TLS 会话。
+    使用方不要关闭返回的会话，也不要用 async with 包裹它。
+    """
+    global session
+    if session is None or session.closed:
+        session = _create_session()
+    return session
+
+
+def init_http(config):
+    """根据配置创建全局 HTTP 会话"""
+    global http_config, session
+    http_config = config.get("http", {})
+    session = _create_session()
+
+
+async def close_http():
+    """关闭全局 HTTP 会话"""
+    global session
+    if session is not None and not session.closed:
+        await session.close()
+        # 等待底层 SSL 连接关闭，避免退出时的警告
+        await asyncio.sleep(0.25)
+    session = None
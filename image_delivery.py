@@ -0,0 +1,120 @@
+import os
+import secrets
+import time
+from pathlib import Path
+from aiohttp import web
+from logger import Colors, get_global_error_logger
+
+
+class ImageDelivery:
+    """
+    图片发送方式
+
+    - file: llbot 与机器人在同一台机器上，直接发送 file:// 路径，由 llbot 读取文件
+    - http: 机器人启动一个只读文件服务，发送限时有效的下载地址，由 llbot 下载
+    - base64: 图片编码后放进消息（原来的方式）
+
+    http 模式只对登记过的文件生成地址，地址在 ttl 秒后失效，不会暴露目录中的其它文件。
+    """
+
+    def __init__(self, mode="base64", host="127.0.0.1", port=8765, public_url=None, ttl=600):
+        self.mode = mode
+        self.host = host
+        self.port = port
+        self.public_url = (public_url or f"http://{host}:{port}").rstrip("/")
+        self.ttl = ttl
+        self._tokens = {}  # {token: (path, 过期时间)}
+        self._paths = {}  # {path: token}
+        self._runner = None
+
+    async def start(self):
+        if self.mode != "http" or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/images/{token}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"{Colors.INFO}图片文件服务已启动 - {self.public_url}{Colors.RESET}")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        # 地址末尾的扩展名只是给下载方识别格式用的
+        item = self._tokens.get(request.match_info["token"].split(".", 1)[0])
+        if item is None or item[1] < time.monotonic() or not os.path.exists(item[0]):
+            raise web.HTTPNotFound()
+        return web.FileResponse(item[0], headers={"Cache-Control": "no-store"})
+
+    def _register(self, path):
+        now = time.monotonic()
+        for token in [t for t, (_, expires) in self._tokens.items() if expires < now]:
+            del self._paths[self._tokens.pop(token)[0]]
+        token = self._paths.get(path)
+        if token is None:
+            token = secrets.token_urlsafe(16)
+            self._paths[path] = token
+        self._tokens[token] = (path, now + self.ttl)
+        return token
+
+    def reference(self, image_path):
+        """返回发给 llbot 的图片地址；base64 模式返回 None，由调用方内联图片"""
+        path = os.path.abspath(image_path)
+        if self.mode == "file":
+            return Path(path).as_uri()
+        if self.mode == "http":
+            return f"{self.public_url}/images/{self._register(path)}{os.path.splitext(path)[1]}"
+        return None
+
+
+# 全局图片发送方式，通过 init_image_delivery 初始化；为 None 时使用 base64
+image_delivery = None
+
+
+def get_image_delivery():
+    return image_delivery
+
+
+def _auto_mode(config, delivery_config):
+    """
+    auto：配置了 public_url 时使用文件服务，否则使用 base64
+
+    不会自动选择 file：llbot 运行在 Docker / WSL 中并通过端口转发连接时，ip 同样是本机地址，
+    但机器人的文件路径在 llbot 中不存在，图片会发送失败；file 需要明确配置。
+    """
+    if delivery_config.get("public_url"):
+        return "http"
+    return "base64"
+
+
+async def init_image_delivery(config):
+    """根据配置选择图片发送方式，http 模式下启动文件服务"""
+    global image_delivery
+    delivery_config = config.get("image_delivery", {})
+    mode = delivery_config.get("mode", "auto")
+    if mode == "auto":
+        mode = _auto_mode(config, delivery_config)
+    image_delivery = ImageDelivery(
+        mode=mode,
+        host=delivery_config.get("host", "127.0.0.1"),
+        port=delivery_config.get("port", 8765),
+        public_url=delivery_config.get("public_url"),
+        ttl=delivery_config.get("ttl", 600)
+    )
+    try:
+        await image_delivery.start()
+    except OSError as e:
+        print(f"{Colors.ERROR}图片文件服务启动失败，改用 base64 发送图片: {e}{Colors.RESET}")
+        get_global_error_logger().error(f"图片文件服务启动失败 - 错误: {e}")
+        image_delivery.mode = "base64"
+    print(f"{Colors.INFO}图片发送方式: {image_delivery.mode}{Colors.RESET}")
+
+
+async def close_image_delivery():
+    global image_delivery
+    if image_delivery is not None:
+        await image_delivery.close()
+        image_delivery = None
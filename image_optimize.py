@@ -0,0 +1,170 @@
+import asyncio
+import io
+import os
+import time
+from logger import Colors, get_wiki_logger
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 格式名 -> (Pillow 格式, 扩展名, 是否有损)
+FORMATS = {
+    "png": ("PNG", ".png", False),
+    "webp": ("WEBP", ".webp", True),
+    "jpeg": ("JPEG", ".jpg", True),
+}
+
+
+class ImageOptimizer:
+    """
+    发送前的图片压缩
+
+    按 缩放比例 -> 格式 -> 质量 的顺序依次尝试，取第一个不超过 max_bytes 的编码结果，
+    都超出时取其中最小的一个。截图本身已经不超过预算时直接使用原图。
+    """
+
+    def __init__(self, max_bytes=512 * 1024, max_width=1200, formats=("png", "webp", "jpeg"),
+                 qualities=(85, 75, 60), min_scale=0.5, bandwidth_mbps=10):
+        self.max_bytes = max_bytes
+        self.max_width = max_width
+        self.formats = [name for name in formats if name in FORMATS]
+        self.qualities = list(qualities)
+        self.min_scale = min_scale
+        self.bandwidth_mbps = bandwidth_mbps
+
+    @property
+    def signature(self):
+        """压缩参数的标识，参数变化后旧的压缩结果不再使用"""
+        return f"{self.max_bytes}|{self.max_width}|{','.join(self.formats)}|{self.qualities}|{self.min_scale}"
+
+    def _scales(self, width):
+        """候选缩放比例：先缩到 max_width 以内，再逐步缩小到 min_scale"""
+        base = min(1.0, self.max_width / width) if self.max_width else 1.0
+        scales = [base]
+        for factor in (0.85, 0.7, 0.6, 0.5):
+            scale = base * factor
+            if scale < self.min_scale:
+                break
+            scales.append(scale)
+        return scales
+
+    def _encode(self, image, name, quality):
+        pil_format = FORMATS[name][0]
+        buffer = io.BytesIO()
+        if name == "png":
+            # 截图颜色少，调色板 PNG 通常只有原图的几分之一
+            image.quantize(colors=256, method=Image.Quantize.FASTOCTREE).save(buffer, format=pil_format, optimize=True)
+        elif name == "jpeg":
+            image.save(buffer, format=pil_format, quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(buffer, format=pil_format, quality=quality, method=4)
+        return buffer.getvalue()
+
+    def encode(self, source_path):
+        """
+        同步执行压缩，返回 (编码后的字节, 扩展名, 说明)；原图已满足预算或没有可用的格式时返回 (None, None, 说明)
+        """
+        source_size = os.path.getsize(source_path)
+        with Image.open(source_path) as source:
+            if source_size <= self.max_bytes and (not self.max_width or source.width <= self.max_width):
+                return None, None, {'format': "original", 'scale': 1.0, 'quality': None}
+            # 截图背景不透明，统一转为 RGB，JPEG 也能直接使用
+            image = source.convert("RGB")
+
+        best = None
+        best_scale = None
+        scales = self._scales(image.width)
+        for scale in scales:
+            # 编码大小大致与像素数成正比，预计仍超出预算的比例直接跳过（最小比例总会尝试）
+            if best is not None and scale != scales[-1] and len(best[0]) * (scale / best_scale) ** 2 > self.max_bytes:
+                continue
+            if scale < 1.0:
+                size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                scaled = image.resize(size, Image.LANCZOS)
+            else:
+                scaled = image
+            for name in self.formats:
+                for quality in (self.qualities if FORMATS[name][2] else [None]):
+                    data = self._encode(scaled, name, quality)
+                    info = {'format': name, 'scale': round(scale, 3), 'quality': quality}
+                    if best is None or len(data) < len(best[0]):
+                        best = (data, FORMATS[name][1], info)
+                        best_scale = scale
+                    if len(data) <= self.max_bytes:
+                        return data, FORMATS[name][1], info
+        if best is None:
+            # formats 中没有可用的格式（或有损格式没有配置质量），直接使用原图
+            return None, None, {'format': "original", 'scale': 1.0, 'quality': None}
+        return best
+
+    def transfer_seconds(self, size):
+        """按 base64 编码后的大小估算通过 WebSocket 发送所需时间"""
+        if not self.bandwidth_mbps:
+            return 0.0
+        return (size + 2) // 3 * 4 * 8 / (self.bandwidth_mbps * 1000 * 1000)
+
+    async def optimize(self, full_url, source_path, cache):
+        """
+        返回要发送的图片路径
+
+        压缩结果作为截图缓存条目的附属文件保存，同一张截图只压缩一次；截图被替换或淘汰时一起删除。
+        """
+        logger = get_wiki_logger()
+        cached_path = cache.get_variant(full_url, self.signature)
+        if cached_path is not None:
+            return cached_path
+
+        started = time.perf_counter()
+        # 解码、缩放和编码都是 CPU 操作，放到线程中执行
+        data, ext, info = await asyncio.to_thread(self.encode, source_path)
+        elapsed = time.perf_counter() - started
+        source_size = os.path.getsize(source_path)
+        if data is None or len(data) >= source_size:
+            cache.put_variant(full_url, None, None, self.signature)
+            logger.info(f"图片无需压缩 - URL: {full_url}, 大小: {source_size // 1024} KB")
+            return source_path
+
+        temp_path = cache.new_temp_path()
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        path = cache.put_variant(full_url, temp_path, ext, self.signature)
+        saved = self.transfer_seconds(source_size) - self.transfer_seconds(len(data))
+        logger.info(
+            f"图片压缩完成 - URL: {full_url}, {source_size // 1024} KB -> {len(data) // 1024} KB, "
+            f"格式: {info['format']}, 缩放: {info['scale']}, 质量: {info['quality']}, "
+            f"编码耗时: {elapsed * 1000:.0f} ms, 预计节省发送时间: {saved * 1000:.0f} ms"
+            + ("" if len(data) <= self.max_bytes else f", 仍超出预算 {self.max_bytes // 1024} KB")
+        )
+        return path
+
+
+# 全局图片压缩器，通过 init_image_optimizer 初始化；未启用或缺少 Pillow 时为 None，直接发送原图
+image_optimizer = None
+
+
+def get_image_optimizer():
+    return image_optimizer
+
+
+def init_image_optimizer(config):
+    """根据配置创建图片压缩器"""
+    global image_optimizer
+    output_config = config.get("image_output", {})
+    image_optimizer = None
+    if not output_config.get("enabled", True):
+        return
+    if Image is None:
+        print(f"{Colors.ERROR}未安装 Pillow，Wiki 截图将以原图发送{Colors.RESET}")
+        return
+    image_optimizer = ImageOptimizer(
+        max_bytes=output_config.get("max_kb", 512) * 1024,
+        max_width=output_config.get("max_width", 1200),
+        formats=output_config.get("formats", ["png", "webp", "jpeg"]),
+        qualities=output_config.get("qualities", [85, 75, 60]),
+        min_scale=output_config.get("min_scale", 0.5),
+        bandwidth_mbps=output_config.get("bandwidth_mbps", 10)
+    )
+    if not image_optimizer.formats:
+        print(f"{Colors.ERROR}image_output.formats 中没有可用的格式（可选 {', '.join(FORMATS)}），Wiki 截图将以原图发送{Colors.RESET}")
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import io
+import os
+from urllib.parse import urljoin
+from logger import Colors, get_wiki_logger
+from http_client import get_session
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = ImageDraw = ImageFont = None
+
+# 常见系统中的中文字体，未配置 font_path 时依次尝试
+FONT_CANDIDATES = [
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+]
+
+# 仿照 Wiki 信息框的配色
+BACKGROUND = (255, 244, 214)
+BORDER = (164, 120, 66)
+HEADER_BACKGROUND = (232, 190, 120)
+ROW_LINE = (222, 196, 150)
+SECTION_COLOR = (110, 66, 20)
+TEXT_COLOR = (40, 30, 20)
+
+# 单个栏目内容超过这个长度时版式不好看，交给浏览器截图
+MAX_DETAIL_CHARS = 300
+MAX_ROWS = 40
+
+
+class RenderUnsupported(Exception):
+    """轻量渲染器无法处理该信息框，需要回退到浏览器截图"""
+
+
+class InfoboxRenderer:
+    """
+    不依赖浏览器的信息框渲染器
+
+    直接用已解析的信息框（标题、主图、栏目/内容）按 Wiki 的样式绘制 PNG，
+    主图下载后缓存在 icon_dir 中。
+    """
+
+    def __init__(self, font_path=None, icon_dir=os.path.join("assets", "icons"), width=430, scale=2):
+        self.font_path = font_path
+        self.icon_dir = icon_dir
+        self.width = width
+        self.scale = scale
+        self._fonts = {}
+
+    def _find_font(self):
+        if self.font_path:
+            return self.font_path if os.path.exists(self.font_path) else None
+        for path in FONT_CANDIDATES:
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _font(self, size):
+        if size not in self._fonts:
+            self._fonts[size] = ImageFont.truetype(self._find_font(), size * self.scale)
+        return self._fonts[size]
+
+    def check(self, data):
+        """检查能否渲染，不能时抛出 RenderUnsupported"""
+        if Image is None:
+            raise RenderUnsupported("未安装 Pillow")
+        if self._find_font() is None:
+            raise RenderUnsupported("找不到中文字体，请配置 wiki_render.font_path")
+        if not data.get('has_infobox') or not data.get('rows'):
+            raise RenderUnsupported("页面没有信息框")
+        if len(data['rows']) > MAX_ROWS:
+            raise RenderUnsupported(f"信息框行数过多（{len(data['rows'])}）")
+        for section, detail in data['rows']:
+            if len(detail) > MAX_DETAIL_CHARS:
+                raise RenderUnsupported(f"栏目 {section} 内容过长")
+
+    # ---------- 图标 ----------
+
+    async def _load_icon(self, src, base_url):
+        """下载并缓存主图，失败时返回 None（不影响其它内容的渲染）"""
+        if not src:
+            return None
+        icon_url = urljoin(base_url + "/", src)
+        name = hashlib.sha1(icon_url.encode('utf-8')).hexdigest()
+        path = os.path.join(self.icon_dir, name)
+        if not os.path.exists(path):
+            try:
+                async with get_session().get(icon_url) as resp:
+                    if resp.status != 200:
+                        return None
+                    content = await resp.read()
+            except Exception as e:
+                get_wiki_logger().warning(f"下载信息框图片失败 - URL: {icon_url}, 错误: {e}")
+                return None
+            os.makedirs(self.icon_dir, exist_ok=True)
+            tmp_path = path + ".part"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return path
+
+    # ---------- 排版 ----------
+
+    @staticmethod
+    def _wrap(draw, text, font, max_width):
+        """按像素宽度逐字换行，兼容中英文混排"""
+        lines = []
+        line = ""
+        for char in text:
+            if draw.textlength(line + char, font=font) <= max_width:
+                line += char
+                continue
+            # 英文单词尽量不从中间断开
+            if char != " " and " " in line and line[-1] != " ":
+                head, tail = line.rsplit(" ", 1)
+                if draw.textlength(tail + char, font=font) <= max_width:
+                    lines.append(head)
+                    line = tail + char
+                    continue
+            lines.append(line.rstrip())
+            line = char.lstrip()
+        if line:
+            lines.append(line)
+        return lines or [""]
+
+    def _draw(self, data, icon_path, output_path):
+        s = self.scale
+        width = self.width * s
+        padding = 8 * s
+        section_width = int(width * 0.3)
+        detail_x = section_width + padding
+        detail_width = width - detail_x - padding
+        title_font = self._font(20)
+        text_font = self._font(14)
+        line_height = int(text_font.size * 1.45)
+
+        measure = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+        title_lines = self._wrap(measure, data['title'], title_font, width - 2 * padding)
+        title_height = len(title_lines) * int(title_font.size * 1.3) + 2 * padding
+
+        icon = None
+        if icon_path:
+            try:
+                icon = Image.open(icon_path).convert("RGBA")
+                # 像素风图标按整数倍放大，保持清晰
+                factor = max(1, min(int(96 * s / max(icon.width, icon.height)), 4 * s))
+                icon = icon.resize((icon.width * factor, icon.height * factor), Image.NEAREST)
+            except Exception:
+                icon = None
+        icon_height = icon.height + 2 * padding if icon else 0
+
+        rows = []
+        for section, detail in data['rows']:
+            section_lines = self._wrap(measure, section, text_font, section_width - 2 * padding)
+            detail_lines = self._wrap(measure, detail, text_font, detail_width)
+            height = max(len(section_lines), len(detail_lines)) * line_height + padding
+            rows.append((section_lines, detail_lines, height))
+        height = title_height + icon_height + sum(row[2] for row in rows) + padding // 2 + 2 * s
+
+        image = Image.new("RGB", (width, height), BACKGROUND)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([0, 0, width - 1, title_height], fill=HEADER_BACKGROUND)
+        y = padding
+        for line in title_lines:
+            line_width = draw.textlength(line, font=title_font)
+            draw.text(((width - line_width) / 2, y), line, font=title_font, fill=TEXT_COLOR)
+            y += int(title_font.size * 1.3)
+        y = title_height
+        if icon:
+            y += padding
+            image.paste(icon, ((width - icon.width) // 2, y), icon)
+            y += icon.height + padding
+        for section_lines, detail_lines, row_height in rows:
+            draw.line([padding, y, width - padding, y], fill=ROW_LINE, width=s)
+            line_y = y + padding // 2
+            for line in section_lines:
+                draw.text((padding, line_y), line, font=text_font, fill=SECTION_COLOR)
+                line_y += line_height
+            line_y = y + padding // 2
+            for line in detail_lines:
+                draw.text((detail_x, line_y), line, font=text_font, fill=TEXT_COLOR)
+                line_y += line_height
+            y += row_height
+        draw.rectangle([0, 0, width - 1, height - 1], outline=BORDER, width=2 * s)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+        with open(output_path, 'wb') as f:
+            f.write(buffer.getvalue())
+
+    async def render(self, data, base_url, output_path):
+        """把信息框渲染为 PNG 写入 output_path，无法处理时抛出 RenderUnsupported"""
+        self.check(data)
+        icon_path = await self._load_icon(data.get('image'), base_url)
+        # 绘制是纯 CPU 操作，放到线程中执行，避免阻塞事件循环
+        await asyncio.to_thread(self._draw, data, icon_path, output_path)
+        return output_path
+
+
+# 全局渲染器和渲染方式，通过 init_renderer 初始化
+renderer = None
+render_backend = "playwright"
+
+
+def get_renderer():
+    """获取全局渲染器，未初始化时使用默认配置"""
+    global renderer
+    if renderer is None:
+        renderer = InfoboxRenderer()
+    return renderer
+
+
+def init_renderer(config):
+    """根据配置选择截图方式：playwright（浏览器截图）或 pillow（轻量渲染，失败时回退浏览器）"""
+    global renderer, render_backend
+    render_config = config.get("wiki_render", {})
+    render_backend = render_config.get("backend", "playwright")
+    renderer = InfoboxRenderer(
+        font_path=render_config.get("font_path"),
+        icon_dir=render_config.get("icon_dir", os.path.join("assets", "icons")),
+        width=render_config.get("width", 430),
+        scale=render_config.get("scale", 2)
+    )
+    if render_backend == "pillow":
+        if Image is None:
+            print(f"{Colors.ERROR}未安装 Pillow，Wiki 图片将使用浏览器截图{Colors.RESET}")
+        elif renderer._find_font() is None:
+            print(f"{Colors.ERROR}找不到中文字体，Wiki 图片将使用浏览器截图，请配置 wiki_render.font_path{Colors.RESET}")
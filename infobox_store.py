@@ -0,0 +1,234 @@
+"""
+本地信息框存储
+
+把条目信息框（标题、描述、栏目/内容）保存在 SQLite 中，wiki.get_infobox_text 直接从这里读取，
+过期的条目在后台增量刷新。可以通过批量导入预先填充：
+
+    python infobox_store.py ingest                     # 导入本地搜索索引中所有带信息框的条目
+    python infobox_store.py ingest --category 物品      # 导入分类下的条目（可重复指定）
+    python infobox_store.py show <条目链接或标题>
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from screenshot_cache import normalize_wiki_url
+
+DEFAULT_DB_PATH = os.path.join("data", "infobox.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS infobox (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    has_infobox INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    image TEXT NOT NULL DEFAULT ''
+)
+"""
+
+
+class InfoboxStore:
+    """以规范化条目链接为键的信息框存储，读取结果与 wiki.extract_infobox 的返回值一致"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, ttl=86400):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self.ttl = ttl
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        # 旧版本的存储没有 image 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(infobox)")}
+        if "image" not in columns:
+            self._conn.execute("ALTER TABLE infobox ADD COLUMN image TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def get(self, full_url):
+        """返回 {'title', 'description', 'rows', 'has_infobox', 'image', 'fetched_at'}，不存在时返回 None"""
+        row = self._conn.execute(
+            "SELECT title, description, rows, has_infobox, fetched_at, image FROM infobox WHERE key = ?",
+            (normalize_wiki_url(full_url),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'title': row[0],
+            'description': row[1],
+            'rows': json.loads(row[2]),
+            'has_infobox': bool(row[3]),
+            'image': row[5],
+            'fetched_at': row[4]
+        }
+
+    def is_stale(self, entry):
+        return time.time() - entry['fetched_at'] > self.ttl
+
+    def put(self, full_url, data):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO infobox (key, url, title, description, rows, has_infobox, fetched_at, image) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (normalize_wiki_url(full_url), full_url, data['title'], data['description'],
+             json.dumps(data['rows'], ensure_ascii=False, separators=(',', ':')),
+             int(data['has_infobox']), time.time(), data.get('image', ""))
+        )
+        self._conn.commit()
+
+    def delete(self, full_url):
+        self._conn.execute("DELETE FROM infobox WHERE key = ?", (normalize_wiki_url(full_url),))
+        self._conn.commit()
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM infobox").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+# 全局信息框存储，通过 init_infobox_store 初始化；关闭后为 None，get_infobox_text 直接在线获取
+infobox_store = None
+
+
+def get_infobox_store():
+    return infobox_store
+
+
+def init_infobox_store(config):
+    """根据配置打开信息框存储"""
+    global infobox_store
+    store_config = config.get("infobox_store", {})
+    if not store_config.get("enabled", True):
+        return
+    infobox_store = InfoboxStore(
+        db_path=store_config.get("path", DEFAULT_DB_PATH),
+        ttl=store_config.get("ttl", 86400)
+    )
+
+
+def close_infobox_store():
+    global infobox_store
+    if infobox_store is not None:
+        infobox_store.close()
+        infobox_store = None
+
+
+async def _category_titles(category):
+    """通过 api.php 列出分类下的全部条目标题"""
+    from http_client import get_session
+    from wiki import url as base_url
+
+    params = {
+        "action": "query",
+        "list": "categorymembers",
+        "cmtitle": category if category.startswith(("Category:", "分类:")) else f"Category:{category}",
+        "cmnamespace": "0",
+        "cmlimit": "500",
+        "format": "json"
+    }
+    titles = []
+    while True:
+        async with get_session().get(base_url + "/api.php", params=params) as resp:
+            data = await resp.json(content_type=None)
+        titles.extend(member['title'] for member in data.get("query", {}).get("categorymembers", []))
+        cont = data.get("continue")
+        if not cont:
+            return titles
+        params.update(cont)
+
+
+async def ingest(titles, store, concurrency=4, skip_fresh=True):
+    """批量获取条目信息框写入存储，返回 (成功数, 失败数)"""
+    import wiki
+    from wiki_index import page_url
+
+    semaphore = asyncio.Semaphore(concurrency)
+    done = failed = 0
+
+    async def _ingest_one(title):
+        nonlocal done, failed
+        full_url = page_url(wiki.url, title)
+        entry = store.get(full_url)
+        if skip_fresh and entry is not None and not store.is_stale(entry):
+            return
+        async with semaphore:
+            data = await wiki.fetch_infobox(full_url)
+        if data is None:
+            failed += 1
+            return
+        store.put(full_url, data)
+        done += 1
+        if done % 50 == 0:
+            print(f"已导入 {done} 个条目")
+
+    await asyncio.gather(*(_ingest_one(title) for title in titles))
+    return done, failed
+
+
+async def _ingest_main(args):
+    from http_client import close_http
+    from wiki_index import WikiIndex
+
+    store = InfoboxStore(args.db)
+    try:
+        titles = []
+        if args.category:
+            for category in args.category:
+                titles.extend(await _category_titles(category))
+        else:
+            index = WikiIndex(args.index)
+            titles = index.titles_with_infobox()
+            index.close()
+        titles = list(dict.fromkeys(titles))
+        print(f"待导入条目: {len(titles)}")
+        started = time.perf_counter()
+        done, failed = await ingest(titles, store, args.concurrency, not args.force)
+        print(f"导入完成 - 成功: {done}, 失败: {failed}, 存储条目: {store.count()}, "
+              f"耗时: {time.perf_counter() - started:.1f} 秒")
+    finally:
+        store.close()
+        await close_http()
+
+
+def main(argv=None):
+    from wiki_index import DEFAULT_DB_PATH as DEFAULT_INDEX_PATH
+
+    parser = argparse.ArgumentParser(description="本地信息框存储")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = sub.add_parser("ingest", help="批量导入条目信息框")
+    ingest_parser.add_argument("--category", action="append", help="导入分类下的条目，可重复指定")
+    ingest_parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="未指定分类时，从本地搜索索引读取条目列表")
+    ingest_parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    ingest_parser.add_argument("--concurrency", type=int, default=4)
+    ingest_parser.add_argument("--force", action="store_true", help="重新获取未过期的条目")
+    show_parser = sub.add_parser("show", help="查看存储中的条目")
+    show_parser.add_argument("page", help="条目链接或标题")
+    show_parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        asyncio.run(_ingest_main(args))
+    elif args.command == "show":
+        import wiki
+        from wiki_index import page_url
+
+        full_url = args.page if args.page.startswith("http") else page_url(wiki.url, args.page)
+        store = InfoboxStore(args.db)
+        entry = store.get(full_url)
+        store.close()
+        if entry is None:
+            print("存储中没有该条目")
+            return 1
+        print(wiki.format_infobox(entry))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
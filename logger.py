@@ -1,6 +1,15 @@
+import atexit
+import gzip
 import logging
 import os
-from datetime import datetime
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as day_time, timedelta
 from pathlib import Path
 
 # ANSI颜色代码
@@ -26,9 +35,337 @@ if os.name == 'nt':
 LOG_DIR = Path("logs")
 LOG_DIR.mkdir(exist_ok=True)
 
+# 按日期命名的日志文件：前缀_YYYY-MM-DD.log，压缩后为 .log.gz
+LOG_NAME = re.compile(r"^.+_(\d{4}-\d{2}-\d{2})\.log(\.gz)?$")
+
+# 写文件、切换日期和关闭文件都在这个锁内进行（后台写入线程和同步写入共用）
+_write_lock = threading.RLock()
+_open_handlers = OrderedDict()  # 当前打开着文件的 DailyFileHandler，最近写入的在末尾
+_next_midnight = 0.0
+_maintenance_executor = None
+_maintenance_stop = threading.Event()
+
+# 零点后等待多久再压缩前一天的日志：零点前产生、还在队列中的记录先写进前一天的文件
+COMPRESS_GRACE = 60
+
+# 日志文件管理参数，通过 init_logging 修改
+max_open_files = 64
+compress_logs = True
+retention_days = 30
+max_total_bytes = 0  # 0 表示不限制
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, day_time.min)
+    return start.timestamp(), (start + timedelta(days=1)).timestamp()
+
+
+class DailyFileHandler(logging.Handler):
+    """
+    按日期写入 directory/prefix_YYYY-MM-DD.log，日期由记录的创建时间决定，跨过零点自动写入新文件
+
+    文件在写入时才打开；打开的文件总数超过 max_open_files 时关闭最久未写入的文件，需要时再以追加方式打开，
+    群很多时也不会占满文件描述符。
+    """
+
+    def __init__(self, directory, prefix, level=logging.NOTSET):
+        super().__init__(level)
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.stream = None
+        self.path = None
+        self._day_start = self._day_end = 0.0
+        self._day_path = None
+
+    def path_for(self, created):
+        """记录所属日期的文件路径（同一天内直接返回缓存的路径）"""
+        if not self._day_start <= created < self._day_end:
+            day = datetime.fromtimestamp(created).date()
+            self._day_start, self._day_end = _day_bounds(day)
+            self._day_path = self.directory / f"{self.prefix}_{day.isoformat()}.log"
+        return self._day_path
+
+    def write(self, path, text):
+        """在 _write_lock 内调用"""
+        if self.stream is None or self.path != path:
+            self.close_stream()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.stream = open(path, "a", encoding="utf-8")
+            self.path = path
+            _open_handlers[self] = None
+            while len(_open_handlers) > max_open_files:
+                next(iter(_open_handlers)).close_stream()
+        else:
+            _open_handlers.move_to_end(self)
+        self.stream.write(text)
+        self.stream.flush()
+
+    def close_stream(self):
+        """关闭文件（之后写入时重新打开）"""
+        with _write_lock:
+            if self.stream is not None:
+                try:
+                    self.stream.close()
+                finally:
+                    self.stream = None
+                    _open_handlers.pop(self, None)
+
+    def emit(self, record):
+        # 同步写入（未启用异步写入或正在退出时）
+        try:
+            text = self.format(record) + "\n"
+            with _write_lock:
+                _check_day(record.created)
+                self.write(self.path_for(record.created), text)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.close_stream()
+        super().close()
+
+
+def _check_day(now):
+    """跨过零点时关闭前一天的文件，并在后台压缩旧日志、清理过期日志；启动后第一次写入时也清理一次"""
+    global _next_midnight
+    if now < _next_midnight:
+        return
+    today = datetime.fromtimestamp(now).date()
+    first_run = _next_midnight == 0.0
+    _next_midnight = _day_bounds(today)[1]
+    today_name = f"_{today.isoformat()}.log"
+    for handler in list(_open_handlers):
+        if not handler.path.name.endswith(today_name):
+            handler.close_stream()
+    _schedule_maintenance(today, 0 if first_run else COMPRESS_GRACE)
+
+
+def _schedule_maintenance(today, delay):
+    global _maintenance_executor
+    if not compress_logs and not retention_days and not max_total_bytes:
+        return
+    if _maintenance_executor is None:
+        _maintenance_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-maintenance")
+    try:
+        _maintenance_executor.submit(_maintain_logs, today, delay)
+    except RuntimeError:
+        # 解释器退出或 close_logging 之后不再安排新的清理任务
+        pass
+
+
+def _compress(path):
+    """
+    压缩为 .log.gz 并删除原文件；已有同名压缩文件时追加为新的 gzip 成员（解压时自动连接）
+
+    在 _write_lock 内进行，压缩期间不会有记录写进这个文件；文件正在写入时跳过，返回 None
+    """
+    with _write_lock:
+        if any(handler.path == path for handler in _open_handlers):
+            return None
+        target = path.with_name(path.name + ".gz")
+        with open(path, "rb") as source, gzip.open(target, "ab") as output:
+            shutil.copyfileobj(source, output)
+        path.unlink()
+        return target
+
+
+def _maintain_logs(today, delay):
+    """在后台线程中压缩今天以前的日志，按保留天数和总大小删除最旧的日志"""
+    if delay and _maintenance_stop.wait(delay):
+        return
+    try:
+        files = []  # [(日期, 路径)]
+        for path in LOG_DIR.rglob("*.log*"):
+            match = LOG_NAME.match(path.name)
+            if not match or not path.is_file():
+                continue
+            try:
+                day = date.fromisoformat(match.group(1))
+            except ValueError:
+                continue
+            if _maintenance_stop.is_set():
+                return
+            if compress_logs and not match.group(2) and day < today:
+                path = _compress(path) or path
+            files.append((day, path))
+        files.sort(key=lambda item: (item[0], str(item[1])))
+        removed = 0
+        if retention_days:
+            cutoff = today - timedelta(days=retention_days)
+            for day, path in [item for item in files if item[0] < cutoff]:
+                path.unlink(missing_ok=True)
+                removed += 1
+            files = [item for item in files if item[0] >= cutoff]
+        if max_total_bytes:
+            sizes = [(day, path, path.stat().st_size) for day, path in files if path.exists()]
+            total = sum(size for _, _, size in sizes)
+            for day, path, size in sizes:
+                # 今天的日志不删除
+                if total <= max_total_bytes or day >= today:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+        if removed:
+            sys.stderr.write(f"{Colors.INFO}已删除 {removed} 个过期日志文件{Colors.RESET}\n")
+    except Exception as e:
+        sys.stderr.write(f"{Colors.ERROR}日志整理失败: {e}{Colors.RESET}\n")
+
+
+class LogPipeline:
+    """
+    异步日志写入
+
+    记录日志时只把记录放进有界队列（不格式化、不写文件），由后台线程成批格式化并写入，
+    每批每个文件只写一次、flush 一次；磁盘变慢时事件循环不会被阻塞。
+    - 队列满时按 overflow 处理：drop_oldest 丢弃最早的记录，drop_new 丢弃新记录，丢弃数量会提示并计入统计
+    - ERROR 及以上的记录或队列超过一半时立即唤醒写入线程，否则每 flush_interval 秒写入一次；
+      每次最多格式化 batch_size 条后写入，大量积压时也分批写出
+    - 退出时（close 或解释器退出）写完队列中剩余的记录
+    """
+
+    def __init__(self, max_queue=10000, batch_size=256, flush_interval=0.5, overflow="drop_oldest"):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.enabled = True
+        self._records = deque()  # (record, targets)，append / popleft 线程安全
+        self._wake = threading.Event()
+        self._thread = None
+        self._closing = False
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self._reported_dropped = 0
+
+    def submit(self, record, targets):
+        if not self.enabled or self._closing:
+            _write_now(record, targets)
+            return
+        records = self._records
+        if len(records) >= self.max_queue:
+            self.dropped += 1
+            if self.overflow == "drop_new":
+                return
+            try:
+                records.popleft()
+            except IndexError:
+                pass
+        records.append((record, targets))
+        if self._thread is None:
+            self._start()
+        if record.levelno >= logging.ERROR or len(records) >= self.max_queue // 2:
+            self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None and not self._closing:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._closing:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """写入队列中当前的全部记录（写入线程和 close 调用）"""
+        records = self._records
+        while records:
+            batch = {}  # {(handler, 文件路径): [格式化后的文本]}
+            for _ in range(min(len(records), self.batch_size)):
+                record, targets = records.popleft()
+                for handler in targets:
+                    if record.levelno >= handler.level and handler.filter(record):
+                        key = (handler, handler.path_for(record.created))
+                        batch.setdefault(key, []).append(handler.format(record) + "\n")
+            with _write_lock:
+                _check_day(time.time())
+                for (handler, path), lines in batch.items():
+                    try:
+                        handler.write(path, "".join(lines))
+                        self.written += len(lines)
+                    except Exception as e:
+                        sys.stderr.write(f"写入日志失败: {path}, 错误: {e}\n")
+        if self.dropped != self._reported_dropped:
+            sys.stderr.write(f"{Colors.ERROR}日志队列已满，共丢弃 {self.dropped} 条日志{Colors.RESET}\n")
+            self._reported_dropped = self.dropped
+
+    def close(self, timeout=5):
+        """停止写入线程并写完剩余记录，之后的日志直接同步写入"""
+        with self._lock:
+            self._closing = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        return {'queued': len(self._records), 'written': self.written, 'dropped': self.dropped}
+
+
+def _write_now(record, targets):
+    """同步写入（未启用异步写入或正在退出时）"""
+    for handler in targets:
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+
+class QueueLogHandler(logging.Handler):
+    """挂在 logger 上的 handler，把记录交给 LogPipeline，由后台线程写入 targets 中的 DailyFileHandler"""
+
+    def __init__(self, pipeline, targets):
+        super().__init__()
+        self.pipeline = pipeline
+        self.targets = tuple(targets)
+
+    def handle(self, record):
+        # 不需要 Handler.handle 的锁和过滤，过滤在写入线程中按各个文件 handler 进行
+        self.pipeline.submit(record, self.targets)
+        return True
+
+    def emit(self, record):
+        self.pipeline.submit(record, self.targets)
+
+
+# 全局日志写入管道，所有日志记录器共用
+pipeline = LogPipeline()
+atexit.register(pipeline.close)
+
+
+def init_logging(config):
+    """根据配置调整日志写入和日志文件管理（日志记录器可能在读取配置前就已创建，这里只修改参数）"""
+    global max_open_files, compress_logs, retention_days, max_total_bytes
+    logging_config = config.get("logging", {})
+    max_open_files = max(1, logging_config.get("max_open_files", 64))
+    compress_logs = logging_config.get("compress", True)
+    retention_days = logging_config.get("retention_days", 30)
+    max_total_bytes = int(logging_config.get("max_total_mb", 0) * 1024 * 1024)
+    pipeline.enabled = logging_config.get("async", True)
+    pipeline.max_queue = logging_config.get("max_queue", 10000)
+    pipeline.batch_size = logging_config.get("batch_size", 256)
+    pipeline.flush_interval = logging_config.get("flush_interval", 0.5)
+    pipeline.overflow = logging_config.get("overflow", "drop_oldest")
+
+
+def close_logging():
+    """写完剩余日志、关闭全部日志文件，停止日志整理（正在压缩的文件会压缩完）"""
+    pipeline.close()
+    with _write_lock:
+        for handler in list(_open_handlers):
+            handler.close_stream()
+    _maintenance_stop.set()
+    if _maintenance_executor is not None:
+        _maintenance_executor.shutdown(wait=True, cancel_futures=True)
+
 # 存储已创建的日志记录器
 loggers = {}
 global_error_logger = None
+stats_logger = None
 wiki_logger = None
 
 def get_global_error_logger():
@@ -39,23 +376,40 @@ def get_global_error_logger():
         logger.setLevel(logging.ERROR)
         
         if not logger.handlers:
-            today = datetime.now().strftime("%Y-%m-%d")
-            error_handler = logging.FileHandler(
-                LOG_DIR / f"global_errors_{today}.log",
-                encoding='utf-8'
-            )
+            error_handler = DailyFileHandler(LOG_DIR, "global_errors")
             error_handler.setLevel(logging.ERROR)
             error_formatter = logging.Formatter(
                 '%(asctime)s - %(levelname)s - %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
             error_handler.setFormatter(error_formatter)
-            logger.addHandler(error_handler)
+            logger.addHandler(QueueLogHandler(pipeline, [error_handler]))
         
         global_error_logger = logger
     
     return global_error_logger
 
+def get_stats_logger():
+    """获取运行统计日志记录器：各模块的队列统计、丢弃和降级等 INFO / WARNING 日志，不混入错误日志"""
+    global stats_logger
+    if stats_logger is None:
+        logger = logging.getLogger("stats")
+        logger.setLevel(logging.INFO)
+
+        if not logger.handlers:
+            stats_handler = DailyFileHandler(LOG_DIR, "stats")
+            stats_handler.setLevel(logging.INFO)
+            stats_formatter = logging.Formatter(
+                '%(asctime)s - %(levelname)s - %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            )
+            stats_handler.setFormatter(stats_formatter)
+            logger.addHandler(QueueLogHandler(pipeline, [stats_handler]))
+
+        stats_logger = logger
+
+    return stats_logger
+
 def get_group_logger(group_id):
     """为指定群号获取或创建日志记录器"""
     if group_id not in loggers:
@@ -70,11 +424,7 @@ def get_group_logger(group_id):
         # 避免重复添加handler
         if not logger.handlers:
             # 消息日志文件（按日期）- 只记录INFO级别
-            today = datetime.now().strftime("%Y-%m-%d")
-            message_handler = logging.FileHandler(
-                group_log_dir / f"messages_{today}.log",
-                encoding='utf-8'
-            )
+            message_handler = DailyFileHandler(group_log_dir, "messages")
             message_handler.setLevel(logging.INFO)
             # 添加过滤器，只允许INFO级别的日志
             message_handler.addFilter(LevelFilter(logging.INFO))
@@ -83,20 +433,16 @@ def get_group_logger(group_id):
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
             message_handler.setFormatter(message_formatter)
-            logger.addHandler(message_handler)
             
             # 错误日志文件（按日期）- 只记录ERROR级别
-            error_handler = logging.FileHandler(
-                group_log_dir / f"errors_{today}.log",
-                encoding='utf-8'
-            )
+            error_handler = DailyFileHandler(group_log_dir, "errors")
             error_handler.setLevel(logging.ERROR)
             error_formatter = logging.Formatter(
                 '%(asctime)s - %(levelname)s - %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
             error_handler.setFormatter(error_formatter)
-            logger.addHandler(error_handler)
+            logger.addHandler(QueueLogHandler(pipeline, [message_handler, error_handler]))
         
         loggers[group_id] = logger
     
@@ -115,24 +461,16 @@ def get_wiki_logger():
             wiki_log_dir.mkdir(exist_ok=True)
             
             # Wiki日志文件（按日期）
-            today = datetime.now().strftime("%Y-%m-%d")
-            wiki_handler = logging.FileHandler(
-                wiki_log_dir / f"wiki_{today}.log",
-                encoding='utf-8'
-            )
+            wiki_handler = DailyFileHandler(wiki_log_dir, "wiki")
             wiki_handler.setLevel(logging.INFO)
             wiki_formatter = logging.Formatter(
                 '%(asctime)s - %(levelname)s - %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
             wiki_handler.setFormatter(wiki_formatter)
-            logger.addHandler(wiki_handler)
             
             # Wiki错误日志文件（按日期）
-            wiki_error_handler = logging.FileHandler(
-                wiki_log_dir / f"wiki_errors_{today}.log",
-                encoding='utf-8'
-            )
+            wiki_error_handler = DailyFileHandler(wiki_log_dir, "wiki_errors")
             wiki_error_handler.setLevel(logging.ERROR)
             wiki_error_handler.addFilter(LevelFilter(logging.ERROR))
             wiki_error_formatter = logging.Formatter(
@@ -140,7 +478,7 @@ def get_wiki_logger():
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
             wiki_error_handler.setFormatter(wiki_error_formatter)
-            logger.addHandler(wiki_error_handler)
+            logger.addHandler(QueueLogHandler(pipeline, [wiki_handler, wiki_error_handler]))
         
         wiki_logger = logger
     
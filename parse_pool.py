@@ -0,0 +1,161 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logger import Colors, get_wiki_logger
+
+
+def _process_context():
+    """
+    工作进程的启动方式：优先 forkserver，不支持时使用 spawn
+
+    进程池创建时日志写入线程、事件循环等已经在运行，fork 会把其它线程持有的锁一起复制到子进程，
+    子进程可能永远卡在这些锁上。
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class ParsePool:
+    """
+    HTML 解析执行器
+
+    把 wiki_parser 中的解析函数放到进程池（或线程池）中执行，避免大页面解析阻塞事件循环。
+    传入原始 HTML，返回普通的 dict/list；同时等待执行的任务数不超过 max_pending，超出时调用方排队等待。
+
+    mode:
+        process  进程池，解析可以利用多核（默认）
+        thread   线程池，lxml 解析时会释放 GIL
+        inline   直接在事件循环中执行（调试用）
+    """
+
+    def __init__(self, mode="process", workers=2, max_pending=32):
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(self.max_pending)
+        # 统计数据
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+
+    def _create_executor(self):
+        if self.mode == "process":
+            try:
+                return ProcessPoolExecutor(max_workers=self.workers, mp_context=_process_context())
+            except (OSError, NotImplementedError) as e:
+                # 某些环境不支持多进程，退回线程池
+                get_wiki_logger().error(f"创建解析进程池失败，改用线程池 - 错误: {e}")
+                self.mode = "thread"
+        if self.mode == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="wiki-parse")
+        return None
+
+    def start(self):
+        if self._executor is None and self.mode != "inline":
+            self._executor = self._create_executor()
+
+    async def run(self, func, *args):
+        """在执行器中调用 func(*args)，func 必须是模块级函数，参数和返回值可被 pickle"""
+        queued = time.perf_counter()
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                wait = started - queued
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.submitted += 1
+                try:
+                    result = await self._submit(func, *args)
+                except BaseException:
+                    self.failed += 1
+                    raise
+                elapsed = time.perf_counter() - started
+                self.total_run += elapsed
+                self.max_run = max(self.max_run, elapsed)
+                self.completed += 1
+                return result
+        finally:
+            self.pending -= 1
+
+    async def _submit(self, func, *args):
+        self.start()
+        if self._executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # 工作进程意外退出，重建进程池后重试一次；
+            # 同时失败的其它调用只重建一次，不会关掉别的调用刚建好、正在重试的进程池
+            if self._executor is executor:
+                get_wiki_logger().error("解析进程池已损坏，正在重建")
+                executor.shutdown(wait=False)
+                self._executor = self._create_executor()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    def stats(self):
+        finished = self.completed or 1
+        return {
+            'mode': self.mode,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'pending': self.pending,
+            'max_pending': self.max_pending_seen,
+            'avg_wait_ms': round(self.total_wait * 1000 / (self.submitted or 1), 3),
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+            'avg_run_ms': round(self.total_run * 1000 / finished, 3),
+            'max_run_ms': round(self.max_run * 1000, 3)
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局解析执行器，通过 init_parse_pool 初始化
+parse_pool = None
+
+
+def get_parse_pool():
+    """获取全局解析执行器，未初始化时使用线程池"""
+    global parse_pool
+    if parse_pool is None:
+        parse_pool = ParsePool(mode="thread")
+    return parse_pool
+
+
+def init_parse_pool(config):
+    """根据配置创建解析执行器"""
+    global parse_pool
+    pool_config = config.get("parse_pool", {})
+    parse_pool = ParsePool(
+        mode=pool_config.get("mode", "process"),
+        workers=pool_config.get("workers", 2),
+        max_pending=pool_config.get("max_pending", 32)
+    )
+    parse_pool.start()
+
+
+def close_parse_pool():
+    """关闭解析执行器并记录统计数据"""
+    global parse_pool
+    if parse_pool is not None:
+        stats = parse_pool.stats()
+        get_wiki_logger().info(f"解析执行器统计 - {stats}")
+        print(f"{Colors.INFO}解析执行器统计: {stats}{Colors.RESET}")
+        parse_pool.close()
+        parse_pool = None
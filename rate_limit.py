@@ -0,0 +1,260 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+SCOPES = ("user", "group", "global")
+
+
+class _BucketEntry:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TokenBucket:
+    """
+    令牌桶：容量 limit，每 window 秒补满，允许短时间内连续使用 limit 次，之后按平均速率恢复
+
+    limit=1 时等同于“两次使用至少间隔 window 秒”的冷却时间。
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.rate = limit / window
+
+    def new_entry(self, now):
+        return _BucketEntry(float(self.limit), now)
+
+    def wait(self, entry, now):
+        tokens = min(self.limit, entry.tokens + (now - entry.updated) * self.rate)
+        entry.tokens = tokens
+        entry.updated = now
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def consume(self, entry, now):
+        entry.tokens -= 1
+
+    def idle(self, entry, now):
+        # 超过 window 秒没有使用，令牌已补满，和新记录没有区别
+        return now - entry.updated >= self.window
+
+
+class _WindowEntry:
+    __slots__ = ("start", "current", "previous")
+
+    def __init__(self, start):
+        self.start = start
+        self.current = 0
+        self.previous = 0
+
+
+class SlidingWindow:
+    """
+    滑动窗口计数（近似）：只记录当前和上一个窗口的次数，按时间比例估算最近 window 秒内的次数，
+    不会像固定窗口那样在窗口交界处放过两倍的次数，每个键只占常数空间
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    def new_entry(self, now):
+        return _WindowEntry(now)
+
+    def _roll(self, entry, now):
+        elapsed = now - entry.start
+        if elapsed >= self.window:
+            windows = int(elapsed // self.window)
+            entry.previous = entry.current if windows == 1 else 0
+            entry.current = 0
+            entry.start += windows * self.window
+
+    def wait(self, entry, now):
+        self._roll(entry, now)
+        window = self.window
+        position = (now - entry.start) / window
+        if entry.previous * (1 - position) + entry.current + 1 <= self.limit:
+            return 0.0
+        # 估算次数降到可以再用一次的时间
+        if entry.current + 1 <= self.limit and entry.previous:
+            ready = 1 - (self.limit - entry.current - 1) / entry.previous
+            return max(0.0, entry.start + window * ready - now)
+        ready = 1 - (self.limit - 1) / entry.current if entry.current else 0
+        return max(0.0, entry.start + window * (1 + ready) - now)
+
+    def consume(self, entry, now):
+        entry.current += 1
+
+    def idle(self, entry, now):
+        return now - entry.start >= self.window * 2
+
+
+class _FixedEntry:
+    __slots__ = ("end", "count")
+
+    def __init__(self, end):
+        self.end = end
+        self.count = 0
+
+
+class FixedWindow:
+    """
+    固定窗口计数：窗口内最多 limit 次，窗口结束后清零
+
+    daily=True 时窗口为自然日（本地时间零点重置），否则窗口从第一次使用开始计算。
+    """
+
+    def __init__(self, limit, window=86400, daily=False):
+        self.limit = limit
+        self.window = window
+        self.daily = daily
+        # 按自然日重置需要墙上时间
+        self.clock = time.time if daily else time.monotonic
+
+    def _window_end(self, now):
+        if not self.daily:
+            return now + self.window
+        midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (midnight + timedelta(days=1)).timestamp()
+
+    def new_entry(self, now):
+        return _FixedEntry(self._window_end(now))
+
+    def wait(self, entry, now):
+        if now >= entry.end:
+            entry.end = self._window_end(now)
+            entry.count = 0
+        return 0.0 if entry.count < self.limit else entry.end - now
+
+    def consume(self, entry, now):
+        entry.count += 1
+
+    def idle(self, entry, now):
+        return now >= entry.end
+
+
+POLICIES = {
+    "token_bucket": TokenBucket,
+    "sliding_window": SlidingWindow,
+    "fixed_window": FixedWindow
+}
+
+
+class RateLimiter:
+    """
+    频率限制
+
+    scope 决定计数的键：user 为 (群号, 用户)，group 为群号，global 为全局一个计数。
+    记录按最近使用时间排序，每新增 SWEEP_EVERY 条记录顺带删除一批最久未使用且已经恢复为初始状态的记录
+    （均摊 O(1)），记录数超过 max_keys 时删除最久未使用的记录，内存不会随用过的用户数一直增长。
+    """
+
+    SWEEP_EVERY = 16
+    SWEEP_BUDGET = 32
+
+    def __init__(self, policy, scope="user", max_keys=100000):
+        if scope not in SCOPES:
+            raise ValueError(f"未知的限制范围: {scope}")
+        self.policy = policy
+        self.scope = scope
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # {键: 记录}，最近使用的在末尾
+        self._added = 0
+        self.evicted = 0
+        self.limited = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, group_id, user_id):
+        if self.scope == "user":
+            return (group_id, user_id)
+        if self.scope == "group":
+            return group_id
+        return None
+
+    def _entry(self, key, now):
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is None:
+            # 只有新增记录会让内存增长，清理也只在新增时进行，每次最多删除的数量大于新增的数量
+            self._added += 1
+            if self._added % self.SWEEP_EVERY == 0:
+                self._sweep(now, self.SWEEP_BUDGET)
+            entry = entries[key] = self.policy.new_entry(now)
+            if len(entries) > self.max_keys:
+                entries.popitem(last=False)
+                self.evicted += 1
+        else:
+            entries.move_to_end(key)
+        return entry
+
+    def _sweep(self, now, budget):
+        """删除最多 budget 条已经空闲的最旧记录（budget 为负数时不限）"""
+        entries = self._entries
+        idle = self.policy.idle
+        while budget and entries:
+            key = next(iter(entries))
+            if not idle(entries[key], now):
+                return
+            del entries[key]
+            self.evicted += 1
+            budget -= 1
+
+    def sweep(self, now=None):
+        """删除全部空闲记录，返回删除的数量"""
+        now = self.policy.clock() if now is None else now
+        before = len(self._entries)
+        self._sweep(now, -1)
+        return before - len(self._entries)
+
+    def peek(self, group_id=None, user_id=None, now=None):
+        """返回还需要等待的秒数，0 表示现在可以使用；不计入使用次数"""
+        now = self.policy.clock() if now is None else now
+        return self.policy.wait(self._entry(self._key(group_id, user_id), now), now)
+
+    def hit(self, group_id=None, user_id=None, now=None):
+        """记录一次使用（不检查是否超过限制）"""
+        now = self.policy.clock() if now is None else now
+        entry = self._entry(self._key(group_id, user_id), now)
+        self.policy.wait(entry, now)
+        self.policy.consume(entry, now)
+
+    def acquire(self, group_id=None, user_id=None, now=None):
+        """检查并记录一次使用，返回 0 表示允许，否则返回还需要等待的秒数（不计入使用次数）"""
+        policy = self.policy
+        if now is None:
+            now = policy.clock()
+        # 热路径，展开 _key 和 _entry 中已有记录的情况
+        key = (group_id, user_id) if self.scope == "user" else self._key(group_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entry(key, now)
+        else:
+            self._entries.move_to_end(key)
+        wait = policy.wait(entry, now)
+        if wait:
+            self.limited += 1
+            return wait
+        policy.consume(entry, now)
+        return 0.0
+
+    def stats(self):
+        return {'keys': len(self._entries), 'evicted': self.evicted, 'limited': self.limited}
+
+
+def create_limiter(policy="sliding_window", limit=1, window=60, scope="user", max_keys=100000, daily=False):
+    """按策略名称创建频率限制"""
+    policy_class = POLICIES.get(policy)
+    if policy_class is None:
+        raise ValueError(f"未知的频率限制策略: {policy}")
+    if policy_class is FixedWindow:
+        return RateLimiter(FixedWindow(limit, window, daily=daily), scope, max_keys)
+    return RateLimiter(policy_class(limit, window), scope, max_keys)
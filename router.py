@@ -0,0 +1,227 @@
+import re
+import time
+from logger import get_stats_logger
+
+
+class MessageContext:
+    """
+    一条群消息的解析结果，路由和各个处理函数共用，不再重复解析消息
+
+    text: @机器人 时为全部文本片段拼接（去掉开头空白），否则为第一个文本片段
+    full_text: 全部文本片段以空格拼接，用于在整条消息中查找链接
+    command / args: 匹配到的指令前缀和其后的参数，由 Router 填写
+    poked: guard 中随机戳一戳是否已经掷中，处理函数据此决定是否还要掷骰
+    """
+
+    __slots__ = ("data", "group_id", "user_id", "message_id", "message_list", "at_bot", "text", "full_text",
+                 "command", "args", "match", "poked")
+
+    def __init__(self, data, bot_user_id):
+        self.data = data
+        self.group_id = data.get("group_id")
+        self.user_id = data.get("user_id")
+        self.message_id = data.get("message_id")
+        self.message_list = message_list = data.get("message", [])
+        self.command = None
+        self.args = ""
+        self.match = None
+        self.poked = False
+        # 最常见的只有一个文本片段的消息，不需要遍历和拼接
+        if len(message_list) == 1 and message_list[0].get("type") == "text":
+            self.at_bot = False
+            self.text = self.full_text = message_list[0].get("data", {}).get("text", "")
+            return
+        texts = []
+        at_qq = None
+        for segment in message_list:
+            segment_type = segment.get("type")
+            if segment_type == "text":
+                texts.append(segment.get("data", {}).get("text", ""))
+            elif segment_type == "at" and at_qq is None:
+                at_qq = segment.get("data", {}).get("qq")
+        self.at_bot = at_qq is not None and str(at_qq) == str(bot_user_id)
+        if self.at_bot:
+            self.text = "".join(texts).lstrip()
+        else:
+            self.text = texts[0] if texts else ""
+        self.full_text = texts[0] if len(texts) == 1 else " ".join(texts)
+
+
+class Route:
+    __slots__ = ("name", "handler", "order", "guard", "history")
+
+    def __init__(self, name, handler, order, guard=None, history=True):
+        self.name = name
+        self.handler = handler
+        self.order = order
+        self.guard = guard
+        self.history = history
+
+    def is_command(self, ctx):
+        """这条消息是否作为指令记录到消息历史"""
+        return self.history(ctx) if callable(self.history) else self.history
+
+
+class Router:
+    """
+    消息指令路由
+
+    指令通过 command 注册，可以指定三种匹配方式（任意一种匹配即可）：
+    - prefix: 指令前缀，忽略大小写、开头空白和一个 "."，前缀之后的内容作为 ctx.args
+    - regex: 在 ctx.full_text 中搜索的正则，匹配结果保存为 ctx.match；整个正则都锚定在开头（以 ^ 开头且没有 |）时
+             只在开头尝试匹配
+    - predicate: 接收 ctx 返回 bool 的函数
+    at_bot=True 的指令只处理 @机器人 的消息，没有 predicate 时 @机器人 的消息都匹配
+    contains: 搜索正则要求消息中必须出现的字符串，消息中没有时不运行正则（子串检查比正则搜索快得多）
+    guard: 指令匹配后同步执行的检查，返回 False 表示这条消息不需要处理（例如随机戳一戳没有掷中），
+           这样的消息走快速路径，不会进入事件分发队列
+    history: 是否作为指令记录到消息历史，可以是接收 ctx 返回 bool 的函数；fallback 不记录
+
+    所有前缀合并为一个忽略大小写的正则，锚定在开头的正则合并为一个正则（分支按注册顺序尝试，只在开头匹配一次）；
+    需要搜索的正则按注册顺序逐个搜索，先检查 contains，已经有更靠前的指令匹配时不再搜索
+    （合并后的搜索会选中文本中最靠左的匹配，而不是注册顺序最靠前的指令）。
+    多个指令同时匹配时选择注册顺序（order）最靠前的一个，都不匹配时交给 fallback。
+    """
+
+    def __init__(self, stats_interval=300):
+        self._routes = []
+        self._prefix_routes = []  # [(前缀, Route)]
+        self._prefix = None  # 全部前缀合并后的正则，长的前缀在前（匹配最长的前缀），忽略大小写
+        self._anchored_routes = []  # [(Route, 编译后的正则)]，整个正则锚定在开头
+        self._anchored = None  # _anchored_routes 合并后的正则，用 match 匹配
+        self._searched = []  # [(编译后的正则, Route, contains)]，按 order 排序，逐个 search
+        self._predicates = []  # @机器人 的消息检查的 [(predicate, Route)]，按 order 排序
+        self._plain_predicates = []  # 其他消息检查的，不含 at_bot=True 的指令
+        self._fallback = None
+        self.stats_interval = stats_interval
+        self._last_report = time.monotonic()
+        self._counts = {}  # {指令名: 执行次数}
+        self._fast_path = 0
+
+    def command(self, prefix=None, regex=None, predicate=None, at_bot=False, contains=None, guard=None, name=None,
+                history=True):
+        """注册指令的装饰器，处理函数接收 MessageContext"""
+        def decorator(handler):
+            route = Route(name or handler.__name__, handler, len(self._routes), guard, history)
+            self._routes.append(route)
+            prefixes = [prefix] if isinstance(prefix, str) else (prefix or [])
+            for item in prefixes:
+                # 同一个前缀只保留最先注册的指令
+                if all(item.lower() != existing.lower() for existing, _ in self._prefix_routes):
+                    self._prefix_routes.append((item, route))
+            if prefixes:
+                ordered = sorted(range(len(self._prefix_routes)), key=lambda index: -len(self._prefix_routes[index][0]))
+                self._prefix = re.compile(r"\s*\.?(?:" + "|".join(
+                    f"(?P<p{index}>{re.escape(self._prefix_routes[index][0])})" for index in ordered) + ")", re.IGNORECASE)
+            if regex is not None:
+                if self._is_anchored(regex):
+                    self._anchored_routes.append((route, re.compile(regex)))
+                    self._anchored = re.compile("|".join(
+                        f"(?P<r{index}>{pattern.pattern[1:]})" for index, (_, pattern) in enumerate(self._anchored_routes)))
+                else:
+                    self._searched.append((re.compile(regex), route, contains))
+            if predicate is not None or at_bot:
+                self._predicates.append((predicate, route))
+                if not at_bot:
+                    self._plain_predicates.append((predicate, route))
+            return handler
+        return decorator
+
+    @staticmethod
+    def _is_anchored(pattern):
+        """整个正则都从开头匹配：以 ^ 开头且没有 |（"^a|b" 中的 b 可以出现在任意位置）"""
+        return pattern.startswith("^") and "|" not in pattern
+
+    def fallback(self, handler=None, guard=None):
+        """没有指令匹配时调用的处理函数，可以直接作为装饰器，也可以 fallback(guard=...) 指定检查"""
+        def decorator(handler):
+            self._fallback = Route(handler.__name__, handler, len(self._routes) + 1_000_000, guard, history=False)
+            return handler
+        return decorator(handler) if handler is not None else decorator
+
+    def match(self, ctx):
+        """选出处理这条消息的指令，填写 ctx.command / ctx.args / ctx.match；都不匹配时返回 fallback"""
+        best = prefix_route = None
+        text = ctx.text
+        prefix_match = self._prefix.match(text) if self._prefix is not None and text else None
+        if prefix_match is not None:
+            best = prefix_route = self._prefix_routes[int(prefix_match.lastgroup[1:])][1]
+        regex_match = regex_route = None
+        full_text = ctx.full_text
+        if full_text:
+            if self._anchored is not None:
+                matched = self._anchored.match(full_text)
+                if matched:
+                    route, pattern = self._anchored_routes[int(matched.lastgroup[1:])]
+                    if best is None or route.order < best.order:
+                        best = regex_route = route
+                        # 用指令自己的正则重新匹配，ctx.match 中的分组编号与注册的正则一致
+                        regex_match = pattern.match(full_text)
+            for pattern, route, contains in self._searched:
+                if best is not None and route.order >= best.order:
+                    break
+                if contains is not None and contains not in full_text:
+                    continue
+                matched = pattern.search(full_text)
+                if matched:
+                    best = regex_route = route
+                    regex_match = matched
+                    break
+        for predicate, route in (self._predicates if ctx.at_bot else self._plain_predicates):
+            if best is not None and route.order >= best.order:
+                break
+            if predicate is None or predicate(ctx):
+                best = route
+                break
+        if best is None:
+            return self._fallback
+        if best is prefix_route:
+            end = prefix_match.end()
+            ctx.command = text[prefix_match.start(prefix_match.lastgroup):end]
+            ctx.args = text[end:].strip()
+        elif best is regex_route:
+            ctx.match = regex_match
+        return best
+
+    def select(self, ctx):
+        """匹配指令并执行 guard，返回需要执行的指令；不需要处理时返回 None（快速路径）"""
+        route = self.match(ctx)
+        if route is None or (route.guard is not None and not route.guard(ctx)):
+            self._fast_path += 1
+            route = None
+        else:
+            self._counts[route.name] = self._counts.get(route.name, 0) + 1
+        self._maybe_report()
+        return route
+
+    async def dispatch(self, ctx):
+        """匹配并执行指令，返回执行的指令名，不需要处理时返回 None"""
+        route = self.select(ctx)
+        if route is None:
+            return None
+        await route.handler(ctx)
+        return route.name
+
+    def _maybe_report(self):
+        if not self.stats_interval:
+            return
+        now = time.monotonic()
+        if now - self._last_report < self.stats_interval:
+            return
+        self._last_report = now
+        get_stats_logger().info(f"指令路由统计 - {self.format_stats()}")
+
+    def stats(self):
+        handled = sum(self._counts.values())
+        total = handled + self._fast_path
+        return {
+            'total': total,
+            'fast_path': self._fast_path,
+            'fast_path_ratio': round(self._fast_path / total, 3) if total else 0.0,
+            'routes': dict(self._counts)
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        routes = ", ".join(f"{name}: {count}" for name, count in sorted(s['routes'].items())) or "无"
+        return f"消息: {s['total']}, 快速路径: {s['fast_path']} ({s['fast_path_ratio']:.1%}), 指令: {routes}"
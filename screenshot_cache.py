@@ -0,0 +1,408 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qs, unquote
+import aiohttp
+from logger import Colors, get_wiki_logger
+from http_client import get_session
+
+# 缓存目录中由本模块管理的图片文件
+IMAGE_EXTENSIONS = (".png", ".webp", ".jpg")
+
+
+def normalize_wiki_url(full_url):
+    """
+    将 Wiki 链接规范化为缓存键
+
+    /index.php?title=阿比盖尔 、/阿比盖尔 、/%E9%98%BF%E6%AF%94%E7%9B%96%E5%B0%94#xx 都对应同一个键
+    """
+    parts = urlsplit(full_url)
+    host = parts.netloc.lower()
+    title = None
+    if parts.query:
+        title = parse_qs(parts.query).get("title", [None])[0]
+    if not title:
+        title = unquote(parts.path)
+        if title.startswith("/"):
+            title = title[1:]
+    title = title.replace(" ", "_").strip("_")
+    return f"{host}/{title}"
+
+
+def page_title_from_url(full_url):
+    """从 Wiki 链接中取出条目标题"""
+    return normalize_wiki_url(full_url).split("/", 1)[1].replace("_", " ")
+
+
+async def fetch_revision(full_url, timeout=5):
+    """
+    通过 MediaWiki API 获取条目当前的修订号，失败时返回 None
+
+    只请求 prop=info，比下载整页便宜得多，用于判断缓存的截图是否过期。
+    """
+    parts = urlsplit(full_url)
+    api_url = f"{parts.scheme}://{parts.netloc}/api.php"
+    params = {
+        "action": "query",
+        "prop": "info",
+        "titles": page_title_from_url(full_url),
+        "redirects": "1",
+        "format": "json"
+    }
+    try:
+        async with get_session().get(api_url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status != 200:
+                return None
+            data = await resp.json(content_type=None)
+    except Exception as e:
+        get_wiki_logger().warning(f"获取条目修订号失败 - URL: {full_url}, 错误: {e}")
+        return None
+    pages = data.get("query", {}).get("pages", {})
+    for page in pages.values():
+        if "lastrevid" in page:
+            return page["lastrevid"]
+    return None
+
+
+class ScreenshotCache:
+    """
+    以规范化 Wiki 链接为键的截图磁盘缓存
+
+    - 每个条目的截图保存为 <dir>/<sha1>.png，索引保存在 <dir>/index.json
+    - 超过 ttl 的条目视为过期；总大小超过 max_bytes 或数量超过 max_entries 时按 LRU 淘汰
+    - 记录条目修订号，修订号变化时丢弃旧截图
+    - 压缩后用于发送的图片作为条目的附属文件（variant）保存，随截图一起替换和淘汰
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, directory="screenshots", ttl=86400, max_bytes=200 * 1024 * 1024, max_entries=2000,
+                 evict_interval=300, revision_check_interval=300):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+        self.revision_check_interval = revision_check_interval
+        # {key: {'file': str, 'size': int, 'created': float, 'checked': float, 'revision': int|None,
+        #        'variant': {'file': str|None, 'size': int, 'signature': str}}}
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._dirty = False
+        self._evict_task = None
+        self._in_use = {}  # {绝对路径: 正在发送的次数}
+        self._deferred = set()  # 发送期间被淘汰的文件，发送结束后再删除
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    # ---------- 索引 ----------
+
+    def _index_path(self):
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _load(self):
+        """读取索引并与磁盘文件对账：删除没有索引的文件（包括旧版本留下的 uuid 截图）"""
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            saved = {}
+        for key, entry in sorted(saved.items(), key=lambda item: item[1].get('accessed', 0)):
+            if os.path.exists(self._file_path(entry['file'])):
+                variant = entry.get('variant')
+                if variant and variant['file'] and not os.path.exists(self._file_path(variant['file'])):
+                    del entry['variant']
+                self._entries[key] = entry
+                self._total_bytes += self._entry_bytes(entry)
+        tracked = {entry['file'] for entry in self._entries.values()}
+        tracked.update(entry['variant']['file'] for entry in self._entries.values() if entry.get('variant'))
+        removed = 0
+        for name in os.listdir(self.directory):
+            if (name.endswith(IMAGE_EXTENSIONS) and name not in tracked) or name.endswith(".part"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+        if removed:
+            get_wiki_logger().info(f"清理未登记的截图文件 - 数量: {removed}")
+        self._dirty = removed > 0 or len(self._entries) != len(saved)
+
+    def flush(self):
+        """将索引写回磁盘"""
+        if not self._dirty:
+            return
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path())
+        self._dirty = False
+
+    # ---------- 读写 ----------
+
+    def _file_path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _entry_bytes(entry):
+        variant = entry.get('variant')
+        return entry.get('size', 0) + (variant['size'] if variant else 0)
+
+    @staticmethod
+    def key_for(full_url):
+        return normalize_wiki_url(full_url)
+
+    def new_temp_path(self):
+        """截图时先写入临时文件，完成后再通过 put 放入缓存"""
+        return self._file_path(f"tmp_{uuid.uuid4().hex}.png.part")
+
+    def lookup(self, full_url):
+        """返回未过期的缓存条目（不检查修订号），不存在时返回 None"""
+        key = self.key_for(full_url)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry['created'] > self.ttl:
+            self._remove(key)
+            return None
+        return entry
+
+    def needs_revision_check(self, entry):
+        return time.time() - entry.get('checked', 0) > self.revision_check_interval
+
+    def get(self, full_url, revision=None):
+        """
+        获取缓存的截图绝对路径，未命中返回 None
+
+        revision 不为 None 且与缓存记录不一致时，视为条目已被编辑，删除旧截图。
+        """
+        key = self.key_for(full_url)
+        entry = self.lookup(full_url)
+        if entry is None:
+            return None
+        if revision is not None:
+            if entry.get('revision') is not None and entry['revision'] != revision:
+                get_wiki_logger().info(f"条目已更新，丢弃截图缓存 - URL: {full_url}, 旧修订: {entry['revision']}, 新修订: {revision}")
+                self._remove(key)
+                return None
+            entry['revision'] = revision
+            entry['checked'] = time.time()
+        path = self._file_path(entry['file'])
+        if not os.path.exists(path):
+            self._remove(key)
+            return None
+        entry['accessed'] = time.time()
+        self._entries.move_to_end(key)
+        self._dirty = True
+        return os.path.abspath(path)
+
+    def put(self, full_url, temp_path, revision=None):
+        """将截图临时文件放入缓存，返回最终的绝对路径"""
+        key = self.key_for(full_url)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest() + ".png"
+        path = self._file_path(name)
+        old_entry = self._entries.get(key)
+        if old_entry is not None:
+            self._total_bytes -= self._entry_bytes(old_entry)
+            self._remove_variant_file(old_entry)
+        os.replace(temp_path, path)
+        self._deferred.discard(os.path.abspath(path))
+        now = time.time()
+        size = os.path.getsize(path)
+        self._entries[key] = {
+            'url': full_url,
+            'file': name,
+            'size': size,
+            'created': now,
+            'accessed': now,
+            'checked': now,
+            'revision': revision
+        }
+        self._entries.move_to_end(key)
+        self._total_bytes += size
+        self._dirty = True
+        # 刚放入的截图马上要发送，单张超过配额时也先保留，下次淘汰时再删除
+        self.evict(keep=key)
+        return os.path.abspath(path)
+
+    def get_variant(self, full_url, signature):
+        """
+        获取条目压缩后的发送图片，返回绝对路径；记录为无需压缩时返回原截图路径，
+        没有记录或压缩参数已改变时返回 None
+        """
+        entry = self.lookup(full_url)
+        variant = entry.get('variant') if entry is not None else None
+        if variant is None or variant['signature'] != signature:
+            return None
+        path = self._file_path(variant['file'] or entry['file'])
+        if not os.path.exists(path):
+            return None
+        return os.path.abspath(path)
+
+    def put_variant(self, full_url, temp_path, ext, signature):
+        """
+        保存条目压缩后的发送图片，返回绝对路径；temp_path 为 None 表示原截图无需压缩
+        """
+        key = self.key_for(full_url)
+        entry = self._entries.get(key)
+        if entry is None:
+            if temp_path is not None:
+                os.remove(temp_path)
+            return None
+        self._total_bytes -= self._entry_bytes(entry)
+        self._remove_variant_file(entry)
+        if temp_path is None:
+            entry['variant'] = {'file': None, 'size': 0, 'signature': signature}
+        else:
+            name = os.path.splitext(entry['file'])[0] + ".send" + ext
+            os.replace(temp_path, self._file_path(name))
+            self._deferred.discard(os.path.abspath(self._file_path(name)))
+            entry['variant'] = {'file': name, 'size': os.path.getsize(self._file_path(name)), 'signature': signature}
+        self._total_bytes += self._entry_bytes(entry)
+        self._dirty = True
+        return os.path.abspath(self._file_path(entry['variant']['file'] or entry['file']))
+
+    def _remove_variant_file(self, entry):
+        variant = entry.pop('variant', None)
+        if variant and variant['file']:
+            self._delete_file(variant['file'])
+
+    def _delete_file(self, name):
+        """删除截图文件；正在发送的文件推迟到发送结束后再删除"""
+        path = os.path.abspath(self._file_path(name))
+        if path in self._in_use:
+            self._deferred.add(path)
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @contextmanager
+    def hold(self, path):
+        """
+        发送图片期间持有文件，期间条目被淘汰或失效时文件推迟到发送结束后再删除
+
+        path 不是文件路径（例如截图失败的错误码）时什么也不做。
+        """
+        if not isinstance(path, str):
+            yield path
+            return
+        path = os.path.abspath(path)
+        self._in_use[path] = self._in_use.get(path, 0) + 1
+        try:
+            yield path
+        finally:
+            count = self._in_use.pop(path) - 1
+            if count:
+                self._in_use[path] = count
+            elif path in self._deferred:
+                self._deferred.discard(path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def invalidate(self, full_url):
+        """主动删除某个条目的截图"""
+        self._remove(self.key_for(full_url))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= self._entry_bytes(entry)
+        self._remove_variant_file(entry)
+        self._dirty = True
+        self._delete_file(entry['file'])
+
+    # ---------- 淘汰 ----------
+
+    def evict(self, keep=None):
+        """
+        删除过期条目，再按 LRU 淘汰直到满足大小和数量配额，返回删除的数量
+
+        keep 为刚放入的条目（位于 LRU 末尾），淘汰到它时停止。
+        """
+        removed = 0
+        now = time.time()
+        for key in [k for k, entry in self._entries.items() if now - entry['created'] > self.ttl]:
+            self._remove(key)
+            removed += 1
+        while self._entries and (self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._remove(key)
+            removed += 1
+        return removed
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            try:
+                removed = self.evict()
+                if removed:
+                    get_wiki_logger().info(f"截图缓存淘汰 - 删除: {removed}, 剩余: {len(self._entries)}, 占用: {self._total_bytes} 字节")
+                self.flush()
+            except Exception as e:
+                get_wiki_logger().error(f"截图缓存淘汰失败 - 错误: {e}")
+
+    def start(self):
+        if self._evict_task is None and self.evict_interval:
+            self._evict_task = asyncio.create_task(self._evict_loop())
+
+    async def close(self):
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            try:
+                await self._evict_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._evict_task = None
+        self.flush()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self._total_bytes}
+
+
+# 全局截图缓存，通过 init_screenshot_cache 初始化
+screenshot_cache = None
+
+
+def get_screenshot_cache():
+    """获取全局截图缓存，未初始化时使用默认配置"""
+    global screenshot_cache
+    if screenshot_cache is None:
+        screenshot_cache = ScreenshotCache()
+    return screenshot_cache
+
+
+def init_screenshot_cache(config):
+    """根据配置创建截图缓存并启动后台淘汰任务"""
+    global screenshot_cache
+    cache_config = config.get("screenshot_cache", {})
+    screenshot_cache = ScreenshotCache(
+        directory=cache_config.get("dir", "screenshots"),
+        ttl=cache_config.get("ttl", 86400),
+        max_bytes=cache_config.get("max_mb", 200) * 1024 * 1024,
+        max_entries=cache_config.get("max_entries", 2000),
+        evict_interval=cache_config.get("evict_interval", 300),
+        revision_check_interval=cache_config.get("revision_check_interval", 300)
+    )
+    screenshot_cache.start()
+    stats = screenshot_cache.stats()
+    print(f"{Colors.INFO}截图缓存已加载 - 条目: {stats['entries']}, 占用: {stats['bytes'] // 1024} KB{Colors.RESET}")
+
+
+async def close_screenshot_cache():
+    """停止淘汰任务并保存索引"""
+    global screenshot_cache
+    if screenshot_cache is not None:
+        await screenshot_cache.close()
+        screenshot_cache = None
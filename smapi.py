@@ -3,6 +3,8 @@ import asyncio
 import re
 import json
 import os
+from contextlib import nullcontext
+from http_client import get_session
 
 
 async def check_log_parse_error(url: str) -> str | None:
@@ -32,7 +34,8 @@ async def check_log_parse_error(url: str) -> str | None:
             'Pragma': 'no-cache',
             'Expires': '0'
         }
-        async with aiohttp.ClientSession() as session:
+        # 使用共享的连接池会话，这里不关闭
+        async with nullcontext(get_session()) as session:
             async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
                 if response.status != 200:
                     return None
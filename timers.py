@@ -0,0 +1,143 @@
+import asyncio
+import inspect
+import math
+import time
+import traceback
+from logger import Colors, get_global_error_logger
+
+
+class TimerHandle:
+    """call_later 返回的定时器，cancel 后不会再执行"""
+
+    __slots__ = ("callback", "args", "rounds", "_slot", "_wheel")
+
+    def __init__(self, wheel, callback, args, rounds, slot):
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self._slot = slot
+        self._wheel = wheel
+
+    @property
+    def cancelled(self):
+        return self._slot is None
+
+    def cancel(self):
+        """取消定时器，已经执行或取消过时什么也不做"""
+        slot, self._slot = self._slot, None
+        if slot is not None and self in slot:
+            slot.discard(self)
+            self._wheel._count -= 1
+
+
+class TimerWheel:
+    """
+    时间轮定时器
+
+    所有定时器共用一个驱动协程，按 tick 秒一格转动，每格只处理落在这一格的定时器；
+    超过一圈的定时器记录剩余圈数。添加和取消都是 O(1)，没有定时器时驱动协程退出，不会空转。
+    到期回调在事件循环中同步执行，返回协程时作为任务执行（任务出错记录到错误日志）。
+    """
+
+    def __init__(self, tick=1.0, slots=256):
+        self.tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._time = time.monotonic()  # 当前格对应的时间
+        self._count = 0
+        self._task = None
+        self._tasks = set()
+
+    def __len__(self):
+        return self._count
+
+    def call_later(self, delay, callback, *args):
+        """delay 秒后执行 callback(*args)，精度为 tick 秒（不会提前执行）"""
+        if self._task is None:
+            # 驱动协程停止期间时间轮没有转动，从现在重新开始计时
+            self._time = time.monotonic()
+        ticks = max(1, math.ceil((time.monotonic() + delay - self._time) / self.tick))
+        slot = self._slots[(self._cursor + ticks) % len(self._slots)]
+        handle = TimerHandle(self, callback, args, (ticks - 1) // len(self._slots), slot)
+        slot.add(handle)
+        self._count += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return handle
+
+    async def _run(self):
+        try:
+            while self._count:
+                await asyncio.sleep(max(0.0, self._time + self.tick - time.monotonic()))
+                now = time.monotonic()
+                while self._count and self._time + self.tick <= now:
+                    self._time += self.tick
+                    self._cursor = (self._cursor + 1) % len(self._slots)
+                    self._expire(self._slots[self._cursor])
+        finally:
+            self._task = None
+
+    def _expire(self, slot):
+        # 先扣减圈数再执行回调：回调中新加入这一格的定时器要等下一圈
+        due = []
+        for handle in slot:
+            if handle.rounds:
+                handle.rounds -= 1
+            else:
+                due.append(handle)
+        for handle in due:
+            if handle._slot is None:
+                continue  # 被前面的回调取消了
+            slot.discard(handle)
+            handle._slot = None
+            self._count -= 1
+            self._fire(handle)
+
+    def _fire(self, handle):
+        try:
+            result = handle.callback(*handle.args)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._tasks.add(task)
+                task.add_done_callback(self._task_done)
+        except Exception as e:
+            self._report(e)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._report(task.exception())
+
+    @staticmethod
+    def _report(e):
+        print(f"{Colors.ERROR}定时任务执行失败: {e}{Colors.RESET}")
+        get_global_error_logger().error(
+            f"定时任务执行失败 - 错误: {e}\n{''.join(traceback.format_exception(type(e), e, e.__traceback__))}")
+
+    async def close(self):
+        """取消全部定时器和正在执行的到期任务"""
+        for slot in self._slots:
+            for handle in slot:
+                handle._slot = None
+            slot.clear()
+        self._count = 0
+        tasks = list(self._tasks)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+# 全局时间轮，所有模块共用
+timer_wheel = TimerWheel()
+
+
+def call_later(delay, callback, *args):
+    """在全局时间轮上添加定时器，返回可以 cancel 的 TimerHandle"""
+    return timer_wheel.call_later(delay, callback, *args)
+
+
+async def close_timers():
+    await timer_wheel.close()
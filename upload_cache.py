@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import os
+from cache import TTLCache
+from logger import get_stats_logger
+
+
+class UploadCache:
+    """
+    已上传图片的复用缓存
+
+    以图片内容的 sha1 为键，记录第一次发送后 OneBot 返回的图片地址；之后发送同样的图片时直接引用该地址，
+    不再重新上传整张图片。地址有有效期（QQ 图片链接会过期），超过 ttl 或发送失败时重新上传。
+    """
+
+    def __init__(self, max_entries=500, ttl=3600):
+        self._references = TTLCache(max_entries=max_entries, ttl=ttl)
+        # 同一文件（路径、修改时间、大小不变）只计算一次哈希
+        self._digests = TTLCache(max_entries=max_entries * 2, ttl=86400)
+        self.reused = 0
+        self.uploaded = 0
+
+    async def digest(self, image_path):
+        """返回图片内容的 sha1，读取失败时返回 None"""
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+        digest = self._digests.get(key)
+        if digest is None:
+            try:
+                digest = await asyncio.to_thread(_file_sha1, image_path)
+            except OSError:
+                return None
+            self._digests.set(key, digest)
+        return digest
+
+    def get(self, digest):
+        return self._references.get(digest)
+
+    def put(self, digest, reference):
+        self._references.set(digest, reference)
+
+    def invalidate(self, digest):
+        self._references.pop(digest)
+
+    async def remember(self, api, digest, response):
+        """从发送结果的 message_id 查询消息，记下其中图片的远程地址"""
+        message_id = (response.get("data") or {}).get("message_id")
+        if message_id is None:
+            return
+        try:
+            message = await api.call("get_msg", {"message_id": message_id})
+        except Exception as e:
+            get_stats_logger().warning(f"查询已发送图片失败 - message_id: {message_id}, 错误: {e}")
+            return
+        segments = (message.get("data") or {}).get("message") or []
+        for segment in segments:
+            if isinstance(segment, dict) and segment.get("type") == "image":
+                url = (segment.get("data") or {}).get("url")
+                if url and url.startswith(("http://", "https://")):
+                    self.put(digest, url)
+                return
+
+    def stats(self):
+        return {'entries': len(self._references), 'reused': self.reused, 'uploaded': self.uploaded}
+
+
+def _file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+# 全局上传复用缓存，通过 init_upload_cache 初始化；为 None 时每次都重新上传
+upload_cache = None
+
+
+def get_upload_cache():
+    return upload_cache
+
+
+def init_upload_cache(config):
+    """根据配置创建上传复用缓存"""
+    global upload_cache
+    cache_config = config.get("upload_cache", {})
+    upload_cache = None
+    if cache_config.get("enabled", True):
+        upload_cache = UploadCache(
+            max_entries=cache_config.get("max_entries", 500),
+            ttl=cache_config.get("ttl", 3600)
+        )
@@ -1,14 +1,40 @@
-import aiohttp
-from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
 import os
 import asyncio
-import uuid
 import re
-from logger import get_wiki_logger
+from logger import Colors, get_wiki_logger
+from browser import get_browser_pool
+from http_client import get_session
+from cache import TTLCache, SingleFlight
+from infobox_store import get_infobox_store
+from wiki_parser import extract_infobox, parse_search_page
+from parse_pool import get_parse_pool
+from wiki_index import WikiIndex, DEFAULT_DB_PATH, page_url
+from screenshot_cache import get_screenshot_cache, fetch_revision, normalize_wiki_url
+import infobox_render
+from image_optimize import get_image_optimizer
 
 url = "https://zh.stardewvalleywiki.com"
 
+# 搜索结果缓存，通过 init_wiki 按配置重建
+search_cache = TTLCache(max_entries=1000, ttl=600)
+negative_ttl = 60
+search_flight = SingleFlight()
+
+# 最近下载的条目页面，供信息框提取和截图复用
+page_cache = TTLCache(max_entries=32, ttl=120)
+page_flight = SingleFlight()
+reuse_page_html = True
+screenshot_flight = SingleFlight()
+REVISION_PATTERN = re.compile(r'"wgRevisionId":\s*(\d+)')
+
+# 后台刷新信息框的任务
+infobox_flight = SingleFlight()
+background_tasks = set()
+
+# 本地搜索索引，engine 为 index 时由 init_wiki 加载
+local_index = None
+live_fallback = True
+
 def clean_html_text(text):
 	"""清理文本"""
 	if not text:
@@ -17,31 +43,133 @@ def clean_html_text(text):
 	text = re.sub(r'\s+', ' ', text).strip()
 	return text
 
+def init_wiki(config):
+	"""根据配置初始化搜索结果缓存、本地搜索索引和页面复用"""
+	global search_cache, negative_ttl, local_index, live_fallback, reuse_page_html
+	cache_config = config.get("wiki_cache", {})
+	search_cache = TTLCache(
+		max_entries=cache_config.get("max_entries", 1000),
+		ttl=cache_config.get("ttl", 600)
+	)
+	negative_ttl = cache_config.get("negative_ttl", 60)
+	reuse_page_html = config.get("browser", {}).get("reuse_html", True)
+	
+	search_config = config.get("wiki_search", {})
+	live_fallback = search_config.get("live_fallback", True)
+	if local_index is not None:
+		local_index.close()
+		local_index = None
+	if search_config.get("engine", "live") == "index":
+		index_path = search_config.get("index_path", DEFAULT_DB_PATH)
+		try:
+			local_index = WikiIndex(index_path)
+			get_wiki_logger().info(f"已加载本地搜索索引: {index_path}")
+		except Exception as e:
+			print(f"{Colors.ERROR}加载本地搜索索引失败，使用在线搜索: {e}{Colors.RESET}")
+			get_wiki_logger().error(f"加载本地搜索索引失败 - 路径: {index_path}, 错误: {e}")
+
+def normalize_query(content):
+	"""搜索缓存键：忽略首尾空白、大小写和连续空格"""
+	return re.sub(r'\s+', ' ', content).strip().lower()
+
 async def Search(content):
+	"""
+	搜索 Wiki，结果按规范化后的搜索内容缓存
+
+	无结果（type == -1）的缓存时间较短；同一内容的并发搜索只会发出一次请求。
+	"""
+	key = normalize_query(content)
+	result = search_cache.get(key)
+	if result is not None:
+		get_wiki_logger().info(f"搜索命中缓存 - 搜索内容: {content}")
+		return result
+	result = await search_flight.do(key, _search, content)
+	search_cache.set(key, result, negative_ttl if result['type'] == -1 else None)
+	return result
+
+async def _search(content):
+	if local_index is not None:
+		try:
+			result = await _search_index(content)
+		except Exception as e:
+			get_wiki_logger().error(f"本地索引搜索失败 - 搜索内容: {content}, 错误: {e}")
+			result = None
+		if result is not None:
+			return result
+	return await _search_live(content)
+
+async def _search_index(content):
+	"""
+	在本地索引中搜索，返回值与在线搜索一致
+
+	索引中没有结果且允许回退时返回 None，由在线搜索继续处理。
+	"""
+	logger = get_wiki_logger()
+	title = local_index.lookup(content)
+	if title:
+		entry_url = page_url(url, title)
+		logger.info(f"搜索成功（索引直接匹配） - 搜索内容: {content}, 条目: {title}, URL: {entry_url}")
+		# 信息框存储中有这个条目时不发出网络请求；索引里的信息框字段是模板参数名，不能直接发送
+		infobox_text = await get_infobox_text(entry_url)
+		return {
+			'text': f"{infobox_text}\n更多信息：{entry_url}",
+			'results': [{
+				'title': title,
+				'full_url': entry_url
+			}],
+			'type': 0
+		}
+	
+	titles = local_index.search(content)
+	if not titles:
+		if live_fallback:
+			logger.info(f"索引无结果，回退在线搜索 - 搜索内容: {content}")
+			return None
+		logger.info(f"搜索无结果（索引） - 搜索内容: {content}")
+		return {
+			'text': f"乌啦啦，呀～没有找到与 '{content}' 相关的Wiki条目。",
+			'results': [],
+			'type': -1
+		}
+	
+	results = [{'title': title, 'full_url': page_url(url, title)} for title in titles]
+	formatted_lines = [f"{i}.{r['title']}" for i, r in enumerate(results, 1)]
+	output_str = f"'{content}' 的搜索结果：" + '\n' + '\n'.join(formatted_lines)
+	logger.info(f"搜索成功（索引，多个结果） - 搜索内容: {content}, 结果数量: {len(results)}")
+	return {
+		'text': output_str,
+		'results': results,
+		'wiki_len':len(results),
+		'type': 1
+	}
+
+async def _search_live(content):
 	logger = get_wiki_logger()
 	logger.info(f"开始搜索Wiki内容: {content}")
 	
 	SearchUrl = url + "/index.php?search=" + content
 	try:
-		async with aiohttp.ClientSession() as session:
-			async with session.get(SearchUrl) as resp:
-				SearchResult = await resp.text()
-				final_url = str(resp.url)
+		async with get_session().get(SearchUrl) as resp:
+			# 502/503 等错误页面没有结果列表，不能当作“没有找到”缓存，作为搜索失败处理
+			resp.raise_for_status()
+			status = resp.status
+			SearchResult = await resp.text()
+			final_url = str(resp.url)
 	except Exception as e:
 		logger.error(f"搜索请求失败 - 搜索内容: {content}, 错误: {e}")
 		raise
 	
-	soup = BeautifulSoup(SearchResult, "lxml")
-	title_elements = soup.find_all(class_="mw-search-result-heading")
+	# 在解析执行器中解析页面，避免阻塞事件循环
+	parsed = await get_parse_pool().run(parse_search_page, SearchResult)
+	title_elements = parsed['results']
 
 
 	# 如果没有搜索结果，检查是否直接跳转到了条目页面
 	if not title_elements:
 		# 检查URL是否与搜索URL不同，说明发生了重定向
 		if final_url != SearchUrl:
-			page_title = soup.find(id="firstHeading")
-			if page_title:
-				title_text = page_title.get_text(strip=True)
+			title_text = parsed['heading']
+			if title_text is not None:
 				# 排除搜索结果页面的标题
 				if title_text and "搜索结果" not in title_text and "Search results" not in title_text:
 					# 从URL构建条目链接
@@ -52,6 +180,9 @@ async def Search(content):
 						entry_url = final_url
 					
 					logger.info(f"搜索成功（直接匹配） - 搜索内容: {content}, 条目: {title_text}, URL: {entry_url}")
+					# 搜索页面就是条目本身，登记后信息框和截图都不再重新下载
+					if status == 200:
+						remember_page(WikiPage(entry_url, SearchResult, parsed['infobox']))
 					infobox_text = await get_infobox_text(entry_url)
 					return {
 						'text': f"{infobox_text}\n更多信息：{entry_url}",
@@ -72,9 +203,8 @@ async def Search(content):
 
 	results = []
 	for element in title_elements:
-		link_tag = element.find('a')
-		title_text = link_tag.get_text(strip=True)
-		href = link_tag.get('href')
+		title_text = element['title']
+		href = element['href']
 		full_url = url + href if href.startswith('/') else href
 		results.append({'title': title_text, 'full_url': full_url})
 
@@ -89,146 +219,280 @@ async def Search(content):
 	}
 
 async def get_infobox_text(full_url):
-	try:
-		async with aiohttp.ClientSession() as session:
-			async with session.get(full_url) as resp:
-				html_content = await resp.text()
-	except Exception as e:
-		logger = get_wiki_logger()
-		logger.error(f"获取页面内容失败 - URL: {full_url}, 错误: {e}")
-		return ""
+	"""
+	获取条目信息框文本
+
+	优先使用本地信息框存储，过期的条目先返回旧内容并在后台刷新；存储中没有时在线获取并写入存储。
+	"""
+	store = get_infobox_store()
+	entry = store.get(full_url) if store is not None else None
+	if entry is not None:
+		if store.is_stale(entry):
+			refresh_infobox(full_url)
+		return format_infobox(entry)
 	
-	soup = BeautifulSoup(html_content, "lxml")
-	description_meta = soup.find("meta", attrs={"name": "description"})
-	description_text = ""
-	if description_meta:
-		description_content = description_meta.get("content", "")
-		description_content = re.sub(r'data-sort-value=(?:\"|&quot;).*?(?:\"|&quot;)', '', description_content)
-		description_soup = BeautifulSoup(description_content, "lxml")
-		hidden_tags = description_soup.find_all(attrs={"style": re.compile(r"display\s*:\s*none", re.IGNORECASE)})
-		for tag in hidden_tags:
-			tag.decompose()
-
-		# 提取纯文本并清理
-		description_text = clean_html_text(description_soup.get_text(separator=" ", strip=False))
-	infobox = soup.find(id="infoboxborder")
-	
-	# 如果找不到 infobox，直接返回 description_text
-	if not infobox:
-		return f"ő {description_text}" if description_text else ""
+	data = await fetch_infobox(full_url)
+	if data is None:
+		return ""
+	if store is not None:
+		store.put(full_url, data)
+	return format_infobox(data)
+
+def refresh_infobox(full_url):
+	"""在后台重新获取条目信息框并更新存储，同一条目同时只刷新一次"""
+	if full_url in infobox_flight:
+		return
 	
-	infobox_data = {}
-	infobox_title = ""
-	header = infobox.find(id="infoboxheader")
-	if header:
-		infobox_title = header.get_text(strip=True)
-	rows = infobox.find_all("tr")
-	for row in rows:
-		section = row.find(id="infoboxsection")
-		detail = row.find(id="infoboxdetail")
-		if section and detail:
-			section_text = section.get_text(strip=True)
-			
-			# 在提取文本前，将图片标签替换为空格，避免数字连在一起
-			# 创建一个副本以避免修改原始元素
-			detail_copy = BeautifulSoup(str(detail), "lxml")
-			
-			# 删除所有 style="display: none;" 的隐藏标签（如 data-sort-value）
-			hidden_tags = detail_copy.find_all(attrs={"style": re.compile(r"display\s*:\s*none", re.IGNORECASE)})
-			for tag in hidden_tags:
-				tag.decompose()  # 完全删除标签及其内容
-			
-			images = detail_copy.find_all("img")
-			for img in images:
-				# 将图片标签替换为空格
-				img.replace_with(" ")
-			
-			# 提取所有文本内容（包括链接内的和链接外的）
-			# 先获取所有文本节点和链接
-			detail_text = detail_copy.get_text(separator=" ", strip=False)
-			
-			# 清理多余的空格，但保留数字之间的空格
-			# 将多个连续空格替换为单个空格
-			detail_text = re.sub(r'\s+', ' ', detail_text).strip()
-			
-			if section_text and detail_text:
-				infobox_data[section_text] = detail_text
+	async def _refresh():
+		data = await fetch_infobox(full_url)
+		store = get_infobox_store()
+		if data is not None and store is not None:
+			store.put(full_url, data)
+			get_wiki_logger().info(f"信息框已刷新 - URL: {full_url}")
 	
+	task = asyncio.create_task(infobox_flight.do(full_url, _refresh))
+	background_tasks.add(task)
+	task.add_done_callback(background_tasks.discard)
+
+def forget_infobox(full_url):
+	"""条目已不存在时从本地存储中删除，过期后不再返回旧的信息框"""
+	store = get_infobox_store()
+	if store is not None and store.get(full_url) is not None:
+		store.delete(full_url)
+		get_wiki_logger().info(f"条目已不存在，删除本地信息框 - URL: {full_url}")
+
+async def fetch_infobox(full_url):
+	"""获取条目页面并提取信息框，请求失败或状态码不是 200 时返回 None（不会写入存储）"""
+	wiki_page = await fetch_page(full_url)
+	if wiki_page is None:
+		return None
+	return await wiki_page.infobox()
+
+def format_infobox(data):
+	"""将 extract_infobox 的结果格式化为发送的文本"""
+	description_text = data['description']
+	if not data['has_infobox']:
+		return f"ő {description_text}" if description_text else ""
 	infobox_lines = []
-	if infobox_title:
-		infobox_lines.append(f"{infobox_title}")
+	if data['title']:
+		infobox_lines.append(f"{data['title']}")
 		if description_text:
 			infobox_lines.append(f"ő {description_text}")
-	infobox_lines.extend([f"• {k}：{v}" for k, v in infobox_data.items()])
+	infobox_lines.extend([f"• {k}：{v}" for k, v in data['rows']])
 	return "\n".join(infobox_lines)
 
 
+class WikiPage:
+	"""
+	条目页面管线
+
+	每个条目的 HTML 只下载一次，信息框提取和截图渲染共用同一份内容；修订号直接从页面中读取。
+	"""
+	
+	def __init__(self, full_url, html, infobox=None):
+		self.url = full_url
+		self.html = html
+		self._infobox = infobox
+		match = REVISION_PATTERN.search(html)
+		self.revision = int(match.group(1)) if match else None
+	
+	async def infobox(self):
+		"""提取信息框，结果保存在对象上，重复调用不会再次解析"""
+		if self._infobox is None:
+			self._infobox = await get_parse_pool().run(extract_infobox, self.html)
+		return self._infobox
+
+def remember_page(wiki_page):
+	"""登记已经下载的条目页面，供随后的信息框提取和截图复用"""
+	page_cache.set(normalize_wiki_url(wiki_page.url), wiki_page)
+
+def cached_page(full_url):
+	"""返回最近下载过的条目页面，没有时返回 None"""
+	return page_cache.get(normalize_wiki_url(full_url))
+
+async def fetch_page(full_url):
+	"""获取条目页面，短时间内重复请求同一条目时复用已下载的内容；请求失败时返回 None"""
+	key = normalize_wiki_url(full_url)
+	wiki_page = page_cache.get(key)
+	if wiki_page is not None:
+		return wiki_page
+	return await page_flight.do(key, _fetch_page, full_url)
+
+async def _fetch_page(full_url):
+	try:
+		async with get_session().get(full_url) as resp:
+			status = resp.status
+			html_content = await resp.text()
+	except Exception as e:
+		logger = get_wiki_logger()
+		logger.error(f"获取页面内容失败 - URL: {full_url}, 错误: {e}")
+		return None
+	# 404、5xx 或防火墙验证页不是条目内容，不缓存、不截图、不提取信息框
+	if status != 200:
+		get_wiki_logger().error(f"获取页面内容失败 - URL: {full_url}, 状态码: {status}")
+		if status in (404, 410):
+			forget_infobox(full_url)
+		return None
+	wiki_page = WikiPage(full_url, html_content)
+	remember_page(wiki_page)
+	return wiki_page
+
+
+async def _render_infobox_image(full_url, wiki_page, revision):
+	"""用 Pillow 绘制信息框图片并写入截图缓存，无法渲染时返回 None"""
+	logger = get_wiki_logger()
+	cache = get_screenshot_cache()
+	if wiki_page is not None:
+		data = await wiki_page.infobox()
+	else:
+		store = get_infobox_store()
+		data = store.get(full_url) if store is not None else None
+		if data is None or store.is_stale(data):
+			wiki_page = await fetch_page(full_url)
+			if wiki_page is None:
+				return None
+			data = await wiki_page.infobox()
+			if store is not None:
+				store.put(full_url, data)
+			revision = wiki_page.revision
+	if revision is None:
+		revision = await fetch_revision(full_url)
+
+	output_path = cache.new_temp_path()
+	try:
+		await infobox_render.get_renderer().render(data, url, output_path)
+	except infobox_render.RenderUnsupported as e:
+		logger.info(f"轻量渲染不适用，改用浏览器截图 - URL: {full_url}, 原因: {e}")
+		return None
+	except Exception as e:
+		logger.error(f"轻量渲染失败，改用浏览器截图 - URL: {full_url}, 错误: {e}")
+		if os.path.exists(output_path):
+			os.remove(output_path)
+		return None
+	cached_path = cache.put(full_url, output_path, revision)
+	logger.info(f"轻量渲染成功 - URL: {full_url}, 保存路径: {cached_path}")
+	return cached_path
+
+
 async def SearchResult(full_url):
+	"""截取条目信息框图片，返回用于发送的图片绝对路径，失败时返回 -1；同一条目的并发截图只执行一次"""
+	return await screenshot_flight.do(normalize_wiki_url(full_url), _prepare_image, full_url)
+
+async def _prepare_image(full_url):
+	"""截图后按配置的大小预算压缩，压缩失败时发送原截图"""
+	path = await _search_result(full_url)
+	optimizer = get_image_optimizer()
+	if path == -1 or optimizer is None:
+		return path
+	try:
+		return await optimizer.optimize(full_url, path, get_screenshot_cache())
+	except Exception as e:
+		get_wiki_logger().error(f"图片压缩失败，发送原图 - URL: {full_url}, 错误: {e}")
+		return path
+
+async def _search_result(full_url):
 	logger = get_wiki_logger()
 	logger.info(f"开始截图Wiki页面: {full_url}")
 	
 	ERROR_CODE = -1
 	
+	# 命中截图缓存时直接返回，超过检查间隔的条目先比对修订号
+	cache = get_screenshot_cache()
+	revision = None
+	entry = cache.lookup(full_url)
+	if entry is not None:
+		if cache.needs_revision_check(entry):
+			revision = await fetch_revision(full_url)
+		cached_path = cache.get(full_url, revision)
+		if cached_path:
+			logger.info(f"截图命中缓存 - URL: {full_url}, 路径: {cached_path}")
+			return cached_path
+	
+	# 最近下载过的条目：修订号直接取自页面，截图时复用页面 HTML
+	wiki_page = cached_page(full_url) if reuse_page_html else None
+	if revision is None and wiki_page is not None:
+		revision = wiki_page.revision
+
+	# 轻量渲染：直接用信息框数据绘制图片，不支持的条目回退到浏览器截图
+	if infobox_render.render_backend == "pillow":
+		rendered_path = await _render_infobox_image(full_url, wiki_page, revision)
+		if rendered_path is not None:
+			return rendered_path
+	entry_key = normalize_wiki_url(full_url)
+	
+	def _is_entry_url(request_url):
+		return normalize_wiki_url(request_url) == entry_key
+	
+	async def _fulfill_entry(route):
+		if route.request.resource_type == "document":
+			await route.fulfill(status=200, content_type="text/html; charset=utf-8", body=wiki_page.html)
+		else:
+			await route.continue_()
+	
 	async def _take_screenshot():
-		screenshot_dir = "screenshots"
-		if not os.path.exists(screenshot_dir):
-			os.makedirs(screenshot_dir)
-		
-		# 使用 UUID
-		unique_id = str(uuid.uuid4())
-		screenshot_path = os.path.join(screenshot_dir, f"{unique_id}.png")
+		# 与截图并行获取修订号，写入缓存时记录
+		revision_task = None
+		if revision is None:
+			revision_task = asyncio.create_task(fetch_revision(full_url))
+			# 截图失败或被取消时修订号不再需要，任务的异常也不需要报告
+			revision_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+		try:
+			screenshot_path = cache.new_temp_path()
 		
-		async with async_playwright() as p:
-			browser = await p.chromium.launch(headless=True)
-			
-			mobile_device = {
-				"viewport": {"width": 430, "height": 932},
-				"user_agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.0 Mobile/15E148 Safari/604.1",
-				"device_scale_factor": 3,
-				"is_mobile": True,
-				"has_touch": True
-			}
-			
-			context = await browser.new_context(**mobile_device)
-			page = await context.new_page()
-			
-			try:
+			async with get_browser_pool().page() as page:
+				# 已经下载过的条目直接把 HTML 交给浏览器，只有图片、样式等资源走网络
+				if wiki_page is not None:
+					await page.route(_is_entry_url, _fulfill_entry)
 				try:
-					await page.goto(full_url, wait_until="load", timeout=60000)
-					logger.info(f"页面加载成功: {full_url}")
-				except Exception as e:
-					logger.error(f"页面加载超时，尝试继续 - URL: {full_url}, 错误: {e}")
-					print(f"页面加载超时，尝试继续: {e}")
+					try:
+						await page.goto(full_url, wait_until="load", timeout=60000)
+						logger.info(f"页面加载成功: {full_url}")
+					except Exception as e:
+						logger.error(f"页面加载超时，尝试继续 - URL: {full_url}, 错误: {e}")
+						print(f"页面加载超时，尝试继续: {e}")
 				
-				# 等待 DOM 内容加载
-				try:
-					await page.wait_for_load_state("domcontentloaded", timeout=20000)
-				except:
-					pass
+					# 等待 DOM 内容加载
+					try:
+						await page.wait_for_load_state("domcontentloaded", timeout=20000)
+					except:
+						pass
 				
-				# 等待元素渲染完成
-				await asyncio.sleep(1)
+					# 等待元素渲染完成
+					await asyncio.sleep(1)
 				
-				# 查找并截图 infoboxborder 元素
-				infobox_element = page.locator('#infoboxborder')
-				# 检查元素是否存在
-				if await infobox_element.count() == 0:
-					logger.warning(f"未找到 infoboxborder 元素 - URL: {full_url}")
-					return ERROR_CODE
+					# 查找并截图 infoboxborder 元素
+					infobox_element = page.locator('#infoboxborder')
+					# 检查元素是否存在
+					if await infobox_element.count() == 0:
+						logger.warning(f"未找到 infoboxborder 元素 - URL: {full_url}")
+						return ERROR_CODE
 				
-				# 等待元素可见
-				try:
-					await infobox_element.wait_for(state='visible', timeout=20000)
-				except Exception as e:
-					logger.warning(f"infoboxborder 元素等待可见超时 - URL: {full_url}, 错误: {e}")
-					return ERROR_CODE
+					# 等待元素可见
+					try:
+						await infobox_element.wait_for(state='visible', timeout=20000)
+					except Exception as e:
+						logger.warning(f"infoboxborder 元素等待可见超时 - URL: {full_url}, 错误: {e}")
+						return ERROR_CODE
 				
-				await infobox_element.screenshot(path=screenshot_path, timeout=60000)
-				logger.info(f"截图成功 - URL: {full_url}, 保存路径: {screenshot_path}")
-			finally:
-				await browser.close()
+					try:
+						await infobox_element.screenshot(path=screenshot_path, timeout=60000)
+					except BaseException:
+						if os.path.exists(screenshot_path):
+							os.remove(screenshot_path)
+						raise
+				finally:
+					if wiki_page is not None:
+						await page.unroute(_is_entry_url, _fulfill_entry)
 		
-		return os.path.abspath(screenshot_path)
+			page_revision = revision
+			if revision_task is not None:
+				page_revision = await revision_task
+			cached_path = cache.put(full_url, screenshot_path, page_revision)
+			logger.info(f"截图成功 - URL: {full_url}, 保存路径: {cached_path}")
+			return cached_path
+		finally:
+			if revision_task is not None:
+				revision_task.cancel()
 	
 	try:
 		# 设置总体超时为 60 秒，防止整个流程卡死
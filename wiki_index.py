@@ -0,0 +1,378 @@
+"""
+本地 Wiki 搜索索引
+
+从 MediaWiki XML 导出文件（Special:Export 或数据库 dump）构建 SQLite FTS5 索引，
+收录条目标题、重定向、别名和信息框字段，供 wiki.Search 离线搜索。
+
+用法：
+    python wiki_index.py build <导出文件.xml> [更多文件...] [--db data/wiki_index.db]
+    python wiki_index.py download <输出目录>
+    python wiki_index.py search <内容> [--db data/wiki_index.db]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import quote
+
+DEFAULT_DB_PATH = os.path.join("data", "wiki_index.db")
+
+# 信息框中可作为别名的字段
+ALIAS_FIELDS = {"name", "名称", "eng", "english", "en", "alias", "aliases", "别名"}
+
+INFOBOX_PATTERN = re.compile(r'\{\{\s*(?:infobox|信息框)', re.IGNORECASE)
+LINK_PATTERN = re.compile(r'\[\[(?:[^\]|]*\|)?([^\]]*)\]\]')
+TEMPLATE_PATTERN = re.compile(r'\{\{[^{}]*\}\}')
+TAG_PATTERN = re.compile(r'<[^>]+>')
+SPACE_PATTERN = re.compile(r'\s+')
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE pages (id INTEGER PRIMARY KEY, title TEXT NOT NULL UNIQUE, infobox TEXT);
+CREATE TABLE aliases (alias TEXT PRIMARY KEY, page_id INTEGER NOT NULL);
+CREATE VIRTUAL TABLE pages_fts USING fts5(title, aliases, infobox, tokenize='trigram');
+"""
+
+
+def normalize_title(text):
+    """标题/别名比较时忽略大小写、下划线和连续空格"""
+    return SPACE_PATTERN.sub(' ', text.replace('_', ' ')).strip().lower()
+
+
+def _replace_template(match):
+    # {{name|物品|数量}} 渲染为物品名，其它模板直接丢弃
+    parts = match.group(0)[2:-2].split('|')
+    if parts[0].strip().lower() == "name" and len(parts) > 1:
+        return parts[1]
+    return ''
+
+
+def clean_wikitext(text):
+    """粗略去除 wikitext 标记，只保留可读文本"""
+    previous = None
+    while previous != text:
+        previous = text
+        text = TEMPLATE_PATTERN.sub(_replace_template, text)
+    text = LINK_PATTERN.sub(r'\1', text)
+    text = TAG_PATTERN.sub('', text)
+    text = text.replace("'''", "").replace("''", "")
+    return SPACE_PATTERN.sub(' ', text).strip()
+
+
+def _split_template(body):
+    """按顶层的 | 切分模板参数，忽略嵌套模板和链接中的 |"""
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(body):
+        pair = body[i:i + 2]
+        if pair in ("{{", "[["):
+            depth += 1
+            i += 2
+            continue
+        if pair in ("}}", "]]"):
+            depth -= 1
+            i += 2
+            continue
+        if body[i] == '|' and depth == 0:
+            parts.append(body[start:i])
+            start = i + 1
+        i += 1
+    parts.append(body[start:])
+    return parts
+
+
+def parse_infobox(wikitext):
+    """从条目 wikitext 中提取第一个信息框模板的字段，返回 {字段: 文本}"""
+    match = INFOBOX_PATTERN.search(wikitext or "")
+    if not match:
+        return {}
+    start = match.start()
+    depth = 0
+    i = start
+    end = None
+    while i < len(wikitext) - 1:
+        pair = wikitext[i:i + 2]
+        if pair == "{{":
+            depth += 1
+            i += 2
+            continue
+        if pair == "}}":
+            depth -= 1
+            i += 2
+            if depth == 0:
+                end = i - 2
+                break
+            continue
+        i += 1
+    if end is None:
+        return {}
+    fields = {}
+    for part in _split_template(wikitext[start + 2:end])[1:]:
+        if '=' not in part:
+            continue
+        key, value = part.split('=', 1)
+        key = key.strip()
+        value = clean_wikitext(value)
+        if key and value:
+            fields[key] = value
+    return fields
+
+
+def iter_dump_pages(path):
+    """逐个读取导出文件中的主命名空间条目，返回 {'title', 'redirect', 'text'}"""
+    title = ns = redirect = text = None
+    for event, elem in ET.iterparse(path, events=("end",)):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if tag == "title":
+            title = elem.text or ""
+        elif tag == "ns":
+            ns = (elem.text or "0").strip()
+        elif tag == "redirect":
+            redirect = elem.get("title")
+        elif tag == "text":
+            text = elem.text or ""
+        elif tag == "page":
+            if title and ns in (None, "0"):
+                yield {'title': title, 'redirect': redirect, 'text': text or ""}
+            title = ns = redirect = text = None
+            elem.clear()
+
+
+def build_index(dump_paths, db_path=DEFAULT_DB_PATH):
+    """
+    从一个或多个导出文件构建索引
+
+    先写入临时文件，完成后替换旧索引，运行中的机器人会在下次搜索时自动加载新索引。
+    返回 {'pages': int, 'redirects': int, 'aliases': int}
+    """
+    pages = {}       # {title: infobox}
+    redirects = {}   # {redirect_title: target_title}
+    for path in dump_paths:
+        for page in iter_dump_pages(path):
+            if page['redirect']:
+                redirects[page['title']] = page['redirect']
+            else:
+                pages[page['title']] = parse_infobox(page['text'])
+
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        page_ids = {}
+        page_aliases = {}
+        alias_rows = {}
+        for page_id, (title, infobox) in enumerate(pages.items(), 1):
+            page_ids[title] = page_id
+            page_aliases[page_id] = []
+            alias_rows.setdefault(normalize_title(title), page_id)
+            for key, value in infobox.items():
+                if key.strip().lower() in ALIAS_FIELDS:
+                    page_aliases[page_id].append(value)
+        # 别名优先级低于标题，不覆盖已有的标题映射
+        for page_id, names in page_aliases.items():
+            for name in names:
+                alias_rows.setdefault(normalize_title(name), page_id)
+        for redirect_title, target in redirects.items():
+            # 处理多级重定向
+            seen = set()
+            while target in redirects and target not in seen:
+                seen.add(target)
+                target = redirects[target]
+            page_id = page_ids.get(target)
+            if page_id is None:
+                continue
+            page_aliases[page_id].append(redirect_title)
+            alias_rows.setdefault(normalize_title(redirect_title), page_id)
+
+        conn.executemany(
+            "INSERT INTO pages (id, title, infobox) VALUES (?, ?, ?)",
+            ((page_ids[title], title, json.dumps(infobox, ensure_ascii=False)) for title, infobox in pages.items())
+        )
+        conn.executemany("INSERT INTO aliases (alias, page_id) VALUES (?, ?)", alias_rows.items())
+        conn.executemany(
+            "INSERT INTO pages_fts (rowid, title, aliases, infobox) VALUES (?, ?, ?, ?)",
+            ((page_ids[title], title, "\n".join(page_aliases[page_ids[title]]), "\n".join(infobox.values()))
+             for title, infobox in pages.items())
+        )
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("built_at", str(int(time.time()))),
+            ("sources", json.dumps([os.path.basename(p) for p in dump_paths], ensure_ascii=False))
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+    return {'pages': len(pages), 'redirects': len(redirects), 'aliases': len(alias_rows)}
+
+
+class WikiIndex:
+    """只读的本地搜索索引，索引文件被重新构建后自动重新打开"""
+
+    # trigram 分词器至少需要 3 个字符，更短的内容使用 LIKE 匹配
+    MIN_FTS_CHARS = 3
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"索引文件不存在: {db_path}")
+        self.db_path = db_path
+        self._conn = None
+        self._mtime = None
+        self._open()
+
+    def _open(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._mtime = os.stat(self.db_path).st_mtime
+        self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def reload_if_changed(self):
+        try:
+            mtime = os.stat(self.db_path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._open()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def lookup(self, query):
+        """标题、重定向或别名完全匹配时返回条目标题，否则返回 None"""
+        self.reload_if_changed()
+        row = self._conn.execute(
+            "SELECT pages.title FROM aliases JOIN pages ON pages.id = aliases.page_id WHERE aliases.alias = ?",
+            (normalize_title(query),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def search(self, query, limit=20):
+        """全文搜索，按相关度返回条目标题列表"""
+        self.reload_if_changed()
+        query = SPACE_PATTERN.sub(' ', query).strip()
+        if not query:
+            return []
+        if len(query) >= self.MIN_FTS_CHARS:
+            phrase = '"' + query.replace('"', '""') + '"'
+            rows = self._conn.execute(
+                "SELECT title FROM pages_fts WHERE pages_fts MATCH ? "
+                "ORDER BY bm25(pages_fts, 10.0, 5.0, 1.0) LIMIT ?",
+                (phrase, limit)
+            ).fetchall()
+        else:
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            rows = self._conn.execute(
+                "SELECT title FROM pages_fts WHERE title LIKE ? ESCAPE '\\' OR aliases LIKE ? ESCAPE '\\' "
+                "ORDER BY length(title) LIMIT ?",
+                (pattern, pattern, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def titles_with_infobox(self):
+        """返回所有带信息框的条目标题"""
+        return [row[0] for row in self._conn.execute("SELECT title FROM pages WHERE infobox != '{}'")]
+
+    def infobox(self, title):
+        """返回条目信息框字段（来自 wikitext），不存在时返回空字典"""
+        row = self._conn.execute("SELECT infobox FROM pages WHERE title = ?", (title,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+
+def page_url(base_url, title):
+    """根据条目标题构建与在线搜索一致的条目链接"""
+    return base_url + "/" + quote(title.replace(' ', '_'))
+
+
+async def download_dump(out_dir, base_url="https://zh.stardewvalleywiki.com", batch=50):
+    """
+    通过 api.php 分批导出主命名空间的全部条目（含重定向），每批保存为一个 XML 文件
+
+    返回写入的文件路径列表，可直接传给 build_index。
+    """
+    from http_client import get_session, close_http
+
+    os.makedirs(out_dir, exist_ok=True)
+    params = {
+        "action": "query",
+        "generator": "allpages",
+        "gapnamespace": "0",
+        "gaplimit": str(batch),
+        "export": "1",
+        "format": "json"
+    }
+    paths = []
+    try:
+        while True:
+            async with get_session().get(base_url + "/api.php", params=params) as resp:
+                data = await resp.json(content_type=None)
+            export = data.get("query", {}).get("export", {})
+            xml_text = export.get("*") if isinstance(export, dict) else export
+            if xml_text:
+                path = os.path.join(out_dir, f"export_{len(paths):04d}.xml")
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(xml_text)
+                paths.append(path)
+                print(f"已导出第 {len(paths)} 批 -> {path}")
+            cont = data.get("continue")
+            if not cont:
+                break
+            params.update(cont)
+    finally:
+        await close_http()
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 Wiki 搜索索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="从 XML 导出文件构建索引")
+    build_parser.add_argument("dumps", nargs="+", help="XML 导出文件或包含导出文件的目录")
+    build_parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    download_parser = sub.add_parser("download", help="从在线 Wiki 导出全部条目")
+    download_parser.add_argument("out_dir")
+    search_parser = sub.add_parser("search", help="在索引中搜索")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        paths = []
+        for item in args.dumps:
+            if os.path.isdir(item):
+                paths.extend(sorted(os.path.join(item, name) for name in os.listdir(item) if name.endswith(".xml")))
+            else:
+                paths.append(item)
+        started = time.perf_counter()
+        stats = build_index(paths, args.db)
+        print(f"索引构建完成 - 条目: {stats['pages']}, 重定向: {stats['redirects']}, 别名: {stats['aliases']}, "
+              f"耗时: {time.perf_counter() - started:.2f} 秒 -> {args.db}")
+    elif args.command == "download":
+        asyncio.run(download_dump(args.out_dir))
+    elif args.command == "search":
+        index = WikiIndex(args.db)
+        started = time.perf_counter()
+        direct = index.lookup(args.query)
+        titles = [direct] if direct else index.search(args.query)
+        elapsed = (time.perf_counter() - started) * 1000
+        for i, title in enumerate(titles, 1):
+            print(f"{i}.{title}")
+        print(f"{'直接匹配' if direct else '结果数量: ' + str(len(titles))}，耗时 {elapsed:.3f} ms")
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
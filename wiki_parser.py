@@ -0,0 +1,167 @@
+import re
+import lxml.html
+from lxml import etree
+
+# 预编译的正则，避免每一行重复编译
+HIDDEN_STYLE_PATTERN = re.compile(r"display\s*:\s*none", re.IGNORECASE)
+DATA_SORT_PATTERN = re.compile(r'data-sort-value=(?:\"|&quot;).*?(?:\"|&quot;)')
+SPACE_PATTERN = re.compile(r'\s+')
+
+# 不计入文本的标签
+SKIP_TEXT_TAGS = frozenset(("script", "style"))
+
+
+def _is_hidden(element):
+    style = element.get("style")
+    return style is not None and HIDDEN_STYLE_PATTERN.search(style) is not None
+
+
+def _collect_text(element, parts, drop_hidden):
+    """
+    按文档顺序收集元素内的文本片段到 parts
+
+    drop_hidden 为 True 时跳过 display:none 的元素（保留其后的 tail 文本），图片记为一个空格，
+    相当于原先 "复制节点 -> 删除隐藏标签 -> 图片替换为空格 -> get_text" 的结果，但不复制也不重新解析。
+    """
+    if element.text and element.tag not in SKIP_TEXT_TAGS:
+        parts.append(element.text)
+    for child in element:
+        tag = child.tag
+        if not isinstance(tag, str):
+            # 注释和处理指令只保留 tail
+            pass
+        elif drop_hidden and tag == "img":
+            parts.append(" ")
+        elif not (drop_hidden and _is_hidden(child)):
+            _collect_text(child, parts, drop_hidden)
+        if child.tail:
+            parts.append(child.tail)
+
+
+def _text(element, drop_hidden=False):
+    """等价于 get_text(separator=" ") 后合并连续空白"""
+    parts = []
+    _collect_text(element, parts, drop_hidden)
+    return SPACE_PATTERN.sub(' ', " ".join(parts)).strip()
+
+
+def _stripped_text(element):
+    """等价于 get_text(strip=True)：每个文本片段去除首尾空白后直接拼接"""
+    parts = []
+    _collect_text(element, parts, False)
+    return "".join(part.strip() for part in parts)
+
+
+def _description_text(content):
+    """meta description 中可能包含 HTML 片段，去掉隐藏内容后取纯文本"""
+    content = DATA_SORT_PATTERN.sub('', content)
+    if '<' not in content and '&' not in content:
+        return SPACE_PATTERN.sub(' ', content).strip()
+    try:
+        fragment = lxml.html.fragment_fromstring(content, create_parent="div")
+    except (etree.ParserError, ValueError):
+        return SPACE_PATTERN.sub(' ', content).strip()
+    return _text(fragment, drop_hidden=True)
+
+
+def extract_infobox(html_content):
+    """
+    从条目 HTML 中提取信息框
+
+    只遍历一次文档树，找到 description 和 #infoboxborder 后在原树上提取文本。
+    返回 {'title': str, 'description': str, 'rows': [[栏目, 内容], ...], 'has_infobox': bool, 'image': 主图地址}
+    """
+    if not html_content or not html_content.strip():
+        return _extract_infobox_from_document(None)
+    return _extract_infobox_from_document(lxml.html.document_fromstring(html_content))
+
+
+def _extract_infobox_from_document(document):
+    description_text = ""
+    infobox = None
+    description_found = False
+    if document is not None:
+        for element in document.iter():
+            if not isinstance(element.tag, str):
+                continue
+            if not description_found and element.tag == "meta" and element.get("name") == "description":
+                description_found = True
+                description_text = _description_text(element.get("content", ""))
+            elif infobox is None and element.get("id") == "infoboxborder":
+                infobox = element
+            if description_found and infobox is not None:
+                break
+
+    # 如果找不到 infobox，只保留 description_text
+    if infobox is None:
+        return {'title': "", 'description': description_text, 'rows': [], 'has_infobox': False, 'image': ""}
+
+    infobox_title = None
+    infobox_data = {}
+    image = None
+    rows_started = False
+    for element in infobox.iter():
+        if not isinstance(element.tag, str):
+            continue
+        if infobox_title is None and element.get("id") == "infoboxheader":
+            infobox_title = _stripped_text(element)
+        # 栏目行之前的第一张图片是条目主图
+        if image is None and not rows_started and element.tag == "img":
+            image = element.get("src")
+        if element.tag == "tr":
+            section = detail = None
+            for cell in element.iter():
+                if not isinstance(cell.tag, str):
+                    continue
+                cell_id = cell.get("id")
+                if section is None and cell_id == "infoboxsection":
+                    section = cell
+                elif detail is None and cell_id == "infoboxdetail":
+                    detail = cell
+                if section is not None and detail is not None:
+                    break
+            if section is None or detail is None:
+                continue
+            rows_started = True
+            section_text = _stripped_text(section)
+            # 跳过隐藏标签，图片记为空格避免数字连在一起
+            detail_text = "" if _is_hidden(detail) else _text(detail, drop_hidden=True)
+            if section_text and detail_text:
+                infobox_data[section_text] = detail_text
+
+    return {
+        'title': infobox_title or "",
+        'description': description_text,
+        'rows': [[k, v] for k, v in infobox_data.items()],
+        'has_infobox': True,
+        'image': image or ""
+    }
+
+
+def parse_search_page(html_content):
+    """
+    解析搜索结果页面
+
+    返回 {'results': [{'title': str, 'href': str}, ...], 'heading': str | None, 'infobox': dict | None}，
+    heading 是页面的 #firstHeading 标题，用于判断搜索是否直接跳转到了条目；
+    没有搜索结果时页面可能就是条目本身，顺便在同一棵树上提取信息框，省去再次下载和解析。
+    """
+    results = []
+    heading = None
+    if not html_content or not html_content.strip():
+        return {'results': results, 'heading': heading, 'infobox': None}
+    document = lxml.html.document_fromstring(html_content)
+    for element in document.iter():
+        if not isinstance(element.tag, str):
+            continue
+        if heading is None and element.get("id") == "firstHeading":
+            heading = _stripped_text(element)
+        if "mw-search-result-heading" in (element.get("class") or "").split():
+            link_tag = next(element.iter("a"), None)
+            if link_tag is None or not link_tag.get("href"):
+                continue
+            results.append({'title': _stripped_text(link_tag), 'href': link_tag.get("href")})
+    infobox = None
+    if not results and heading is not None:
+        infobox = _extract_infobox_from_document(document)
+    return {'results': results, 'heading': heading, 'infobox': infobox}